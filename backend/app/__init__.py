@@ -2,51 +2,140 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
-import cloudinary
-from authlib.integrations.flask_client import OAuth
 from flask_mail import Mail
 
 import os
 from app.config import *
+from app import pool
+from app import routing
+from app.profiler import query_profiler
 
 
-app = Flask(__name__)
-app.config.from_object(FlaskConfig)
-app.config.from_object(VNPayConfig)
-app.config["PAGE_SIZE"] = 20
+db = SQLAlchemy(session_options={"class_": routing.RoutingSession})
+bcrypt = Bcrypt()
+mail = Mail()
 
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-mail = Mail(app)
-
-login_manager = LoginManager(app)
+login_manager = LoginManager()
 login_manager.login_view = "auth.login"
 login_manager.login_message_category = "info"
 
-cloudinary.config(
-    cloud_name=CloudinaryConfig.CLOUD_NAME,
-    api_key=CloudinaryConfig.API_KEY,
-    api_secret=CloudinaryConfig.API_SECRET,
-    secure=CloudinaryConfig.SECURE,
-)
+# Settings read once by the init_app() of the database and the extensions
+INIT_CONFIG_PREFIXES = ("SQLALCHEMY_", "DB_POOL_", "SQL_PROFILER_", "BCRYPT_")
+INIT_CONFIG_KEYS = {
+    "MAIL_SERVER",
+    "MAIL_PORT",
+    "MAIL_USE_TLS",
+    "MAIL_USE_SSL",
+    "MAIL_USERNAME",
+    "MAIL_PASSWORD",
+    "MAIL_DEFAULT_SENDER",
+    "MAIL_MAX_EMAILS",
+    "MAIL_SUPPRESS_SEND",
+    "MAIL_ASCII_ATTACHMENTS",
+    "MAIL_DEBUG",
+}
+
+
+def get_app(config=None):
+    """
+    Get the Flask app of the process, created on first call with its config and
+    extensions but without the blueprints.\n
+    - config: object or dict overriding FlaskConfig. Once the app is created, changing
+      the database or extension settings raises RuntimeError instead of being ignored.\n
+    The blueprints do `from app import app`, which calls get_app() on first access.
+    """
+    global app
+    if "app" not in globals():
+        app = Flask(__name__)
+        app.config.from_object(FlaskConfig)
+        app.config.from_object(VNPayConfig)
+        app.config["PAGE_SIZE"] = 20
+        apply_config(app, config)
+        if "SQLALCHEMY_ENGINE_OPTIONS" not in app.config:
+            app.config["SQLALCHEMY_ENGINE_OPTIONS"] = pool.engine_options(app.config)
+
+        db.init_app(app)
+        bcrypt.init_app(app)
+        mail.init_app(app)
+        login_manager.init_app(app)
+        if app.config["SQL_PROFILER_ENABLED"]:
+            query_profiler.init_app(app)
+
+        os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+    else:
+        check_config(app, config)
+        apply_config(app, config)
+    return app
+
+
+def apply_config(app, config):
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+
+
+def check_config(app, config, keys=()):
+    """
+    Raise RuntimeError if the config changes a setting the initialized app has already
+    read, e.g. a database URI passed after a module did `from app import app`
+    """
+    if config is None:
+        return
+    if not isinstance(config, dict):
+        config = {key: getattr(config, key) for key in dir(config) if key.isupper()}
+    changed = [
+        key
+        for key, value in config.items()
+        if key.startswith(INIT_CONFIG_PREFIXES) or key in INIT_CONFIG_KEYS or key in keys
+        if app.config.get(key) != value
+    ]
+    if changed:
+        raise RuntimeError(
+            f"The app is already initialized, can't change {', '.join(sorted(changed))}. "
+            "Pass them to the first get_app()/create_app() call."
+        )
+
+
+def create_app(config=None):
+    """
+    Get the app of the process and register the blueprints on the first call.\n
+    e.g. create_app({"ADMIN_ENABLED": False}) for the CLI tools and seeders that don't
+    serve the admin pages.
+    """
+    if "app" in globals() and "main" in get_app().blueprints:
+        # The admin views are only bound on the first call
+        check_config(get_app(), config, keys=("ADMIN_ENABLED",))
+        return get_app(config)
+    app = get_app(config)
+
+    from app.blueprints.main import main_bp
+    from app.blueprints.auth import auth_bp
+    from app.blueprints.flights import flights_bp
+    from app.blueprints.bookings import bookings_bp
+    from app.blueprints.errors import errors
+    from app.blueprints.mails import mails_bp
 
-os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+    # from app.blueprints.payment import payment_bp
 
-from app.blueprints import admin
+    app.register_blueprint(main_bp)
+    app.register_blueprint(bookings_bp)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(errors)
+    app.register_blueprint(flights_bp)
+    app.register_blueprint(mails_bp)
+    # app.register_blueprint(payment_bp)
 
+    # The admin view tree is the heaviest import, only load it when it is served
+    if app.config["ADMIN_ENABLED"]:
+        from app.blueprints.admin.views import admin
 
-from app.blueprints.main import main_bp
-from app.blueprints.auth import auth_bp
-from app.blueprints.flights import flights_bp
-from app.blueprints.bookings import bookings_bp
-from app.blueprints.errors import errors
+        admin.init_app(app)
 
-# from app.blueprints.payment import payment_bp
+    return app
 
 
-app.register_blueprint(main_bp)
-app.register_blueprint(bookings_bp)
-app.register_blueprint(auth_bp)
-app.register_blueprint(errors)
-app.register_blueprint(flights_bp)
-# app.register_blueprint(payment_bp)
+def __getattr__(name):
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,202 @@
+import csv
+import io
+from datetime import datetime as dt
+from enum import Enum
+from functools import cache
+
+from app import app
+from app.blueprints.bookings import dao as booking_dao
+from app.blueprints.flights import dao as flight_dao
+
+
+class Export:
+    """
+    A table the admins can download, rows(args) streams its rows from the request args
+    and columns are the (name, type) of the row values
+    """
+
+    def __init__(self, name, columns, rows):
+        self.name = name
+        self.columns = columns
+        self.rows = rows
+
+
+def parse_date(args, name):
+    """
+    Raise ValueError if the arg isn't a YYYY-MM-DD date
+    """
+    value = args.get(name)
+    return dt.strptime(value, "%Y-%m-%d") if value else None
+
+
+def parse_int(args, name):
+    value = args.get(name)
+    return int(value) if value else None
+
+
+EXPORTS = {
+    export.name: export
+    for export in [
+        Export(
+            "payments",
+            [
+                ("id", "int"),
+                ("reservation_id", "int"),
+                ("flight_id", "int"),
+                ("flight_seat_id", "int"),
+                ("amount", "float"),
+                ("status", "str"),
+                ("created_at", "datetime"),
+            ],
+            lambda args: booking_dao.stream_payments(
+                parse_date(args, "start"),
+                parse_date(args, "end"),
+                app.config["EXPORT_BATCH_SIZE"],
+            ),
+        ),
+        Export(
+            "reservations",
+            [
+                ("id", "int"),
+                ("owner_id", "int"),
+                ("author_id", "int"),
+                ("flight_id", "int"),
+                ("flight_seat_id", "int"),
+                ("seat_class_id", "int"),
+                ("price", "float"),
+                ("currency", "str"),
+                ("is_paid", "bool"),
+                ("is_deleted", "bool"),
+                ("created_at", "datetime"),
+                ("hold_expires_at", "datetime"),
+            ],
+            lambda args: booking_dao.stream_reservations(
+                parse_date(args, "start"),
+                parse_date(args, "end"),
+                app.config["EXPORT_BATCH_SIZE"],
+            ),
+        ),
+        Export(
+            "revenue",
+            [
+                ("year", "int"),
+                ("month", "int"),
+                ("day", "int"),
+                ("route_id", "int"),
+                ("depart_airport", "str"),
+                ("arrive_airport", "str"),
+                ("revenue", "float"),
+                ("payment_count", "int"),
+                ("flight_count", "int"),
+            ],
+            lambda args: flight_dao.stream_revenue_by_route(
+                parse_int(args, "year"),
+                parse_int(args, "month"),
+                app.config["EXPORT_BATCH_SIZE"],
+            ),
+        ),
+    ]
+}
+
+
+@cache
+def get_pyarrow():
+    """
+    pyarrow is optional, the Parquet exports are only offered when it is installed
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def get_formats():
+    return ["csv", "parquet"] if get_pyarrow() else ["csv"]
+
+
+def to_value(value):
+    return str(value) if isinstance(value, Enum) else value
+
+
+def batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append([to_value(value) for value in row])
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_csv(export, rows):
+    """
+    Yield the CSV text a batch of rows at a time, starting with the header
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in export.columns])
+    yield buffer.getvalue()
+    for batch in batches(rows, app.config["EXPORT_BATCH_SIZE"]):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+
+class ChunkSink(io.RawIOBase):
+    """
+    Write-only file that keeps what was written until it is drained, it counts the
+    position itself since the Parquet footer refers to offsets in the whole file
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_parquet(export, rows):
+    """
+    Yield a Parquet file with a row group per batch of rows
+    """
+    pa = get_pyarrow()
+    types = {
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "str": pa.string(),
+        "bool": pa.bool_(),
+        "datetime": pa.timestamp("us"),
+    }
+    schema = pa.schema([(name, types[kind]) for name, kind in export.columns])
+    sink = ChunkSink()
+    with pa.parquet.ParquetWriter(sink, schema) as writer:
+        for batch in batches(rows, app.config["EXPORT_BATCH_SIZE"]):
+            columns = list(zip(*batch))
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+WRITERS = {
+    "csv": (stream_csv, "text/csv"),
+    "parquet": (stream_parquet, "application/vnd.apache.parquet"),
+}
@@ -1,17 +1,23 @@
 from flask import redirect, flash, render_template, url_for, request
+from flask import Response, abort, stream_with_context
 from flask_admin.contrib.sqla import ModelView
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload
 from flask_login import current_user
 from flask_admin import AdminIndexView, BaseView, Admin, expose
 from datetime import datetime as dt
 
 from app import app, db, bcrypt
+from app.keyset import KeysetPagination, approximate_count
 from app.blueprints.auth.models import User
 from app.blueprints.auth.models import UserRole
 from app.blueprints.auth import dao as auth_dao
 from app.blueprints.auth.routes import logout_process
 from app.blueprints.flights.models import *
 from app.blueprints.flights import dao as flight_dao
-from app.blueprints.bookings.models import Payment, Reservation
+from app.blueprints.bookings.models import Payment, Refund, Reservation
+from app.blueprints.bookings import dao as booking_dao
+from . import exports
 
 
 class AuthenticatedView(BaseView):
@@ -30,7 +36,27 @@ class DashboardAdmin(AdminIndexView, AdminView):
         return self.render("admin/dashboard.html", current_user=current_user)
 
 
-class CountryAdmin(ModelView, AdminView):
+class ReferenceDataAdmin(ModelView, AdminView):
+    """
+    Admin of a table of the flight forms selects and the /api reference endpoints: its
+    writes drop the cached choices and the cached responses of api_endpoints
+    """
+
+    api_endpoints = ()
+
+    def after_model_change(self, form, model, is_created):
+        self.invalidate_caches()
+
+    def after_model_delete(self, model):
+        self.invalidate_caches()
+
+    def invalidate_caches(self):
+        flight_dao.reference_data_cache.invalidate()
+        flight_dao.api_response_cache.invalidate(*self.api_endpoints)
+
+
+class CountryAdmin(ReferenceDataAdmin):
+    api_endpoints = ("countries", "airports", "routes")
     column_list = ("id", "name", "code")
     form_excluded_columns = ["airports"]
     column_searchable_list = ["name", "code"]
@@ -126,6 +152,14 @@ class RouteAdmin(ModelView, AdminView):
             return False
         return super().update_model(form, model)
 
+    def after_model_change(self, form, model, is_created):
+        flight_dao.timetable.invalidate()
+        flight_dao.api_response_cache.invalidate("routes")
+
+    def after_model_delete(self, model):
+        flight_dao.timetable.invalidate()
+        flight_dao.api_response_cache.invalidate("routes")
+
 
 class FlightAdmin(ModelView, AdminView):
     column_list = (
@@ -151,7 +185,7 @@ class FlightAdmin(ModelView, AdminView):
         "route.arrive_airport.name",
     ]
 
-    form_excluded_columns = ["flight_seats"]
+    form_excluded_columns = ["flight_seats", "seat_counts"]
 
     # def update_model(self, form, model):
     #     new_arrive_time = form.arrive_time.data
@@ -164,6 +198,16 @@ class FlightAdmin(ModelView, AdminView):
     def create_view(self):
         return redirect(url_for("flights.flight_scheduling"))
 
+    def after_model_change(self, form, model, is_created):
+        flight_dao.flight_search_index.invalidate()
+        flight_dao.timetable.invalidate()
+        flight_dao.fare_calendar_cache.invalidate()
+
+    def after_model_delete(self, model):
+        flight_dao.flight_search_index.invalidate()
+        flight_dao.timetable.invalidate()
+        flight_dao.fare_calendar_cache.invalidate()
+
 
 class StopoverAdmin(ModelView, AdminView):
     column_list = (
@@ -178,7 +222,8 @@ class StopoverAdmin(ModelView, AdminView):
     column_sortable_list = ["airport.name", "flight_id", "arrival_time"]
 
 
-class AirportAdmin(ModelView, AdminView):
+class AirportAdmin(ReferenceDataAdmin):
+    api_endpoints = ("airports", "routes")
     column_list = ("id", "name", "code", "country")
     form_excluded_columns = ["stopovers", "depart_routes", "arrive_routes"]
     column_searchable_list = ["code", "name", "country.name"]
@@ -206,7 +251,8 @@ class AirportAdmin(ModelView, AdminView):
         return super().update_model(form, model)
 
 
-class AircraftAdmin(ModelView, AdminView):
+class AircraftAdmin(ReferenceDataAdmin):
+    api_endpoints = ("aircrafts",)
     # Hiển thị thêm airline.name
     column_list = ("id", "name", "airline.name")
     form_excluded_columns = ["flights"]
@@ -241,12 +287,14 @@ class AircraftAdmin(ModelView, AdminView):
                 flash(f"Error: {e}", "danger")
                 return self.render("admin/createAirCraft.html")
 
+            self.invalidate_caches()
             flash("Create aircraft successfully!", "success")
             return redirect(url_for("aircraft.index_view"))
         return self.render("admin/createAirCraft.html")
 
 
-class AirlineAdmin(ModelView, AdminView):
+class AirlineAdmin(ReferenceDataAdmin):
+    api_endpoints = ("airlines", "aircrafts")
     column_list = ("id", "name")
     column_searchable_list = ["id", "name"]
     form_excluded_columns = ["aircrafts"]
@@ -255,6 +303,12 @@ class AirlineAdmin(ModelView, AdminView):
 class SeatClassAdmin(ModelView, AdminView):
     form_excluded_columns = ["seats"]
 
+    def after_model_change(self, form, model, is_created):
+        flight_dao.api_response_cache.invalidate("seatclasses")
+
+    def after_model_delete(self, model):
+        flight_dao.api_response_cache.invalidate("seatclasses")
+
 
 class AircraftSeatAdmin(ModelView, AdminView):
     column_list = ("id", "aircraft", "seat_class", "seat_name")
@@ -262,21 +316,111 @@ class AircraftSeatAdmin(ModelView, AdminView):
 
 
 class FlightSeatAdmin(ModelView, AdminView):
-    column_list = ("flight.id", "aircraft_seat", "price", "currency")
+    column_list = ("flight.id", "aircraft_seat", "price", "currency", "status")
     column_searchable_list = ["id", "flight.id"]
+    # Maintained by the bookings, see `flask bookings repair-seat-status`
+    form_excluded_columns = [
+        "reservations",
+        "status",
+        "held_until",
+        "sold_reservation_id",
+    ]
+
+    def on_model_change(self, form, model, is_created):
+        # The seat counts of the flights the seat moved from and to
+        flights = inspect(model).attrs.flight.history.sum()
+        flight_ids = {model.flight_id} | {flight.id for flight in flights if flight}
+        flight_dao.refresh_seat_counts(flight_ids - {None})
+
+    def after_model_change(self, form, model, is_created):
+        flight_dao.fare_calendar_cache.invalidate()
+
+    def after_model_delete(self, model):
+        flight_dao.refresh_seat_counts([model.flight_id])
+        db.session.commit()
+        flight_dao.fare_calendar_cache.invalidate()
 
 
 class RegulationView(ModelView, AdminView):
-    form_excluded_columns = ["key"]
+    form_excluded_columns = ["key", "version"]
     can_create = False
     can_delete = False
 
+    def on_model_change(self, form, model, is_created):
+        model.version = flight_dao.get_regulations_version() + 1
+
+    def after_model_change(self, form, model, is_created):
+        flight_dao.regulation_cache.invalidate()
+
+
+class KeysetModelView(ModelView, AdminView):
+    """
+    List of a large table, newest first: the default list is paged with (created_at, id)
+    cursors instead of an OFFSET and shows the approximate number of rows from the
+    database statistics instead of a COUNT. Searching, filtering or sorting on a column
+    falls back to the numbered pages.
+    """
+
+    list_template = "admin/keyset_list.html"
+    column_default_sort = [("created_at", True), ("id", True)]
+    approximate_count = True
+
+    def get_list(
+        self,
+        page,
+        sort_column,
+        sort_desc,
+        search,
+        filters,
+        execute=True,
+        page_size=None,
+    ):
+        if sort_column is not None or search or filters or not execute:
+            return super().get_list(
+                page, sort_column, sort_desc, search, filters, execute, page_size
+            )
+        query = self.get_query()
+        for join in self._auto_joins:
+            query = query.options(joinedload(join))
+        try:
+            pagination = KeysetPagination(
+                query,
+                (self.model.created_at, self.model.id),
+                page_size or self.page_size,
+                request.args.get("after"),
+                request.args.get("before"),
+                descending=True,
+            )
+        except ValueError:
+            abort(400)
+        self._template_args["keyset"] = pagination
+        if self.approximate_count:
+            count = approximate_count(self.session, self.model.__table__)
+        else:
+            count = self.get_count_query().scalar()
+        return count, pagination.items
+
 
-class ReservationView(ModelView, AdminView):
+class ReservationView(KeysetModelView):
     column_list = ("id", "owner", "author", "flight_seat", "payment")
 
+    def on_model_change(self, form, model, is_created):
+        # The seats the reservation moved from and to, in the transaction of the admin
+        seats = inspect(model).attrs.flight_seat.history.sum()
+        booking_dao.refresh_seat_status(
+            [model.flight_seat_id, *(seat.id for seat in seats if seat)]
+        )
+
+    def after_model_change(self, form, model, is_created):
+        flight_dao.fare_calendar_cache.invalidate()
+
+    def after_model_delete(self, model):
+        booking_dao.refresh_seat_status([model.flight_seat_id])
+        db.session.commit()
+        flight_dao.fare_calendar_cache.invalidate()
 
-class PaymentView(ModelView, AdminView):
+
+class PaymentView(KeysetModelView):
     column_list = (
         "id",
         "reservation_id",
@@ -285,6 +429,60 @@ class PaymentView(ModelView, AdminView):
         "created_at",
     )
 
+    def affected(self, model):
+        """
+        Seats and revenue rollup months (route_id, year, month) of the reservations the
+        payment belongs or belonged to. The history is read before a query autoflushes
+        the change
+        """
+        state = inspect(model).attrs
+        reservations = state.reservation.history.sum()
+        paid_at = state.created_at.history.sum()
+        if model.reservation_id:
+            reservations.append(booking_dao.get_reservation_by_id(model.reservation_id))
+        reservations = [reservation for reservation in reservations if reservation]
+        paid_at = [day for day in paid_at + [model.created_at] if day]
+        seat_ids = [reservation.flight_seat_id for reservation in reservations]
+        route_months = [
+            (reservation.flight_seat.flight.route_id, day.year, day.month)
+            for reservation in reservations
+            for day in paid_at
+        ]
+        return seat_ids, route_months
+
+    def on_model_change(self, form, model, is_created):
+        seat_ids, route_months = self.affected(model)
+        booking_dao.refresh_seat_status(seat_ids)
+        booking_dao.refresh_revenue_rollup(route_months)
+
+    def after_model_change(self, form, model, is_created):
+        flight_dao.fare_calendar_cache.invalidate()
+
+    def after_model_delete(self, model):
+        seat_ids, route_months = self.affected(model)
+        booking_dao.refresh_seat_status(seat_ids)
+        booking_dao.refresh_revenue_rollup(route_months)
+        db.session.commit()
+        flight_dao.fare_calendar_cache.invalidate()
+
+
+class RefundView(ModelView, AdminView):
+    """
+    Payments to give back, the staff sets refunded_at once it is done
+    """
+
+    column_list = (
+        "id",
+        "reservation_id",
+        "amount",
+        "reason",
+        "created_at",
+        "refunded_at",
+    )
+    column_default_sort = ("created_at", True)
+    can_create = False
+    form_columns = ["refunded_at"]
+
 
 class LogoutView(AuthenticatedView):
     @expose("/")
@@ -304,21 +502,54 @@ class StatsView(AdminView):
         year = request.args.get("year")
         month = request.args.get("month")
         if year and month:
+            year, month = int(year), int(month)
             flight_stats = flight_dao.revenue_stats_route_by_time(year, month)
-            sum = dao.revenue_sum(flight_stats)
+            sum = flight_dao.revenue_sum(year, month)
             return self.render(
                 "admin/stats.html",
                 stats=flight_stats,
-                year=int(year),
-                month=int(month),
+                year=year,
+                month=month,
                 sum=sum,
             )
 
         return self.render("admin/stats.html", year=dt.now().year, month=dt.now().month)
 
 
+class ExportView(AdminView):
+    @expose("/", methods=["GET"])
+    def index(self):
+        return self.render(
+            "admin/exports.html",
+            exports=exports.EXPORTS,
+            formats=exports.get_formats(),
+        )
+
+    @expose("/<export_name>.<format>", methods=["GET"])
+    def download(self, export_name, format):
+        """
+        Stream the export from a server-side cursor, the memory doesn't grow with the
+        number of rows and the first bytes are sent before the query is done
+        """
+        export = exports.EXPORTS.get(export_name)
+        if export is None or format not in exports.get_formats():
+            abort(404)
+        try:
+            rows = export.rows(request.args)
+        except ValueError:
+            abort(400)
+        write, mimetype = exports.WRITERS[format]
+        return Response(
+            stream_with_context(write(export, rows)),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename={export_name}.{format}"
+            },
+        )
+
+
+# Bound to the app by create_app()
 admin = Admin(
-    app,
     template_mode="bootstrap4",
     index_view=DashboardAdmin(name="Dashboard"),
 )
@@ -336,7 +567,9 @@ admin.add_view(StopoverAdmin(Stopover, db.session, name="Stopovers"))
 admin.add_view(FlightSeatAdmin(FlightSeat, db.session, name="FlightSeats"))
 admin.add_view(ReservationView(Reservation, db.session, name="Reservations"))
 admin.add_view(PaymentView(Payment, db.session, name="Payments"))
+admin.add_view(RefundView(Refund, db.session, name="Refunds"))
 admin.add_view(RegulationView(Regulation, db.session, name="Regulations"))
 admin.add_view(StatsView(name="Statistic"))
+admin.add_view(ExportView(name="Exports"))
 admin.add_view(HomeView(name="Home", menu_class_name="bg-success"))
 admin.add_view(LogoutView(name="Logout", menu_class_name="bg-danger"))
@@ -1,18 +1,25 @@
+from functools import cache
 from flask import Blueprint
-from google_auth_oauthlib.flow import Flow
 
 from app.config import GoogleAuthConfig
 
-from app import GoogleAuthConfig
-from google_auth_oauthlib.flow import Flow
-
 # Create the main blueprint
 auth_bp = Blueprint("auth", __name__)
 
-google_auth = Flow.from_client_config(
-    GoogleAuthConfig.CLIENT_CONFIG,
-    scopes=GoogleAuthConfig.SCOPES,
-    redirect_uri=GoogleAuthConfig.REDIRECT_URI,
-)
+
+@cache
+def get_google_auth():
+    """
+    Build the Google OAuth flow on first use, it reads client_secret.json
+    """
+    from google_auth_oauthlib.flow import Flow
+
+    return Flow.from_client_config(
+        GoogleAuthConfig.client_config(),
+        scopes=GoogleAuthConfig.SCOPES,
+        redirect_uri=GoogleAuthConfig.redirect_uri(),
+    )
+
+
 # Import routes to register them with the blueprint
 from . import routes
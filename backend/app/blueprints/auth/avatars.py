@@ -0,0 +1,125 @@
+import json
+import time
+from functools import cache
+from pathlib import Path
+from threading import Thread, Lock
+
+from app import app
+from app.config import CloudinaryConfig
+
+# Shipped with the app, used until the Cloudinary catalog could be fetched once
+BUNDLED_AVATARS = ["/static/images/avatars/default.svg"]
+
+
+class AvatarCatalog:
+    """
+    Urls of the default avatars stored in the Cloudinary DEFAULT_AVATARS_PATH folder.\n
+    - Nothing is fetched at import, the catalog is loaded on first use from the disk cache
+      (AVATAR_CATALOG_CACHE_PATH) or from Cloudinary if there is no cache yet.\n
+    - After AVATAR_CATALOG_TTL seconds the catalog is refreshed by a background thread
+      while the current urls are still served.\n
+    - If Cloudinary can't be reached, the last urls (or BUNDLED_AVATARS) are kept.
+    """
+
+    def __init__(self):
+        self._urls = None
+        self._fetched_at = 0
+        self._refreshing = False
+        self._lock = Lock()
+
+    def get(self):
+        if self._urls is None:
+            with self._lock:
+                if self._urls is None:
+                    self._load()
+        elif self._is_expired():
+            self._refresh_in_background()
+        return self._urls
+
+    def is_default(self, url):
+        return url in BUNDLED_AVATARS or url in self.get()
+
+    def refresh(self):
+        urls = fetch_cloudinary_default_imgs()
+        with self._lock:
+            if urls:
+                self._urls = urls
+                self._write_cache(urls)
+            elif self._urls is None:
+                self._urls = BUNDLED_AVATARS
+            # Also wait a TTL before retrying a failed fetch
+            self._fetched_at = time.time()
+            self._refreshing = False
+
+    def _load(self):
+        cache = self._read_cache()
+        if cache:
+            self._urls = cache["urls"]
+            self._fetched_at = cache["fetched_at"]
+        else:
+            urls = fetch_cloudinary_default_imgs()
+            self._urls = urls or BUNDLED_AVATARS
+            self._fetched_at = time.time()
+            if urls:
+                self._write_cache(urls)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        Thread(target=self.refresh, name="avatar-catalog-refresh", daemon=True).start()
+
+    def _is_expired(self):
+        return time.time() - self._fetched_at >= app.config["AVATAR_CATALOG_TTL"]
+
+    def _cache_path(self):
+        return Path(app.config["AVATAR_CATALOG_CACHE_PATH"])
+
+    def _read_cache(self):
+        try:
+            cache = json.loads(self._cache_path().read_text())
+            return cache if cache.get("urls") else None
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, urls):
+        try:
+            path = self._cache_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({"fetched_at": time.time(), "urls": urls}))
+        except OSError as e:
+            print(f"Couldn't write the avatar catalog cache: {e}")
+
+
+@cache
+def get_cloudinary():
+    """
+    Import and configure the Cloudinary SDK on first use
+    """
+    import cloudinary
+    import cloudinary.api
+    import cloudinary.uploader
+
+    cloudinary.config(
+        cloud_name=CloudinaryConfig.CLOUD_NAME,
+        api_key=CloudinaryConfig.API_KEY,
+        api_secret=CloudinaryConfig.API_SECRET,
+        secure=CloudinaryConfig.SECURE,
+    )
+    return cloudinary
+
+
+def fetch_cloudinary_default_imgs():
+    try:
+        print("Fetching default images from cloudinary...")
+        resources = get_cloudinary().api.resources_by_asset_folder(
+            CloudinaryConfig.DEFAULT_AVATARS_PATH, fields=["secure_url"]
+        )
+        return [resource["secure_url"] for resource in resources["resources"]]
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return []
+
+
+avatar_catalog = AvatarCatalog()
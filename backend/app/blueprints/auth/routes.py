@@ -10,7 +10,7 @@ from .forms import (
     ResetPasswordForm,
     ChangePasswordForm,
 )
-from . import auth_bp, google_auth, dao, utils, decorators
+from . import auth_bp, get_google_auth, dao, utils, decorators
 
 
 @auth_bp.route("/login", methods=["GET", "POST"])
@@ -112,7 +112,7 @@ def update_account():
 @auth_bp.route("/login/google")
 @decorators.anonymous_user
 def google_login():
-    authorization_url, state = google_auth.authorization_url()
+    authorization_url, state = get_google_auth().authorization_url()
     session["state"] = state
     return redirect(authorization_url)
 
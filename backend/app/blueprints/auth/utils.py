@@ -1,52 +1,31 @@
-from flask_mail import Message
 from flask import render_template
 import random as rd
-import cloudinary.uploader
-import cloudinary.api
-import requests
 from flask import request
-from pip._vendor import cachecontrol
-from google.oauth2 import id_token
-import google.auth.transport.requests
 from pathlib import Path
 
 
 from app.config import CloudinaryConfig
-from app import mail, bcrypt
-from . import google_auth
+from app import bcrypt
+from app.blueprints.mails import outbox
+from . import get_google_auth
+from .avatars import avatar_catalog, get_cloudinary
 
 
-def get_cloudinary_default_imgs():
-    try:
-        print("Fetching default images from cloudinary...")
-        resources = cloudinary.api.resources_by_asset_folder(
-            CloudinaryConfig.DEFAULT_AVATARS_PATH, fields=["secure_url"]
-        )
-        return [resource["secure_url"] for resource in resources["resources"]]
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return []
-
-
-DEFAULT_PROFILE_PICTURES = get_cloudinary_default_imgs()
-PROFILE_PICTURES_PATH = str(Path(CloudinaryConfig.DEFAULT_AVATARS_PATH).parent).replace(
-    "\\", "/"
-)
+def get_profile_pictures_path():
+    return str(Path(CloudinaryConfig.DEFAULT_AVATARS_PATH).parent).replace("\\", "/")
 
 
 def randomize_profile_img():
-    return rd.choice(DEFAULT_PROFILE_PICTURES)
+    return rd.choice(avatar_catalog.get())
 
 
 def send_reset_email(user):
     token = user.get_reset_token()
-    message = Message(
+    outbox.send_mail(
         subject="Password Reset Request",
-        sender="noreply@6789lacachbonanhsong.com",
         recipients=[user.email],
         html=render_template("auth/reset_email.html", user=user, token=token),
     )
-    mail.send(message)
 
 
 def replace_user_avatar(user, avatar):
@@ -54,12 +33,12 @@ def replace_user_avatar(user, avatar):
     - If the avatar is one of the default images, upload the image to cloudinary\n
     - Else replace it
     """
-    if user.avatar not in DEFAULT_PROFILE_PICTURES:
-        cloudinary.uploader.destroy(user.avatar)
-    res = cloudinary.uploader.upload(
+    if not avatar_catalog.is_default(user.avatar):
+        get_cloudinary().uploader.destroy(user.avatar)
+    res = get_cloudinary().uploader.upload(
         avatar,
         use_asset_folder_as_public_id_prefix=True,
-        folder=PROFILE_PICTURES_PATH,
+        folder=get_profile_pictures_path(),
         public_id=user.email,
     )
     return res["secure_url"]
@@ -82,6 +61,13 @@ def get_user_oauth():
         dict: A dictionary containing the user information obtained from the verified OAuth2 token.
     """
 
+    # The Google client libraries are only imported by the Google login
+    import requests
+    from pip._vendor import cachecontrol
+    from google.oauth2 import id_token
+    import google.auth.transport.requests
+
+    google_auth = get_google_auth()
     google_auth.fetch_token(authorization_response=request.url)
 
     credentials = google_auth.credentials
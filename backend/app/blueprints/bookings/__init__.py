@@ -5,3 +5,5 @@ bookings_bp = Blueprint("bookings", __name__)
 
 # Import the routes
 from . import routes
+from . import revenue
+from . import seats
@@ -1,46 +1,173 @@
+from datetime import timedelta
+from sqlalchemy import update, exists, delete, extract, func, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import configure_mappers, joinedload, selectinload
+
 from .models import *
+from . import holds
 from app.blueprints.flights import dao as flight_dao
+from app.blueprints.flights import models as flight_models
+from app.blueprints.flights import loaders as flight_loaders
 from app import app
 from app import app, db
+from app.routing import replica_reads
+from app.keyset import KeysetPagination
+
+# Order of the reservation lists, backed by the (created_at, id) ends of their indexes
+RESERVATION_ORDER = (Reservation.created_at, Reservation.id)
+
+
+def reservation_card_options():
+    """
+    Eager loading profile of the reservation cards and tickets: flight card, seat and
+    class, payment, owner and author
+    """
+    configure_mappers()
+    FlightSeat = flight_models.FlightSeat
+    return [
+        joinedload(Reservation.payment),
+        joinedload(Reservation.owner),
+        joinedload(Reservation.author),
+        joinedload(Reservation.flight_seat).options(
+            joinedload(FlightSeat.aircraft_seat).joinedload(
+                flight_models.AircraftSeat.seat_class
+            ),
+            joinedload(FlightSeat.flight).options(
+                *flight_loaders.flight_card_options()
+            ),
+        ),
+    ]
 
 
 def get_reservation_by_id(reservation_id):
     return Reservation.query.get(reservation_id)
 
 
-def get_reservations_of_owned_user(owner_id, page=1, per_page=app.config["PAGE_SIZE"]):
+def get_ticket(reservation_id):
     return (
-        Reservation.query.filter_by(owner_id=owner_id, is_deleted=False)
-        .order_by(Reservation.created_at.desc())
-        .paginate(page=page, per_page=per_page)
+        Reservation.query.options(*reservation_card_options())
+        .filter_by(id=reservation_id)
+        .first()
+    )
+
+
+def get_reservations_of_owned_user(
+    owner_id, after=None, before=None, per_page=app.config["PAGE_SIZE"]
+):
+    """
+    Keyset page of the reservations of the owner, newest first
+    """
+    query = Reservation.query.options(*reservation_card_options()).filter_by(
+        owner_id=owner_id, is_deleted=False
+    )
+    return KeysetPagination(
+        query, RESERVATION_ORDER, per_page, after, before, descending=True
     )
 
 
 def get_reservations_created_for_others(
-    author_id, page=1, per_page=app.config["PAGE_SIZE"]
+    author_id, after=None, before=None, per_page=app.config["PAGE_SIZE"]
 ):
-    return (
-        Reservation.query.filter(
-            Reservation.author_id == author_id,
-            Reservation.owner_id != author_id,
-            Reservation.is_deleted == False,
+    """
+    Keyset page of the reservations the author made for other users, newest first
+    """
+    query = Reservation.query.options(*reservation_card_options()).filter(
+        Reservation.author_id == author_id,
+        Reservation.owner_id != author_id,
+        Reservation.is_deleted == False,
+    )
+    return KeysetPagination(
+        query, RESERVATION_ORDER, per_page, after, before, descending=True
+    )
+
+
+def claim_flight_seat(flight_seat_id, reservation_id=None):
+    """
+    Lock the flight seat row until the end of the transaction and return it if it isn't
+    sold to nor held by another reservation than reservation_id.\n
+    Concurrent claims of the same seat wait for the lock (SELECT ... FOR UPDATE), so the seat
+    is sold only once. SQLite has no row lock, a no-op UPDATE takes its write lock instead.
+    """
+    FlightSeat = flight_models.FlightSeat
+    if db.engine.dialect.name == "sqlite":
+        db.session.execute(
+            update(FlightSeat)
+            .where(FlightSeat.id == flight_seat_id)
+            .values(price=FlightSeat.price)
         )
-        .order_by(Reservation.created_at.desc())
-        .paginate(page=page, per_page=per_page)
+    flight_seat = (
+        FlightSeat.query.filter_by(id=flight_seat_id)
+        .with_for_update()
+        .populate_existing()
+        .first()
     )
+    # Locking read so the payments committed by the other claims are seen
+    paid_reservation = (
+        db.session.query(Reservation.id)
+        .join(Payment, Payment.reservation_id == Reservation.id)
+        .filter(
+            Reservation.flight_seat_id == flight_seat_id,
+            Reservation.id != reservation_id,
+            Payment.status == PaymentStatus.SUCCESS,
+        )
+        .with_for_update()
+        .first()
+    )
+    if not flight_seat or paid_reservation:
+        return None
+    # Held by the unexpired hold of another reservation, which may be paying for it
+    if flight_seat.is_held():
+        other_hold = (
+            db.session.query(Reservation.id)
+            .filter(
+                Reservation.flight_seat_id == flight_seat_id,
+                Reservation.id != reservation_id,
+                Reservation.is_deleted == False,
+                Reservation.hold_expires_at > dt.now(),
+            )
+            .with_for_update()
+            .first()
+        )
+        if other_hold:
+            return None
+    return flight_seat
 
 
-def add_reservation(owner_id, author_id, flight_seat_id, is_paid=False):
+def add_reservation(
+    owner_id, author_id, flight_seat_id, is_paid=False, hold_minutes=None
+):
+    """
+    An unpaid reservation holds its seat for hold_minutes.\n
+    Return None if the reservation is paid but the seat has been sold meanwhile
+    """
     reservation = Reservation(
         owner_id=owner_id,
         author_id=author_id,
         flight_seat_id=flight_seat_id,
     )
+    if not is_paid and hold_minutes:
+        reservation.hold_expires_at = dt.now() + timedelta(minutes=hold_minutes)
     if is_paid:
-        price = flight_dao.get_flight_seat_by_id(flight_seat_id).price
-        reservation.payment = Payment(amount=price, status=PaymentStatus.SUCCESS)
+        flight_seat = claim_flight_seat(flight_seat_id)
+        if not flight_seat:
+            db.session.rollback()
+            return None
+        reservation.payment = Payment(
+            amount=flight_seat.price, status=PaymentStatus.SUCCESS, created_at=dt.now()
+        )
+        add_to_revenue_rollup(
+            flight_seat.flight.route_id,
+            flight_seat.flight_id,
+            reservation.payment.created_at,
+            flight_seat.price,
+        )
     db.session.add(reservation)
+    refresh_seat_status([flight_seat_id])
     db.session.commit()
+    if is_paid or reservation.hold_expires_at:
+        flight_dao.fare_calendar_cache.invalidate_flight(reservation.flight_seat.flight)
+    if reservation.hold_expires_at:
+        holds.hold_metrics.add("created")
     return reservation
 
 
@@ -49,6 +176,8 @@ def delete_reservation(reservation_id):
     if not reservation:
         return False
     reservation.is_deleted = True
+    reservation.cancelled_at = dt.now()
+    refresh_seat_status([reservation.flight_seat_id])
     db.session.commit()
     return True
 
@@ -71,19 +200,555 @@ def get_reservation_by_id_and_user(id, user_id):
 
 
 def update_reservation_seat(reservation, flight_seat_id):
+    previous_seat_id = reservation.flight_seat_id
     reservation.flight_seat_id = flight_seat_id
+    refresh_seat_status([previous_seat_id, flight_seat_id])
     db.session.commit()
     return reservation
 
 
 def add_payment(reservation_id, amount, status=PaymentStatus.PENDING):
-    new_payment = Payment(reservation_id=reservation_id, amount=amount, status=status)
+    """
+    Return (payment, created), created is False when nothing new has been recorded.\n
+    The payment is None if it is successful but the seat has been sold meanwhile or
+    the owner cancelled the reservation, the payment is recorded as a Refund to make.
+    A successful payment of a reservation already paid (a reload of the VNPay return
+    URL) returns its payment
+    """
+    if status == PaymentStatus.SUCCESS:
+        reservation = get_reservation_by_id(reservation_id)
+        if not reservation:
+            db.session.rollback()
+            return None, False
+        if not claim_flight_seat(reservation.flight_seat_id, reservation.id):
+            db.session.rollback()
+            add_refund(reservation_id, amount, RefundReason.SOLD)
+            return None, False
+        # Locking read, the seat lock orders the replays of the same payment
+        paid = (
+            Payment.query.filter_by(
+                reservation_id=reservation.id, status=PaymentStatus.SUCCESS
+            )
+            .with_for_update()
+            .first()
+        )
+        if paid:
+            db.session.commit()
+            return paid, False
+        if reservation.cancelled_at:
+            db.session.rollback()
+            add_refund(reservation_id, amount, RefundReason.CANCELLED)
+            return None, False
+        # The payment may come back after the hold has been swept, the seat is still free
+        reservation.is_deleted = False
+
+    new_payment = Payment(
+        reservation_id=reservation_id, amount=amount, status=status, created_at=dt.now()
+    )
 
     db.session.add(new_payment)
 
     try:
+        if status == PaymentStatus.SUCCESS:
+            flight = reservation.flight_seat.flight
+            add_to_revenue_rollup(
+                flight.route_id, flight.id, new_payment.created_at, amount
+            )
+            refresh_seat_status([reservation.flight_seat_id])
         db.session.commit()
-        return new_payment
+        if status == PaymentStatus.SUCCESS:
+            flight_dao.fare_calendar_cache.invalidate_flight(
+                new_payment.reservation.flight_seat.flight
+            )
+            if new_payment.reservation.hold_expires_at:
+                holds.hold_metrics.add("converted")
+        return new_payment, True
     except Exception as e:
         db.session.rollback()
-        return None
+        return None, False
+
+
+def derive_seat_status(flight_seat_ids, lock=False):
+    """
+    Status of the flight seats from their reservations and payments: sold by the first
+    paid reservation, else held until the last unexpired hold.\n
+    With lock, the rows are read with locking reads so that the writes committed by
+    concurrent transactions are seen (MySQL reads a snapshot otherwise).\n
+    Return: {flight_seat_id: (status, held_until, sold_reservation_id)}
+    """
+    SeatStatus = flight_models.SeatStatus
+    reservations = db.session.query(
+        Reservation.id,
+        Reservation.flight_seat_id,
+        Reservation.is_deleted,
+        Reservation.hold_expires_at,
+    ).filter(Reservation.flight_seat_id.in_(flight_seat_ids))
+    paid = (
+        db.session.query(Reservation.id)
+        .join(Payment, Payment.reservation_id == Reservation.id)
+        .filter(
+            Reservation.flight_seat_id.in_(flight_seat_ids),
+            Payment.status == PaymentStatus.SUCCESS,
+        )
+    )
+    if lock:
+        reservations = reservations.with_for_update()
+        paid = paid.with_for_update()
+    paid = {id for id, in paid}
+
+    now = dt.now()
+    sold, held = {}, {}
+    for id, flight_seat_id, is_deleted, hold_expires_at in reservations:
+        if id in paid:
+            sold[flight_seat_id] = min(sold.get(flight_seat_id, id), id)
+        elif not is_deleted and hold_expires_at and hold_expires_at > now:
+            held[flight_seat_id] = max(
+                held.get(flight_seat_id, hold_expires_at), hold_expires_at
+            )
+
+    statuses = {}
+    for flight_seat_id in flight_seat_ids:
+        if flight_seat_id in sold:
+            statuses[flight_seat_id] = (
+                SeatStatus.SOLD,
+                None,
+                sold[flight_seat_id],
+            )
+        elif flight_seat_id in held:
+            statuses[flight_seat_id] = (SeatStatus.HELD, held[flight_seat_id], None)
+        else:
+            statuses[flight_seat_id] = (SeatStatus.AVAILABLE, None, None)
+    return statuses
+
+
+def refresh_seat_status(flight_seat_ids):
+    """
+    Recompute the status of the flight seats after a write of their reservations or
+    payments and move them between the seat counts of their flight, in the same
+    transaction, the caller commits.\n
+    The seat rows are locked first (in id order) so the changes of a seat and of its
+    counts are applied one transaction after the other
+    """
+    FlightSeat = flight_models.FlightSeat
+    FlightSeatCount = flight_models.FlightSeatCount
+    SeatStatus = flight_models.SeatStatus
+    flight_seat_ids = sorted({id for id in flight_seat_ids if id is not None})
+    if not flight_seat_ids:
+        return
+    if db.engine.dialect.name == "sqlite":
+        db.session.execute(
+            update(FlightSeat)
+            .where(FlightSeat.id.in_(flight_seat_ids))
+            .values(price=FlightSeat.price)
+        )
+    seats = (
+        db.session.query(FlightSeat, flight_models.AircraftSeat.seat_class_id)
+        .outerjoin(
+            flight_models.AircraftSeat,
+            flight_models.AircraftSeat.id == FlightSeat.aircraft_seat_id,
+        )
+        .filter(FlightSeat.id.in_(flight_seat_ids))
+        .order_by(FlightSeat.id)
+        .with_for_update(of=FlightSeat)
+        .populate_existing()
+        .all()
+    )
+    statuses = derive_seat_status(flight_seat_ids, lock=True)
+
+    counted = {SeatStatus.HELD: "held", SeatStatus.SOLD: "sold"}
+    changes = {}
+    for seat, seat_class_id in seats:
+        status, held_until, sold_reservation_id = statuses[seat.id]
+        if status != seat.status:
+            change = changes.setdefault(
+                (seat.flight_id, seat_class_id), {"held": 0, "sold": 0}
+            )
+            if seat.status in counted:
+                change[counted[seat.status]] -= 1
+            if status in counted:
+                change[counted[status]] += 1
+        seat.status = status
+        seat.held_until = held_until
+        seat.sold_reservation_id = sold_reservation_id
+
+    for (flight_id, seat_class_id), change in changes.items():
+        if not any(change.values()):
+            continue
+        db.session.execute(
+            update(FlightSeatCount)
+            .where(
+                FlightSeatCount.flight_id == flight_id,
+                FlightSeatCount.seat_class_id == seat_class_id,
+            )
+            .values(
+                held=FlightSeatCount.held + change["held"],
+                sold=FlightSeatCount.sold + change["sold"],
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+def repair_seat_status(batch_size=1000):
+    """
+    Recompute the status of every flight seat and the seat counts of every flight from
+    the reservations and payments, in batches of batch_size seats and flights, and fix
+    the rows that drifted. Expired holds not swept yet are set available.\n
+    Return: (number of fixed seats, number of fixed seat counts)
+    """
+    FlightSeat = flight_models.FlightSeat
+    Flight = flight_models.Flight
+    fixed_seats = 0
+    last_id = 0
+    while True:
+        seats = (
+            db.session.query(
+                FlightSeat.id,
+                FlightSeat.status,
+                FlightSeat.held_until,
+                FlightSeat.sold_reservation_id,
+            )
+            .filter(FlightSeat.id > last_id)
+            .order_by(FlightSeat.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not seats:
+            break
+        last_id = seats[-1].id
+        statuses = derive_seat_status([seat.id for seat in seats])
+        fixes = [
+            {
+                "id": seat.id,
+                "status": statuses[seat.id][0],
+                "held_until": statuses[seat.id][1],
+                "sold_reservation_id": statuses[seat.id][2],
+            }
+            for seat in seats
+            if tuple(seat[1:]) != statuses[seat.id]
+        ]
+        if fixes:
+            db.session.execute(update(FlightSeat), fixes)
+        fixed_seats += len(fixes)
+
+    fixed_counts = 0
+    last_id = 0
+    while True:
+        flight_ids = [
+            id
+            for id, in db.session.query(Flight.id)
+            .filter(Flight.id > last_id)
+            .order_by(Flight.id)
+            .limit(batch_size)
+        ]
+        if not flight_ids:
+            break
+        last_id = flight_ids[-1]
+        fixed_counts += flight_dao.refresh_seat_counts(flight_ids)
+    db.session.commit()
+    return fixed_seats, fixed_counts
+
+
+def add_refund(reservation_id, amount, reason):
+    refund = Refund(reservation_id=reservation_id, amount=amount, reason=reason)
+    db.session.add(refund)
+    db.session.commit()
+    return refund
+
+
+def insert_statement(model):
+    """
+    INSERT of the dialect of the database, which supports the upserts
+    """
+    dialects = {"mysql": mysql, "postgresql": postgresql, "sqlite": sqlite}
+    return dialects[db.engine.dialect.name].insert(model)
+
+
+def insert_ignore(model, values):
+    """
+    Insert the row unless its primary key exists, return True if it was inserted
+    """
+    statement = insert_statement(model).values(values)
+    if db.engine.dialect.name == "mysql":
+        statement = statement.prefix_with("IGNORE")
+    else:
+        statement = statement.on_conflict_do_nothing()
+    return db.session.execute(statement).rowcount == 1
+
+
+def upsert_increment(model, values, increments):
+    """
+    Insert the row or add the values of the `increments` columns to the existing row
+    in one statement, so concurrent transactions don't lose an increment
+    """
+    statement = insert_statement(model).values(values)
+    if db.engine.dialect.name == "mysql":
+        statement = statement.on_duplicate_key_update(
+            {c: getattr(model, c) + statement.inserted[c] for c in increments}
+        )
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=[c.name for c in model.__table__.primary_key],
+            set_={c: getattr(model, c) + statement.excluded[c] for c in increments},
+        )
+    db.session.execute(statement)
+
+
+def add_to_revenue_rollup(route_id, flight_id, paid_at, amount):
+    """
+    Add a successful payment to the revenue of its route and day, the caller commits
+    """
+    month = {"year": paid_at.year, "month": paid_at.month}
+    first_of_month = insert_ignore(
+        RevenueRollupFlight, {"flight_id": flight_id, **month}
+    )
+    upsert_increment(
+        RevenueRollup,
+        {
+            "route_id": route_id,
+            **month,
+            "day": paid_at.day,
+            "revenue": amount,
+            "payment_count": 1,
+            "flight_count": int(first_of_month),
+        },
+        ["revenue", "payment_count", "flight_count"],
+    )
+
+
+def compute_revenue_rollup(*criteria, batch_size=1000):
+    """
+    Compute the rollup rows and the counted flights of the successful payments matching
+    the criteria.
+
+    The payments are streamed by flight and day, a flight is counted on the day of its
+    first payment of the month
+    """
+    Flight = flight_models.Flight
+    FlightSeat = flight_models.FlightSeat
+    day = (
+        extract("year", Payment.created_at),
+        extract("month", Payment.created_at),
+        extract("day", Payment.created_at),
+    )
+    rows = (
+        db.session.query(
+            Flight.id,
+            Flight.route_id,
+            *day,
+            func.sum(Payment.amount),
+            func.count(Payment.id),
+        )
+        .join(Reservation, Reservation.id == Payment.reservation_id)
+        .join(FlightSeat, FlightSeat.id == Reservation.flight_seat_id)
+        .join(Flight, Flight.id == FlightSeat.flight_id)
+        .filter(Payment.status == PaymentStatus.SUCCESS, *criteria)
+        .group_by(Flight.id, Flight.route_id, *day)
+        .order_by(Flight.id, *day)
+        .yield_per(batch_size)
+    )
+
+    rollups = {}
+    flight_months = []
+    for flight_id, route_id, year, month, day_, revenue, payments in rows:
+        year, month, day_ = int(year), int(month), int(day_)
+        key = (route_id, year, month, day_)
+        rollup = rollups.setdefault(
+            key,
+            {
+                "route_id": route_id,
+                "year": year,
+                "month": month,
+                "day": day_,
+                "revenue": 0,
+                "payment_count": 0,
+                "flight_count": 0,
+            },
+        )
+        rollup["revenue"] += revenue
+        rollup["payment_count"] += payments
+        flight_month = {"flight_id": flight_id, "year": year, "month": month}
+        if not flight_months or flight_months[-1] != flight_month:
+            flight_months.append(flight_month)
+            rollup["flight_count"] += 1
+    return list(rollups.values()), flight_months
+
+
+def insert_revenue_rollup(rollups, flight_months, batch_size=1000):
+    for i in range(0, len(rollups), batch_size):
+        db.session.execute(
+            RevenueRollup.__table__.insert(), rollups[i : i + batch_size]
+        )
+    for i in range(0, len(flight_months), batch_size):
+        db.session.execute(
+            RevenueRollupFlight.__table__.insert(), flight_months[i : i + batch_size]
+        )
+
+
+def rebuild_revenue_rollup(batch_size=1000):
+    """
+    Recompute the revenue rollup from the successful payments in one transaction.
+    Return the number of rollup rows
+    """
+    db.session.execute(delete(RevenueRollup))
+    db.session.execute(delete(RevenueRollupFlight))
+    rollups, flight_months = compute_revenue_rollup(batch_size=batch_size)
+    insert_revenue_rollup(rollups, flight_months, batch_size)
+    db.session.commit()
+    return len(rollups)
+
+
+def refresh_revenue_rollup(route_months):
+    """
+    Recompute the revenue rollup of the (route_id, year, month) of payments edited or
+    deleted by the staff, the caller commits.\n
+    A whole month is recomputed since removing the first payment of a flight moves its
+    flight_count to the day of its next payment. The rows are deleted before the
+    payments are read, so a concurrent add_payment waits on them and adds its payment
+    on top of the recomputed rows
+    """
+    Flight = flight_models.Flight
+    for route_id, year, month in set(route_months):
+        start = dt(year, month, 1)
+        end = dt(year + month // 12, month % 12 + 1, 1)
+        route_flights = select(Flight.id).where(Flight.route_id == route_id)
+        db.session.execute(
+            delete(RevenueRollup).where(
+                RevenueRollup.route_id == route_id,
+                RevenueRollup.year == year,
+                RevenueRollup.month == month,
+            )
+        )
+        db.session.execute(
+            delete(RevenueRollupFlight).where(
+                RevenueRollupFlight.flight_id.in_(route_flights),
+                RevenueRollupFlight.year == year,
+                RevenueRollupFlight.month == month,
+            )
+        )
+        rollups, flight_months = compute_revenue_rollup(
+            Flight.route_id == route_id,
+            Payment.created_at >= start,
+            Payment.created_at < end,
+        )
+        insert_revenue_rollup(rollups, flight_months)
+
+
+def is_paid_clause():
+    return exists().where(
+        Payment.reservation_id == Reservation.id,
+        Payment.status == PaymentStatus.SUCCESS,
+    )
+
+
+def expire_holds(batch_size):
+    """
+    Soft delete a batch of unpaid reservations whose hold has expired\n
+    The ids are selected first because MySQL can't UPDATE with a LIMIT subquery of
+    the same table. Return the number of swept reservations
+    """
+    now = dt.now()
+    expired = (
+        Reservation.is_deleted == False,
+        Reservation.hold_expires_at < now,
+        ~is_paid_clause(),
+    )
+    rows = (
+        db.session.query(Reservation.id, Reservation.flight_seat_id)
+        .filter(*expired)
+        .order_by(Reservation.hold_expires_at)
+        .limit(batch_size)
+        .all()
+    )
+    reservation_ids = [id for id, _ in rows]
+    if not reservation_ids:
+        db.session.rollback()
+        return 0
+    # Check the conditions again in case a payment came in meanwhile
+    result = db.session.execute(
+        update(Reservation)
+        .where(Reservation.id.in_(reservation_ids), *expired)
+        .values(is_deleted=True)
+        .execution_options(synchronize_session=False)
+    )
+    # Free the seats of the swept holds in the same transaction
+    refresh_seat_status([flight_seat_id for _, flight_seat_id in rows])
+    db.session.commit()
+    return result.rowcount
+
+
+def count_active_holds():
+    return Reservation.query.filter(
+        Reservation.is_deleted == False,
+        Reservation.hold_expires_at >= dt.now(),
+        ~is_paid_clause(),
+    ).count()
+
+
+def created_between(column, start=None, end=None):
+    conditions = []
+    if start:
+        conditions.append(column >= start)
+    if end:
+        conditions.append(column < end)
+    return conditions
+
+
+@replica_reads
+def stream_payments(start=None, end=None, batch_size=1000):
+    """
+    Stream the payments created in [start, end) with a server-side cursor fetching
+    batch_size rows at a time, the result has to be consumed before the session ends
+    """
+    FlightSeat = flight_models.FlightSeat
+    query = (
+        select(
+            Payment.id,
+            Payment.reservation_id,
+            FlightSeat.flight_id,
+            Reservation.flight_seat_id,
+            Payment.amount,
+            Payment.status,
+            Payment.created_at,
+        )
+        .join(Reservation, Reservation.id == Payment.reservation_id)
+        .join(FlightSeat, FlightSeat.id == Reservation.flight_seat_id)
+        .where(*created_between(Payment.created_at, start, end))
+        .order_by(Payment.id)
+    )
+    return db.session.execute(query.execution_options(yield_per=batch_size))
+
+
+@replica_reads
+def stream_reservations(start=None, end=None, batch_size=1000):
+    """
+    Stream the reservations created in [start, end) like stream_payments
+    """
+    FlightSeat = flight_models.FlightSeat
+    AircraftSeat = flight_models.AircraftSeat
+    query = (
+        select(
+            Reservation.id,
+            Reservation.owner_id,
+            Reservation.author_id,
+            FlightSeat.flight_id,
+            Reservation.flight_seat_id,
+            AircraftSeat.seat_class_id,
+            FlightSeat.price,
+            FlightSeat.currency,
+            Payment.id.isnot(None).label("is_paid"),
+            Reservation.is_deleted,
+            Reservation.created_at,
+            Reservation.hold_expires_at,
+        )
+        .join(FlightSeat, FlightSeat.id == Reservation.flight_seat_id)
+        .outerjoin(AircraftSeat, AircraftSeat.id == FlightSeat.aircraft_seat_id)
+        # The seat claim lets only one successful payment per reservation in
+        .outerjoin(
+            Payment,
+            (Payment.reservation_id == Reservation.id)
+            & (Payment.status == PaymentStatus.SUCCESS),
+        )
+        .where(*created_between(Reservation.created_at, start, end))
+        .order_by(Reservation.id)
+    )
+    return db.session.execute(query.execution_options(yield_per=batch_size))
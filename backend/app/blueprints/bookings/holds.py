@@ -0,0 +1,96 @@
+import time
+from threading import Thread, Lock
+
+import click
+
+from app import app, db
+from . import bookings_bp
+from . import dao
+
+
+class HoldMetrics:
+    """
+    Counters of the seat holds of this worker: created, expired (swept) and converted
+    (paid before they expired)
+    """
+
+    def __init__(self):
+        self.counts = {"created": 0, "expired": 0, "converted": 0}
+        self._lock = Lock()
+
+    def add(self, name, count=1):
+        with self._lock:
+            self.counts[name] += count
+
+    def stats(self):
+        return {**self.counts, "active": dao.count_active_holds()}
+
+
+class HoldSweeper(Thread):
+    """
+    Daemon thread that soft deletes the expired holds every SEAT_HOLD_SWEEP_INTERVAL
+    seconds. It is started by the first request of the worker.
+    """
+
+    def __init__(self):
+        super().__init__(name="seat-hold-sweeper", daemon=True)
+        self._start_lock = Lock()
+
+    def start_once(self):
+        with self._start_lock:
+            if self.ident is None:
+                self.start()
+
+    def run(self):
+        while True:
+            time.sleep(app.config["SEAT_HOLD_SWEEP_INTERVAL"])
+            with app.app_context():
+                try:
+                    swept = sweep_expired_holds()
+                    if swept:
+                        app.logger.info(f"Swept {swept} expired seat holds")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Seat hold sweep failed: {e}")
+
+
+def get_hold_minutes(role):
+    return app.config["SEAT_HOLD_MINUTES"][role.name]
+
+
+def sweep_expired_holds(batch_size=None):
+    """
+    Soft delete all expired holds in batches of SEAT_HOLD_SWEEP_BATCH_SIZE rows so that
+    each UPDATE only locks a few rows. Return the number of swept reservations
+    """
+    batch_size = batch_size or app.config["SEAT_HOLD_SWEEP_BATCH_SIZE"]
+    total = 0
+    while True:
+        swept = dao.expire_holds(batch_size)
+        total += swept
+        if swept < batch_size:
+            break
+    if total:
+        hold_metrics.add("expired", total)
+        # The swept seats are available again
+        dao.flight_dao.fare_calendar_cache.invalidate()
+    return total
+
+
+hold_metrics = HoldMetrics()
+hold_sweeper = HoldSweeper()
+
+
+@bookings_bp.before_app_request
+def start_hold_sweeper():
+    if app.config["SEAT_HOLD_SWEEP_INTERVAL"] > 0 and hold_sweeper.ident is None:
+        hold_sweeper.start_once()
+
+
+@bookings_bp.cli.command("sweep-holds")
+@click.option("--batch-size", type=int, default=None)
+def sweep_holds_command(batch_size):
+    """Soft delete the expired seat holds (e.g. from a cron job)"""
+    swept = sweep_expired_holds(batch_size)
+    click.echo(f"Swept {swept} expired seat holds")
+    click.echo(hold_metrics.stats())
@@ -1,6 +1,6 @@
 from enum import Enum as BaseEnum
 from sqlalchemy import Column, Integer, Enum, ForeignKey, DateTime, Double, Boolean
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, Index
 from sqlalchemy.orm import relationship, backref
 from datetime import datetime as dt
 
@@ -9,13 +9,37 @@ from app import db
 
 class Reservation(db.Model):
     __tablename__ = "reservations"
-    __table_args__ = (UniqueConstraint("owner_id", "flight_seat_id"),)
+    __table_args__ = (
+        UniqueConstraint("owner_id", "flight_seat_id"),
+        # Keyset pages of the booking lists and the admin, newest first
+        Index(
+            "ix_reservations_owner_created_at",
+            "owner_id",
+            "is_deleted",
+            "created_at",
+            "id",
+        ),
+        Index(
+            "ix_reservations_author_created_at",
+            "author_id",
+            "is_deleted",
+            "created_at",
+            "id",
+        ),
+        Index("ix_reservations_created_at", "created_at", "id"),
+        # Reservations of a seat: sold and held checks, seat availability
+        Index("ix_reservations_flight_seat_id", "flight_seat_id"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     flight_seat_id = Column(Integer, ForeignKey("flight_seats.id"), nullable=False)
     created_at = Column(DateTime, nullable=False, default=dt.now)
     is_deleted = Column(Boolean, nullable=False, default=False)
+    # Unpaid reservations hold their seat until this time, then they are swept
+    hold_expires_at = Column(DateTime, nullable=True, index=True)
+    # Set when the owner deletes the reservation, unlike the sweep of an expired hold
+    cancelled_at = Column(DateTime, nullable=True)
 
     owner = relationship(
         "User",
@@ -27,7 +51,12 @@ class Reservation(db.Model):
         foreign_keys=[author_id],
         backref="created_reservations",
     )
-    flight_seat = relationship("FlightSeat", backref="reservations", lazy=True)
+    flight_seat = relationship(
+        "FlightSeat",
+        foreign_keys=[flight_seat_id],
+        backref="reservations",
+        lazy=True,
+    )
     payment = relationship(
         "Payment",
         uselist=False,
@@ -40,9 +69,10 @@ class Reservation(db.Model):
 
     def is_payable(self):
         """
-        Reservation is payable if it is unpaid, the flight is bookable and the seat is not sold
+        Reservation is payable if it is unpaid, its hold hasn't expired, the flight is bookable
+        and the seat is not sold
         """
-        if self.is_deleted or self.is_paid():
+        if self.is_deleted or self.is_paid() or self.is_hold_expired():
             return False
 
         return (
@@ -54,12 +84,23 @@ class Reservation(db.Model):
 
     def is_editable(self):
         """
-        Reservation is editable if it is unpaid and the flight is bookable
+        Reservation is editable if it is unpaid, its hold hasn't expired and the flight is bookable
         """
-        if self.is_deleted or self.is_paid():
+        if self.is_deleted or self.is_paid() or self.is_hold_expired():
             return False
         return self.flight_seat.flight.is_bookable_now()
 
+    def is_held(self):
+        """
+        Reservation holds its seat if it is unpaid and its hold hasn't expired
+        """
+        if self.is_deleted or self.is_paid() or self.hold_expires_at is None:
+            return False
+        return not self.is_hold_expired()
+
+    def is_hold_expired(self):
+        return self.hold_expires_at is not None and self.hold_expires_at <= dt.now()
+
 
 class PaymentStatus(BaseEnum):
     SUCCESS = 1
@@ -72,6 +113,11 @@ class PaymentStatus(BaseEnum):
 
 class Payment(db.Model):
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_created_at", "created_at", "id"),
+        # Payment of a reservation, and whether it is a successful one
+        Index("ix_payments_reservation_id_status", "reservation_id", "status"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     reservation_id = Column(Integer, ForeignKey("reservations.id"), nullable=False)
     amount = Column(Double, nullable=False)
@@ -80,3 +126,64 @@ class Payment(db.Model):
 
     def __repr__(self):
         return f"Bill('{self.id}', '{self.reservation.id}', '{self.amount}')"
+
+
+class RefundReason(BaseEnum):
+    SOLD = 1
+    CANCELLED = 2
+
+    def __str__(self):
+        return self.name.title()
+
+
+class Refund(db.Model):
+    """
+    Successful payment that can't be kept: the seat was sold to another reservation
+    first, or the owner cancelled the reservation before the payment came back.
+    The staff refunds it and sets refunded_at
+    """
+
+    __tablename__ = "refunds"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    reservation_id = Column(Integer, ForeignKey("reservations.id"), nullable=False)
+    amount = Column(Double, nullable=False)
+    reason = Column(Enum(RefundReason), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=dt.now)
+    refunded_at = Column(DateTime, nullable=True)
+
+    reservation = relationship("Reservation", backref="refunds", lazy=True)
+
+    def __repr__(self):
+        return f"Refund('{self.id}', '{self.reservation_id}', '{self.amount}')"
+
+
+class RevenueRollup(db.Model):
+    """
+    Revenue of the successful payments by route and day, updated by add_payment and the
+    paid add_reservation in the transaction of the payment, and recomputed for the
+    month when the staff edits a payment.
+
+    flight_count counts a flight on the day of its first payment of the month, so the days
+    of a month add up to the number of flights paid in the month
+    """
+
+    __tablename__ = "revenue_rollups"
+    __table_args__ = (Index("ix_revenue_rollups_month", "year", "month"),)
+    route_id = Column(Integer, ForeignKey("routes.id"), primary_key=True)
+    year = Column(Integer, primary_key=True, autoincrement=False)
+    month = Column(Integer, primary_key=True, autoincrement=False)
+    day = Column(Integer, primary_key=True, autoincrement=False)
+    revenue = Column(Double, nullable=False, default=0)
+    payment_count = Column(Integer, nullable=False, default=0)
+    flight_count = Column(Integer, nullable=False, default=0)
+
+
+class RevenueRollupFlight(db.Model):
+    """
+    Flights already counted in the flight_count of a month
+    """
+
+    __tablename__ = "revenue_rollup_flights"
+    flight_id = Column(Integer, ForeignKey("flights.id"), primary_key=True)
+    year = Column(Integer, primary_key=True, autoincrement=False)
+    month = Column(Integer, primary_key=True, autoincrement=False)
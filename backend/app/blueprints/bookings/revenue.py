@@ -0,0 +1,12 @@
+import click
+
+from . import bookings_bp
+from . import dao
+
+
+@bookings_bp.cli.command("rebuild-revenue")
+@click.option("--batch-size", type=int, default=1000)
+def rebuild_revenue_command(batch_size):
+    """Recompute the revenue rollup of the admin stats from the payments"""
+    rows = dao.rebuild_revenue_rollup(batch_size)
+    click.echo(f"Rebuilt {rows} revenue rollup rows")
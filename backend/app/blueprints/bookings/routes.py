@@ -1,9 +1,10 @@
-from flask import request, render_template, redirect, url_for, flash, session
+from flask import request, render_template, redirect, url_for, flash, session, abort
 from flask_login import login_required, current_user
 from datetime import datetime as dt
 
 from . import bookings_bp
 from . import utils
+from . import holds
 from .decorators import *
 from app.blueprints.flights import dao as flight_dao
 from app.blueprints.auth import dao as auth_dao
@@ -13,6 +14,7 @@ from .forms import BookingForm
 from .models import Reservation, PaymentStatus
 from app.blueprints.bookings.vnpay import vnpay
 from app import app
+from app.routing import use_primary
 
 
 @bookings_bp.route("/booking", methods=["GET", "POST"])
@@ -33,8 +35,8 @@ def reserve_ticket():
 
         # Check if flight seat is valid
         flight_seat = flight.get_seat_by_id(flight_seat_id)
-        if not flight_seat or flight_seat.is_sold():
-            flash("Invalid flight seat or sold!", "danger")
+        if not flight_seat or not flight_seat.is_available():
+            flash("Invalid flight seat, sold or held!", "danger")
             return redirect(request.referrer)
 
         # Check if user has already booked this flight seat whether it is paid or not
@@ -55,6 +57,7 @@ def reserve_ticket():
         form=form,
         flight=flight,
         seat_class=seat_class,
+        seat_map=flight_dao.get_seat_map(flight.id, seat_class.id),
         search_time=dt.now(),
         staff_min_booking_time=flight_dao.get_staff_min_booking_time(),
         customer_min_booking_time=flight_dao.get_customer_min_booking_time(),
@@ -63,6 +66,7 @@ def reserve_ticket():
 
 @bookings_bp.route("/booking/confirmation", methods=["GET", "POST"])
 @login_required
+@use_primary
 def confirmation():
     """
     Confirm the reservation and store it in the database.
@@ -80,7 +84,7 @@ def confirmation():
     flight = seat.flight
 
     # Check if flight is still bookable
-    if not flight.is_bookable_now() or seat.is_sold():
+    if not flight.is_bookable_now() or not seat.is_available():
         session.pop("reservation_details", None)
         flash("Flight is no longer bookable", "danger")
         return redirect(url_for("flights.showFlight", id=flight.id))
@@ -99,11 +103,19 @@ def confirmation():
             reservation = booking_dao.add_reservation(
                 owner.id, author.id, seat.id, is_paid=True
             )
+            if not reservation:
+                flash("This seat has just been sold!", "danger")
+                return redirect(url_for("flights.showFlight", id=flight.id))
             # Send email
             utils.send_flight_ticket_email(reservation, reservation.owner.email)
 
         elif payment_type == "card":
-            booking_dao.add_reservation(owner.id, author.id, seat.id)
+            booking_dao.add_reservation(
+                owner.id,
+                author.id,
+                seat.id,
+                hold_minutes=holds.get_hold_minutes(author.role),
+            )
 
         flash("Reservation created!", "success")
         return redirect(url_for("bookings.manage_own_bookings"))
@@ -123,8 +135,12 @@ def manage_own_bookings():
     """
     Only the user who owns the reservation can see it.
     """
-    page_num = request.args.get("page", default=1, type=int)
-    reservations = booking_dao.get_reservations_of_owned_user(current_user.id, page_num)
+    try:
+        reservations = booking_dao.get_reservations_of_owned_user(
+            current_user.id, request.args.get("after"), request.args.get("before")
+        )
+    except ValueError:
+        abort(400)
     return render_template("bookings/manage_bookings.html", page=reservations)
 
 
@@ -134,10 +150,12 @@ def manage_bookings_created_for_others():
     """
     Only the user who created the reservation can see it.
     """
-    page_num = request.args.get("page", default=1, type=int)
-    reservations = booking_dao.get_reservations_created_for_others(
-        current_user.id, page_num
-    )
+    try:
+        reservations = booking_dao.get_reservations_created_for_others(
+            current_user.id, request.args.get("after"), request.args.get("before")
+        )
+    except ValueError:
+        abort(400)
     return render_template("bookings/manage_bookings.html", page=reservations)
 
 
@@ -163,8 +181,8 @@ def edit_reservation(reservation_id):
 
         # Check if flight seat is valid
         flight_seat = flight.get_seat_by_id(flight_seat_id)
-        if not flight_seat or flight_seat.is_sold():
-            flash("Invalid flight seat or sold!", "danger")
+        if not flight_seat or not flight_seat.is_available():
+            flash("Invalid flight seat, sold or held!", "danger")
             return redirect(request.referrer)
 
         # Check if owner has already booked this flight seat whether it is paid or not
@@ -180,6 +198,7 @@ def edit_reservation(reservation_id):
         "bookings/change_seat.html",
         reservation=reservation,
         seat_class=seat_class,
+        seat_map=flight_dao.get_seat_map(flight.id, seat_class.id),
         search_time=dt.now(),
         staff_min_booking_time=flight_dao.get_staff_min_booking_time(),
         customer_min_booking_time=flight_dao.get_customer_min_booking_time(),
@@ -260,6 +279,7 @@ def payment(reservation_id):
 
 @bookings_bp.route("/booking/payment_return", methods=["GET"])
 @login_required
+@use_primary
 def payment_return():
     inputData = request.args
     if inputData:
@@ -279,15 +299,31 @@ def payment_return():
             if vnp_ResponseCode == "00":
                 # reservation
                 reservation_id = order_id
-                booking_dao.add_payment(
+                payment, created = booking_dao.add_payment(
                     reservation_id=reservation_id,
                     amount=amount,
                     status=PaymentStatus.SUCCESS,
                 )
+                if not payment:
+                    # Another reservation of this seat has been paid first, or the
+                    # owner cancelled this one, the payment is recorded for a refund
+                    reservation = booking_dao.get_reservation_by_id(reservation_id)
+                    cancelled = reservation and reservation.cancelled_at
+                    return render_template(
+                        "bookings/payment_return.html",
+                        title="Payment result",
+                        result="Cancelled" if cancelled else "Sold",
+                        order_id=order_id,
+                        amount=amount,
+                        order_desc=order_desc,
+                        vnp_TransactionNo=vnp_TransactionNo,
+                        vnp_ResponseCode=vnp_ResponseCode,
+                    )
 
                 reservation = booking_dao.get_reservation_by_id(reservation_id)
-                # send email
-                utils.send_flight_ticket_email(reservation, reservation.owner.email)
+                # send email, once: the return URL is replayed on a reload
+                if created:
+                    utils.send_flight_ticket_email(reservation, reservation.owner.email)
                 flight_seat = reservation.flight_seat
                 flight = flight_seat.flight
 
@@ -352,6 +388,6 @@ def payment_return():
 @login_required
 @user_can_view_ticket
 def show_ticket(reservation_id):
-    reservation = Reservation.query.get(reservation_id)
+    reservation = booking_dao.get_ticket(reservation_id)
     # Trả về giao diện hiển thị vé
     return render_template("bookings/ticket.html", reservation=reservation)
@@ -0,0 +1,12 @@
+import click
+
+from . import bookings_bp
+from . import dao
+
+
+@bookings_bp.cli.command("repair-seat-status")
+@click.option("--batch-size", type=int, default=1000)
+def repair_seat_status_command(batch_size):
+    """Recompute the seat status and seat counts from the reservations and payments"""
+    seats, counts = dao.repair_seat_status(batch_size)
+    click.echo(f"Fixed {seats} flight seats and {counts} seat counts")
@@ -1,7 +1,6 @@
 from flask import flash
-from flask_mail import Mail, Message
 from flask import render_template
-from app import mail
+from app.blueprints.mails import outbox
 
 
 def validate_flight_seat_class(flight, seat_class):
@@ -28,12 +27,13 @@ def validate_flight_seat_class(flight, seat_class):
 
 
 def send_flight_ticket_email(reservation, email):
-    message = Message(
+    """
+    The ticket is rendered in the request (its links need url_for) and sent by the mail outbox
+    """
+    outbox.send_mail(
         subject="Flight Ticket",
-        sender="noreply@6789lacachbonanhsong.com",
         recipients=[email],
         html=render_template(
             "bookings/ticket_email.html", reservation=reservation, email=True
         ),
     )
-    mail.send(message)
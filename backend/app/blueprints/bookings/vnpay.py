@@ -3,8 +3,10 @@ import hmac
 import urllib.parse
 
 class vnpay:
-    requestData = {}
-    responseData = {}
+    def __init__(self):
+        # Per instance, concurrent payments must not share their parameters
+        self.requestData = {}
+        self.responseData = {}
 
     def get_payment_url(self, vnpay_payment_url, secret_key):
         inputData = sorted(self.requestData.items())
@@ -0,0 +1,136 @@
+from datetime import datetime
+
+from app import app, keyset
+from .utils import to_date
+
+# Fields of a flight in /api/v1/flights, a client can ask some with ?fields=id,code
+FIELDS = (
+    "id",
+    "code",
+    "route_id",
+    "aircraft_id",
+    "depart_time",
+    "arrive_time",
+    "departure_airport",
+    "arrival_airport",
+    "aircraft",
+    "stopovers",
+    "availability",
+)
+
+# Query string filters: dao.get_flights_after() argument and type
+FILTERS = {
+    "route": ("route_id", int),
+    "departure_airport": ("departure_airport_id", int),
+    "arrival_airport": ("arrival_airport_id", int),
+    "aircraft": ("aircraft_id", int),
+    "depart_from": ("depart_from", to_date),
+    "depart_to": ("depart_to", to_date),
+}
+
+
+def get_arg(args, name, convert):
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return convert(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}")
+
+
+def parse_flights_args(args):
+    """
+    Validate the query string of /api/v1/flights.\n
+    Return the keyword arguments of dao.get_flights_after(), raise ValueError with the
+    message for the client
+    """
+    query = {}
+    for name, (argument, convert) in FILTERS.items():
+        query[argument] = get_arg(args, name, convert)
+    if query["depart_from"] and query["depart_to"]:
+        if query["depart_from"] > query["depart_to"]:
+            raise ValueError("depart_from is after depart_to")
+
+    fields = get_arg(args, "fields", lambda value: set(value.split(",")))
+    if fields is None:
+        fields = set(FIELDS)
+    unknown = fields - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    query["fields"] = fields
+
+    limit = get_arg(args, "limit", int)
+    if limit is None:
+        limit = app.config["API_PAGE_SIZE"]
+    if not 1 <= limit <= app.config["API_MAX_PAGE_SIZE"]:
+        raise ValueError(
+            f"limit must be between 1 and {app.config['API_MAX_PAGE_SIZE']}"
+        )
+    query["limit"] = limit
+
+    cursor = args.get("cursor")
+    query["cursor"] = keyset.decode_cursor(cursor, datetime, int) if cursor else None
+    return query
+
+
+def next_cursor(flight):
+    return keyset.encode_cursor(flight.depart_time, flight.id)
+
+
+def airport_to_dict(airport):
+    return {
+        "id": airport.id,
+        "code": airport.code,
+        "name": airport.name,
+        "country": airport.country.name,
+    }
+
+
+def flight_to_dict(flight, fields, availability):
+    """
+    The requested fields of a flight, its relationships are loaded by
+    loaders.flight_api_options() and availability is the result of
+    dao.get_seat_classes_availability() for the page
+    """
+    data = {}
+    for field in ("id", "code", "route_id", "aircraft_id"):
+        if field in fields:
+            data[field] = getattr(flight, field)
+    for field in ("depart_time", "arrive_time"):
+        if field in fields:
+            data[field] = getattr(flight, field).isoformat()
+    if "departure_airport" in fields:
+        data["departure_airport"] = (
+            airport_to_dict(flight.route.depart_airport) if flight.route else None
+        )
+    if "arrival_airport" in fields:
+        data["arrival_airport"] = (
+            airport_to_dict(flight.route.arrive_airport) if flight.route else None
+        )
+    if "aircraft" in fields:
+        data["aircraft"] = (
+            {
+                "id": flight.aircraft.id,
+                "name": flight.aircraft.name,
+                "airline": flight.aircraft.airline.name,
+            }
+            if flight.aircraft
+            else None
+        )
+    if "stopovers" in fields:
+        data["stopovers"] = [
+            {
+                "order": stopover.order,
+                "airport": airport_to_dict(stopover.airport),
+                "arrival_time": stopover.arrival_time.isoformat(),
+                "departure_time": stopover.departure_time.isoformat(),
+            }
+            for stopover in sorted(flight.stopovers, key=lambda s: s.order)
+        ]
+    if "availability" in fields:
+        data["availability"] = [
+            {"seat_class_id": seat_class_id, **seat_class}
+            for seat_class_id, seat_class in availability.get(flight.id, {}).items()
+        ]
+    return data
@@ -0,0 +1,352 @@
+import hashlib
+import time
+from bisect import insort
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from app import app, db
+from .models import Regulation, Flight, Airport, Aircraft
+from .loaders import airport_options, flight_card_options
+
+
+class RegulationCache:
+    """
+    Keep all regulation values of the worker in memory.\n
+    - All rows are loaded with one query.\n
+    - After REGULATION_CACHE_TTL seconds, the max version of the table is checked,
+      the rows are only reloaded if another worker (or the admin page) changed them.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._version = None
+        self._checked_at = None
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if self._is_expired():
+            self.refresh()
+        else:
+            self.hits += 1
+        return self._values[key]
+
+    def refresh(self):
+        with self._lock:
+            version = db.session.query(func.max(Regulation.version)).scalar()
+            if version != self._version or not self._values:
+                self.misses += 1
+                self._values = {r.key: r.value for r in Regulation.query.all()}
+                self._version = version
+            else:
+                self.hits += 1
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        self._checked_at = None
+        self._version = None
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "version": self._version,
+            "size": len(self._values),
+        }
+
+    def _is_expired(self):
+        if self._checked_at is None:
+            return True
+        ttl = app.config["REGULATION_CACHE_TTL"]
+        return time.monotonic() - self._checked_at >= ttl
+
+
+class ReferenceDataCache:
+    """
+    Prebuilt (id, label) choices of the airports and aircrafts selects, kept in the
+    worker memory.\n
+    - A list is loaded with one query the first time it is used.\n
+    - The airport, country, aircraft and airline admin views call invalidate() when
+      they write, which bumps the version and drops every list (the labels show the
+      country and airline names).
+      The other workers reload theirs after REFERENCE_DATA_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._version = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name):
+        ttl = app.config["REFERENCE_DATA_CACHE_TTL"]
+        entry = self._entries.get(name)
+        if entry is not None and time.monotonic() - entry[0] < ttl:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        version = self._version
+        choices = tuple(getattr(self, f"_load_{name}")())
+        with self._lock:
+            # Do not keep a list read before an invalidation
+            if version == self._version:
+                self._entries[name] = (time.monotonic(), choices)
+        return choices
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "version": self._version,
+            "size": sum(len(choices) for _, choices in self._entries.values()),
+        }
+
+    def _load_airports(self):
+        airports = Airport.query.options(*airport_options()).order_by(Airport.id)
+        return (
+            (airport.id, f"{airport.name} ({airport.code}) - {airport.country.name}")
+            for airport in airports
+        )
+
+    def _load_aircrafts(self):
+        aircrafts = Aircraft.query.options(joinedload(Aircraft.airline)).order_by(
+            Aircraft.id
+        )
+        return (
+            (aircraft.id, f"{aircraft.id} - {aircraft.name} ({aircraft.airline.name})")
+            for aircraft in aircrafts
+        )
+
+
+class ApiResponseCache:
+    """
+    Serialized JSON bodies of the /api reference endpoints, kept in the worker memory.\n
+    - A body is built with one query the first time it is requested. Its strong ETag is
+      the digest of the bytes, so every worker gives the same ETag to the same rows.\n
+    - The admin views invalidate the endpoints of the tables they write, the other
+      workers rebuild theirs after API_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._versions = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, load):
+        """
+        Return the {"body", "etag", "last_modified"} of the endpoint, the body is the
+        to_dict() of the rows returned by load()
+        """
+        ttl = app.config["API_CACHE_TTL"]
+        entry = self._entries.get(name)
+        if entry is not None and time.monotonic() - entry["loaded_at"] < ttl:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        version = self._versions.get(name, 0)
+        body = app.json.dumps([row.to_dict() for row in load()]).encode()
+        etag = hashlib.sha1(body).hexdigest()
+        if entry is not None and entry["etag"] == etag:
+            # Rebuilt after the TTL with the same rows
+            last_modified = entry["last_modified"]
+        else:
+            last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        entry = {
+            "body": body,
+            "etag": etag,
+            "last_modified": last_modified,
+            "loaded_at": time.monotonic(),
+        }
+        with self._lock:
+            # Do not keep a body read before an invalidation
+            if version == self._versions.get(name, 0):
+                self._entries[name] = entry
+        return entry
+
+    def invalidate(self, *names):
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+                self._entries.pop(name, None)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "versions": dict(self._versions),
+            "size": sum(len(entry["body"]) for entry in self._entries.values()),
+        }
+
+
+class FlightSearchIndex:
+    """
+    Optional in-memory index of the flights ids per (route, departure date).\n
+    - An entry is loaded with one range query the first time it is searched and
+      reloaded after FLIGHT_SEARCH_INDEX_TTL seconds, so the flights scheduled, moved
+      or deleted by the other workers show up.\n
+    - add_flight() inserts new flights into the loaded entries, admin edits clear the
+      index of their worker.\n
+    - At most FLIGHT_SEARCH_INDEX_MAX_ENTRIES entries are kept, the least recently
+      searched one is evicted first.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._version = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, route_id, depart_date):
+        key = (route_id, depart_date)
+        ttl = app.config["FLIGHT_SEARCH_INDEX_TTL"]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return [flight_id for _, flight_id in entry[1]]
+        self.misses += 1
+        version = self._version
+        loaded_at = time.monotonic()
+        start, end = day_bounds(depart_date)
+        rows = (
+            db.session.query(Flight.depart_time, Flight.id)
+            .filter(
+                Flight.route_id == route_id,
+                Flight.depart_time >= start,
+                Flight.depart_time < end,
+            )
+            .order_by(Flight.depart_time, Flight.id)
+            .all()
+        )
+        flights = [tuple(row) for row in rows]
+        with self._lock:
+            # Do not keep an entry read before an invalidation
+            if version == self._version:
+                self._entries[key] = (loaded_at, flights)
+                self._entries.move_to_end(key)
+                while (
+                    len(self._entries) > app.config["FLIGHT_SEARCH_INDEX_MAX_ENTRIES"]
+                ):
+                    self._entries.popitem(last=False)
+        return [flight_id for _, flight_id in flights]
+
+    def add(self, flight):
+        key = (flight.route_id, flight.depart_time.date())
+        with self._lock:
+            if key in self._entries:
+                insort(self._entries[key][1], (flight.depart_time, flight.id))
+
+    def paginate(self, route_id, depart_date, page, per_page):
+        return FlightIdsPagination(
+            page=page,
+            per_page=per_page,
+            flight_ids=self.get(route_id, depart_date),
+        )
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "version": self._version,
+            "size": len(self._entries),
+        }
+
+
+class FlightIdsPagination(Pagination):
+    """
+    Paginate a sorted list of flight ids, only the flights of the page are loaded.
+    The ids of flights deleted since the list was built are skipped
+    """
+
+    def _query_items(self):
+        flight_ids = self._query_args["flight_ids"][
+            self._query_offset : self._query_offset + self.per_page
+        ]
+        if not flight_ids:
+            return []
+        flights = {
+            flight.id: flight
+            for flight in Flight.query.options(*flight_card_options()).filter(
+                Flight.id.in_(flight_ids)
+            )
+        }
+        return [flights[id] for id in flight_ids if id in flights]
+
+    def _query_count(self):
+        return len(self._query_args["flight_ids"])
+
+
+class FareCalendarCache:
+    """
+    Cheapest available fare per seat class of each (route, day).\n
+    Entries expire after FARE_CALENDAR_CACHE_TTL seconds and are dropped as soon as
+    a seat of the day is sold in this worker.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = Lock()
+
+    def get_many(self, route_id, dates, load):
+        """
+        Return {date: fares} of the dates, the missing days are loaded at once with
+        load(route_id, first_missing_date, last_missing_date)
+        """
+        ttl = app.config["FARE_CALENDAR_CACHE_TTL"]
+        now = time.monotonic()
+        missing = [
+            date
+            for date in dates
+            if (route_id, date) not in self._entries
+            or now - self._entries[(route_id, date)][0] >= ttl
+        ]
+        if missing:
+            fares = load(route_id, missing[0], missing[-1])
+            with self._lock:
+                for date in missing:
+                    self._entries[(route_id, date)] = (now, fares.get(date, {}))
+        return {date: self._entries[(route_id, date)][1] for date in dates}
+
+    def invalidate_flight(self, flight):
+        with self._lock:
+            self._entries.pop((flight.route_id, flight.depart_time.date()), None)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def day_bounds(date):
+    """
+    Return [start, end) datetimes of a date so that the depart_time index can be used
+    """
+    start = datetime.combine(date, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+regulation_cache = RegulationCache()
+flight_search_index = FlightSearchIndex()
+reference_data_cache = ReferenceDataCache()
+api_response_cache = ApiResponseCache()
+fare_calendar_cache = FareCalendarCache()
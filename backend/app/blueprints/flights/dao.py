@@ -1,14 +1,24 @@
 from datetime import datetime as dt
+from datetime import timedelta
 
 from .models import *
 from app import app
-from sqlalchemy import func, extract, and_
+from app.routing import replica_reads
+from app import keyset
+from sqlalchemy import func, extract, and_, or_, case, select
 from sqlalchemy.orm import aliased
-from app.blueprints.bookings.models import Payment
+from app.blueprints.bookings.models import Payment, RevenueRollup
+from .cache import regulation_cache, flight_search_index, fare_calendar_cache
+from .cache import reference_data_cache, api_response_cache
+from .cache import day_bounds
+from .itineraries import timetable, ItineraryPagination
+from .loaders import airport_options, route_options
+from .loaders import flight_card_options, flight_details_options
+from .loaders import flight_api_options
 
 
 def get_airports():
-    return Airport.query.all()
+    return Airport.query.options(*airport_options()).all()
 
 
 def get_aircrafts():
@@ -31,10 +41,28 @@ def get_countries():
     return Country.query.all()
 
 
+def get_airport_choices():
+    """
+    (id, label) choices of the airport selects, from the reference data cache
+    """
+    return reference_data_cache.get("airports")
+
+
+def get_aircraft_choices():
+    """
+    (id, label) choices of the aircraft selects, from the reference data cache
+    """
+    return reference_data_cache.get("aircrafts")
+
+
 def get_flight_by_id(id):
     return Flight.query.get(id)
 
 
+def get_flight_details(id):
+    return Flight.query.options(*flight_details_options()).filter_by(id=id).first()
+
+
 def get_aircraft_seat_by_id(id):
     return AircraftSeat.query.get(id)
 
@@ -47,6 +75,10 @@ def get_seat_class_by_id(id):
     return SeatClass.query.get(id)
 
 
+def get_airport_by_id(id):
+    return Airport.query.get(id)
+
+
 def get_aircraft_by_id(id):
     return Aircraft.query.get(id)
 
@@ -64,41 +96,49 @@ def get_route_by_id(id):
 
 
 def get_route_by_airports(depart_airport_id, arrive_airport_id):
-    return Route.query.filter_by(
-        depart_airport_id=depart_airport_id, arrive_airport_id=arrive_airport_id
-    ).first()
+    return (
+        Route.query.options(*route_options())
+        .filter_by(
+            depart_airport_id=depart_airport_id, arrive_airport_id=arrive_airport_id
+        )
+        .first()
+    )
 
 
 def get_max_airports():
-    return Regulation.query.filter_by(key="max_airports").first().value
+    return regulation_cache.get("max_airports")
 
 
 def get_max_stopover_airports():
-    return Regulation.query.filter_by(key="max_stopover_airports").first().value
+    return regulation_cache.get("max_stopover_airports")
 
 
 def get_min_stopover_duration():
-    return Regulation.query.filter_by(key="min_stopover_duration").first().value
+    return regulation_cache.get("min_stopover_duration")
 
 
 def get_max_stopover_duration():
-    return Regulation.query.filter_by(key="max_stopover_duration").first().value
+    return regulation_cache.get("max_stopover_duration")
 
 
 def get_min_flight_duration():
-    return Regulation.query.filter_by(key="min_flight_duration").first().value
+    return regulation_cache.get("min_flight_duration")
 
 
 def get_max_flight_duration():
-    return Regulation.query.filter_by(key="max_flight_duration").first().value
+    return regulation_cache.get("max_flight_duration")
 
 
 def get_customer_min_booking_time():
-    return Regulation.query.filter_by(key="customer_min_booking_time").first().value
+    return regulation_cache.get("customer_min_booking_time")
 
 
 def get_staff_min_booking_time():
-    return Regulation.query.filter_by(key="staff_min_booking_time").first().value
+    return regulation_cache.get("staff_min_booking_time")
+
+
+def get_regulations_version():
+    return db.session.query(func.max(Regulation.version)).scalar() or 0
 
 
 def get_airport_number():
@@ -118,6 +158,8 @@ def add_route(depart_airport_id, arrive_airport_id):
     try:
         # commit dữ liệu vào cơ sở dữ liệu
         db.session.commit()
+        timetable.add_route(new_route)
+        api_response_cache.invalidate("routes")
         print("New route added successfully!")
         return new_route
     except Exception as e:
@@ -147,6 +189,8 @@ def add_flight(
     try:
         # commit dữ liệu vào cơ sở dữ liệu
         db.session.commit()
+        flight_search_index.add(new_flight)
+        timetable.add_flight(new_flight)
         return new_flight
     except Exception as e:
         print(f"Failed to add new flight: {e}")
@@ -168,6 +212,7 @@ def add_stopover(airport_id, flight_id, arrival_time, departure_time, order, not
     return stopover
 
 
+@replica_reads
 def load_flights(page=None, route_id=None):
     query = Flight.query
     query = query.filter(Flight.route_id == route_id)
@@ -180,6 +225,44 @@ def load_flights(page=None, route_id=None):
     return query.all()
 
 
+@replica_reads
+def get_flights_after(
+    cursor=None,
+    limit=app.config["API_PAGE_SIZE"],
+    fields=frozenset(),
+    route_id=None,
+    departure_airport_id=None,
+    arrival_airport_id=None,
+    aircraft_id=None,
+    depart_from=None,
+    depart_to=None,
+):
+    """
+    Keyset page of the flights in (depart_time, id) order, after the (depart_time, id)
+    cursor, with the relationships of the API fields loaded.\n
+    The dates are inclusive. Return up to limit + 1 flights, the extra one tells there
+    is a next page
+    """
+    query = Flight.query.options(*flight_api_options(fields))
+    if departure_airport_id or arrival_airport_id:
+        query = query.join(Route, Route.id == Flight.route_id)
+        if departure_airport_id:
+            query = query.filter(Route.depart_airport_id == departure_airport_id)
+        if arrival_airport_id:
+            query = query.filter(Route.arrive_airport_id == arrival_airport_id)
+    if route_id:
+        query = query.filter(Flight.route_id == route_id)
+    if aircraft_id:
+        query = query.filter(Flight.aircraft_id == aircraft_id)
+    if depart_from:
+        query = query.filter(Flight.depart_time >= day_bounds(depart_from)[0])
+    if depart_to:
+        query = query.filter(Flight.depart_time < day_bounds(depart_to)[1])
+    if cursor:
+        query = query.filter(keyset.rows_after((Flight.depart_time, Flight.id), cursor))
+    return query.order_by(Flight.depart_time, Flight.id).limit(limit + 1).all()
+
+
 def find_intermediate_airport(flight_id):
     # Tìm tất cả sân bay trung gian của một chuyến bay cụ thể
     intermediate_airports = Stopover.query.filter(Stopover.flight_id == flight_id).all()
@@ -208,18 +291,49 @@ def add_aircraft(name, airline_id, seat_data: dict):
     return new_aircraft
 
 
+@replica_reads
 def get_flights_by_route_and_date(
     route_id, depart_date, page=1, per_page=app.config["PAGE_SIZE"]
 ):
-    route = get_route_by_id(route_id)
-    if not route:
-        return None
-    if not route.flights:
-        return None
-    return Flight.query.filter(
-        Flight.route_id == route_id,
-        db.func.date(Flight.depart_time) == depart_date,
-    ).paginate(page=page, per_page=per_page)
+    if app.config["FLIGHT_SEARCH_INDEX"]:
+        return flight_search_index.paginate(route_id, depart_date, page, per_page)
+
+    start, end = day_bounds(depart_date)
+    return (
+        Flight.query.options(*flight_card_options())
+        .filter(
+            Flight.route_id == route_id,
+            Flight.depart_time >= start,
+            Flight.depart_time < end,
+        )
+        .order_by(Flight.depart_time, Flight.id)
+        .paginate(page=page, per_page=per_page)
+    )
+
+
+@replica_reads
+def get_itineraries(
+    depart_airport_id,
+    arrive_airport_id,
+    depart_date,
+    page=1,
+    per_page=app.config["PAGE_SIZE"],
+):
+    """
+    Search the connecting flights between 2 airports over the route graph
+    """
+    itineraries = timetable.find_itineraries(
+        depart_airport_id,
+        arrive_airport_id,
+        depart_date,
+        max_legs=app.config["ITINERARY_MAX_LEGS"],
+        min_connection=get_min_stopover_duration(),
+        max_connection=min(
+            get_max_stopover_duration(), app.config["ITINERARY_MAX_CONNECTION"]
+        ),
+        max_results=app.config["ITINERARY_MAX_RESULTS"],
+    )
+    return ItineraryPagination(page=page, per_page=per_page, itineraries=itineraries)
 
 
 def add_flight_seat(flight_id, aircraft_seat_id, price, currency="VND"):
@@ -234,33 +348,265 @@ def add_flight_seat(flight_id, aircraft_seat_id, price, currency="VND"):
     return new_flight_seat
 
 
-def revenue_sum(list):
-    sum = 0
-    for l in list:
-        sum += l[-1]
-    return sum
+def refresh_seat_counts(flight_ids):
+    """
+    Recompute the seat counts of the flights from the status of their seats, after
+    their seats are added or edited, the caller commits. Return the number of counts
+    that changed
+    """
+    is_held = case((FlightSeat.status == SeatStatus.HELD, 1), else_=0)
+    is_sold = case((FlightSeat.status == SeatStatus.SOLD, 1), else_=0)
+    rows = (
+        db.session.query(
+            FlightSeat.flight_id,
+            AircraftSeat.seat_class_id,
+            func.count(FlightSeat.id),
+            func.sum(is_held),
+            func.sum(is_sold),
+            func.min(FlightSeat.price),
+            func.min(FlightSeat.currency),
+        )
+        .join(AircraftSeat, AircraftSeat.id == FlightSeat.aircraft_seat_id)
+        .filter(FlightSeat.flight_id.in_(flight_ids))
+        .group_by(FlightSeat.flight_id, AircraftSeat.seat_class_id)
+    )
+    expected = {
+        (flight_id, seat_class_id): {
+            "total": total,
+            "held": int(held),
+            "sold": int(sold),
+            "price": price,
+            "currency": currency,
+        }
+        for flight_id, seat_class_id, total, held, sold, price, currency in rows
+    }
+
+    changed = 0
+    for count in FlightSeatCount.query.filter(
+        FlightSeatCount.flight_id.in_(flight_ids)
+    ):
+        values = expected.pop((count.flight_id, count.seat_class_id), None)
+        if values is None:
+            db.session.delete(count)
+        elif any(getattr(count, name) != value for name, value in values.items()):
+            for name, value in values.items():
+                setattr(count, name, value)
+        else:
+            continue
+        changed += 1
+    for (flight_id, seat_class_id), values in expected.items():
+        db.session.add(
+            FlightSeatCount(flight_id=flight_id, seat_class_id=seat_class_id, **values)
+        )
+        changed += 1
+    return changed
+
+
+@replica_reads
+def get_seat_classes_availability(flight_ids):
+    """
+    Read the seat classes info of many flights from their seat counts, sold and held
+    seats are not remaining. A hold is counted until the sweeper expires it\n
+    Return: {flight_id: {seat_class_id: {class_name, price, currency, remaining}}}
+    """
+    if not flight_ids:
+        return {}
+
+    rows = (
+        db.session.query(
+            FlightSeatCount.flight_id,
+            FlightSeatCount.seat_class_id,
+            SeatClass.name,
+            FlightSeatCount.price,
+            FlightSeatCount.currency,
+            FlightSeatCount.total - FlightSeatCount.held - FlightSeatCount.sold,
+        )
+        .join(SeatClass, SeatClass.id == FlightSeatCount.seat_class_id)
+        .filter(FlightSeatCount.flight_id.in_(flight_ids))
+        .order_by(FlightSeatCount.flight_id, FlightSeatCount.seat_class_id)
+        .all()
+    )
+
+    availability = {flight_id: {} for flight_id in flight_ids}
+    for flight_id, seat_class_id, class_name, price, currency, remaining in rows:
+        availability[flight_id][seat_class_id] = {
+            "class_name": class_name,
+            "price": price,
+            "currency": currency,
+            "remaining": remaining,
+        }
+    return availability
+
+
+def is_available_clause():
+    """
+    Flight seat is neither sold nor held, a held seat is available again once its hold
+    is over even if the sweeper hasn't run yet
+    """
+    return or_(
+        FlightSeat.status == SeatStatus.AVAILABLE,
+        and_(FlightSeat.status == SeatStatus.HELD, FlightSeat.held_until <= dt.now()),
+    )
+
+
+@replica_reads
+def get_seat_map(flight_id, seat_class_id=None):
+    """
+    Get the seats of a flight as plain dicts so templates can render them without lazy loads\n
+    Return: [{id, seat_name, seat_class_id, class_name, price, currency, is_sold, is_held}]
+    """
+    query = (
+        db.session.query(
+            FlightSeat.id,
+            AircraftSeat.seat_name,
+            AircraftSeat.seat_class_id,
+            SeatClass.name,
+            FlightSeat.price,
+            FlightSeat.currency,
+            FlightSeat.status,
+            FlightSeat.held_until,
+        )
+        .join(AircraftSeat, AircraftSeat.id == FlightSeat.aircraft_seat_id)
+        .join(SeatClass, SeatClass.id == AircraftSeat.seat_class_id)
+        .filter(FlightSeat.flight_id == flight_id)
+    )
+    if seat_class_id is not None:
+        query = query.filter(AircraftSeat.seat_class_id == seat_class_id)
+    query = query.order_by(FlightSeat.id)
+
+    now = dt.now()
+    return [
+        {
+            "id": id,
+            "seat_name": seat_name,
+            "seat_class_id": seat_class_id,
+            "class_name": class_name,
+            "price": price,
+            "currency": currency,
+            "is_sold": status == SeatStatus.SOLD,
+            "is_held": status == SeatStatus.HELD and held_until > now,
+        }
+        for id, seat_name, seat_class_id, class_name, price, currency, status, held_until in query
+    ]
+
+
+@replica_reads
+def load_cheapest_fares(route_id, start_date, end_date):
+    """
+    Get the cheapest available (unsold and not held) seat price per seat class of each
+    day in one grouped query\n
+    Return: {date: {seat_class_id: {class_name, price, currency}}}
+    """
+    start, _ = day_bounds(start_date)
+    _, end = day_bounds(end_date)
+    depart_date = func.date(Flight.depart_time)
+    rows = (
+        db.session.query(
+            depart_date,
+            AircraftSeat.seat_class_id,
+            SeatClass.name,
+            func.min(FlightSeat.price),
+            func.min(FlightSeat.currency),
+        )
+        .join(FlightSeat, FlightSeat.flight_id == Flight.id)
+        .join(AircraftSeat, AircraftSeat.id == FlightSeat.aircraft_seat_id)
+        .join(SeatClass, SeatClass.id == AircraftSeat.seat_class_id)
+        .filter(
+            Flight.route_id == route_id,
+            Flight.depart_time >= start,
+            Flight.depart_time < end,
+            is_available_clause(),
+        )
+        .group_by(depart_date, AircraftSeat.seat_class_id, SeatClass.name)
+        .order_by(depart_date, AircraftSeat.seat_class_id)
+        .all()
+    )
+
+    fares = {}
+    for date, seat_class_id, class_name, price, currency in rows:
+        # SQLite returns the date as a string
+        if isinstance(date, str):
+            date = dt.strptime(date, "%Y-%m-%d").date()
+        fares.setdefault(date, {})[seat_class_id] = {
+            "class_name": class_name,
+            "price": price,
+            "currency": currency,
+        }
+    return fares
+
+
+def get_fare_calendar(route_id, depart_date, days):
+    """
+    Get the cheapest fares of the days around depart_date (± days)
+    """
+    dates = [depart_date + timedelta(days=i) for i in range(-days, days + 1)]
+    return fare_calendar_cache.get_many(route_id, dates, load_cheapest_fares)
 
 
-def revenue_stats_route_by_time(year=None, month=None):
+@replica_reads
+def revenue_sum(year, month):
+    return (
+        db.session.query(func.coalesce(func.sum(RevenueRollup.revenue), 0))
+        .filter(RevenueRollup.year == year, RevenueRollup.month == month)
+        .scalar()
+    )
+
+
+@replica_reads
+def revenue_stats_route_by_time(year, month):
+    """
+    Get the route name, flight count and revenue of each route in the month from the
+    revenue rollup (a row per route and day)
+    """
     AirportDepart = aliased(Airport)
     AirportArrive = aliased(Airport)
 
     return (
         db.session.query(
-            func.concat(AirportDepart.name, " - ", AirportArrive.name),
-            func.count(Flight.id.distinct()),
-            func.sum(Payment.amount),
+            AirportDepart.name + " - " + AirportArrive.name,
+            func.sum(RevenueRollup.flight_count),
+            func.sum(RevenueRollup.revenue),
         )
-        .join(Reservation, Reservation.id == Payment.reservation_id)
-        .join(FlightSeat, FlightSeat.id == Reservation.flight_seat_id)
-        .join(Flight, Flight.id == FlightSeat.flight_id)
-        .join(Route, Route.id == Flight.route_id)
+        .join(Route, Route.id == RevenueRollup.route_id)
         .join(AirportDepart, AirportDepart.id == Route.depart_airport_id)
         .join(AirportArrive, AirportArrive.id == Route.arrive_airport_id)
-        .filter(
-            func.extract("year", Payment.created_at) == year,
-            func.extract("month", Payment.created_at) == month,
-        )
-        .group_by(AirportDepart.name, AirportArrive.name)
+        .filter(RevenueRollup.year == year, RevenueRollup.month == month)
+        .group_by(Route.id, AirportDepart.name, AirportArrive.name)
         .all()
     )
+
+
+@replica_reads
+def stream_revenue_by_route(year=None, month=None, batch_size=1000):
+    """
+    Stream the revenue rollup by route and day with a server-side cursor
+    """
+    AirportDepart = aliased(Airport)
+    AirportArrive = aliased(Airport)
+    query = (
+        select(
+            RevenueRollup.year,
+            RevenueRollup.month,
+            RevenueRollup.day,
+            RevenueRollup.route_id,
+            AirportDepart.code.label("depart_airport"),
+            AirportArrive.code.label("arrive_airport"),
+            RevenueRollup.revenue,
+            RevenueRollup.payment_count,
+            RevenueRollup.flight_count,
+        )
+        .join(Route, Route.id == RevenueRollup.route_id)
+        .join(AirportDepart, AirportDepart.id == Route.depart_airport_id)
+        .join(AirportArrive, AirportArrive.id == Route.arrive_airport_id)
+        .order_by(
+            RevenueRollup.year,
+            RevenueRollup.month,
+            RevenueRollup.day,
+            RevenueRollup.route_id,
+        )
+    )
+    if year:
+        query = query.where(RevenueRollup.year == year)
+    if month:
+        query = query.where(RevenueRollup.month == month)
+    return db.session.execute(query.execution_options(yield_per=batch_size))
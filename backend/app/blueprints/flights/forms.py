@@ -31,6 +31,18 @@ class SearchFlightForm(FlaskForm):
         },
     )
     departure_date = DateField("Departure Date", validators=[DataRequired()])
+    flexible_days = SelectField(
+        "Flexible dates",
+        coerce=int,
+        choices=[
+            (0, "Exact date"),
+            (3, "± 3 days"),
+            (7, "± 7 days"),
+            (15, "± 15 days"),
+        ],
+        default=0,
+        render_kw={"class": "form-select"},
+    )
     submit = SubmitField("Search")
 
     def __init__(self, formdata=None, **kwargs):
@@ -38,15 +50,9 @@ class SearchFlightForm(FlaskForm):
         self.fill_airport_selects()
 
     def fill_airport_selects(self):
-        airports = dao.get_airports()
-        self.departure_airport.choices = [
-            (airport.id, f"{airport.name} ({airport.code}) - {airport.country.name}")
-            for airport in airports
-        ]
-        self.arrival_airport.choices = [
-            (airport.id, f"{airport.name} ({airport.code}) - {airport.country.name}")
-            for airport in airports
-        ]
+        choices = dao.get_airport_choices()
+        self.departure_airport.choices = choices
+        self.arrival_airport.choices = choices
 
     def validate(self, extra_validators=None):
         if not super().validate():
@@ -113,22 +119,12 @@ class FlightSchedulingForm(FlaskForm):
         self.fill_aircraft_selects()
 
     def fill_airport_selects(self):
-        airports = dao.get_airports()
-        self.departure_airport.choices = [
-            (airport.id, f"{airport.name} ({airport.code}) - {airport.country.name}")
-            for airport in airports
-        ]
-        self.arrival_airport.choices = [
-            (airport.id, f"{airport.name} ({airport.code}) - {airport.country.name}")
-            for airport in airports
-        ]
+        choices = dao.get_airport_choices()
+        self.departure_airport.choices = choices
+        self.arrival_airport.choices = choices
 
     def fill_aircraft_selects(self):
-        aircrafts = dao.get_aircrafts()
-        self.aircraft.choices = [
-            (aircraft.id, f"{aircraft.id} - {aircraft.name} ({aircraft.airline.name})")
-            for aircraft in aircrafts
-        ]
+        self.aircraft.choices = dao.get_aircraft_choices()
 
     def validate(self, extra_validators=None):
         if not super().validate():
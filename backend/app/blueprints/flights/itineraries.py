@@ -0,0 +1,206 @@
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from heapq import heappop, heappush
+from itertools import count
+from threading import Lock
+
+from flask_sqlalchemy.pagination import Pagination
+
+from app import app, db
+from .models import Route, Flight
+from .cache import day_bounds
+from .loaders import flight_card_options
+
+
+class Timetable:
+    """
+    In-memory graph of the routes and their upcoming flights, kept per worker.\n
+    - routes_from: {depart_airport_id: [(route_id, arrive_airport_id)]}\n
+    - departures: {route_id: sorted [(depart_time, arrive_time, flight_id)]}\n
+    It is loaded with 2 queries on first use and reloaded after TIMETABLE_TTL seconds,
+    so the flights scheduled, moved or deleted by the other workers are found.
+    add_route() and add_flight() update it incrementally and admin edits invalidate
+    it in the worker that made them.
+    """
+
+    def __init__(self):
+        self.routes_from = None
+        self.departures = None
+        self._loaded_at = None
+        self._version = 0
+        self._lock = Lock()
+
+    def load(self):
+        version = self._version
+        loaded_at = time.monotonic()
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        routes_from = {}
+        for route_id, depart_airport_id, arrive_airport_id in db.session.query(
+            Route.id, Route.depart_airport_id, Route.arrive_airport_id
+        ):
+            routes_from.setdefault(depart_airport_id, []).append(
+                (route_id, arrive_airport_id)
+            )
+        departures = {}
+        for route_id, depart_time, arrive_time, flight_id in (
+            db.session.query(
+                Flight.route_id, Flight.depart_time, Flight.arrive_time, Flight.id
+            )
+            .filter(Flight.depart_time >= today)
+            .order_by(Flight.depart_time, Flight.id)
+        ):
+            departures.setdefault(route_id, []).append(
+                (depart_time, arrive_time, flight_id)
+            )
+        with self._lock:
+            # Do not keep a timetable read before an invalidation
+            if version == self._version:
+                self.replace(routes_from, departures, loaded_at)
+        return routes_from, departures
+
+    def replace(self, routes_from, departures, loaded_at=None):
+        self.routes_from = routes_from
+        self.departures = departures
+        self._loaded_at = time.monotonic() if loaded_at is None else loaded_at
+
+    def ensure_loaded(self):
+        """
+        Return the (routes_from, departures) to search, loaded again if they expired
+        """
+        routes_from, departures = self.routes_from, self.departures
+        if (
+            routes_from is None
+            or departures is None
+            or time.monotonic() - self._loaded_at >= app.config["TIMETABLE_TTL"]
+        ):
+            return self.load()
+        return routes_from, departures
+
+    def add_route(self, route):
+        with self._lock:
+            if self.routes_from is not None:
+                self.routes_from.setdefault(route.depart_airport_id, []).append(
+                    (route.id, route.arrive_airport_id)
+                )
+
+    def add_flight(self, flight):
+        with self._lock:
+            if self.departures is not None:
+                insort(
+                    self.departures.setdefault(flight.route_id, []),
+                    (flight.depart_time, flight.arrive_time, flight.id),
+                )
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self.routes_from = None
+            self.departures = None
+
+    @staticmethod
+    def departures_between(departures, route_id, earliest, latest):
+        departures = departures.get(route_id, [])
+        i = bisect_left(departures, (earliest,))
+        while i < len(departures) and departures[i][0] <= latest:
+            yield departures[i]
+            i += 1
+
+    def find_itineraries(
+        self,
+        depart_airport_id,
+        arrive_airport_id,
+        depart_date,
+        max_legs,
+        min_connection,
+        max_connection,
+        max_results,
+    ):
+        """
+        Find the itineraries (lists of flight ids) of up to max_legs flights, earliest
+        arrival first, then the fewest legs.\n
+        The first flight departs on depart_date, each next flight is the earliest one of
+        the next route that leaves between min_connection and max_connection minutes
+        after the previous flight arrives. The partial itineraries are expanded in
+        arrival time order (a flight always lands after the previous one), so the
+        itineraries are found in the order of the results and the max_results first
+        ones are the earliest arrivals.
+        """
+        routes_from, departures = self.ensure_loaded()
+        start, end = day_bounds(depart_date)
+        min_connection = timedelta(minutes=min_connection)
+        max_connection = timedelta(minutes=max_connection)
+        queue = []
+        ties = count()
+
+        def push(airport_id, legs, visited):
+            key = (legs[-1][1], len(legs), legs[0][0], next(ties))
+            heappush(queue, (key, airport_id, legs, visited))
+
+        for route_id, next_airport_id in routes_from.get(depart_airport_id, []):
+            for leg in self.departures_between(
+                departures, route_id, start, end - timedelta.resolution
+            ):
+                push(next_airport_id, [leg], {depart_airport_id, next_airport_id})
+
+        itineraries = []
+        while queue and len(itineraries) < max_results:
+            _, airport_id, legs, visited = heappop(queue)
+            if airport_id == arrive_airport_id:
+                itineraries.append(legs)
+                continue
+            if len(legs) == max_legs:
+                continue
+            arrive_time = legs[-1][1]
+            for route_id, next_airport_id in routes_from.get(airport_id, []):
+                if next_airport_id in visited:
+                    continue
+                # The last leg must land at the destination
+                if len(legs) == max_legs - 1 and next_airport_id != arrive_airport_id:
+                    continue
+                leg = next(
+                    self.departures_between(
+                        departures,
+                        route_id,
+                        arrive_time + min_connection,
+                        arrive_time + max_connection,
+                    ),
+                    None,
+                )
+                if leg:
+                    push(next_airport_id, legs + [leg], visited | {next_airport_id})
+
+        return [[flight_id for _, _, flight_id in legs] for legs in itineraries]
+
+
+class ItineraryPagination(Pagination):
+    """
+    Paginate a list of itineraries (lists of flight ids), the flights of the page are
+    loaded with one query. The itineraries of a flight deleted since the timetable was
+    loaded are skipped
+    """
+
+    def _query_items(self):
+        itineraries = self._query_args["itineraries"][
+            self._query_offset : self._query_offset + self.per_page
+        ]
+        flight_ids = {flight_id for itinerary in itineraries for flight_id in itinerary}
+        if not flight_ids:
+            return []
+        flights = {
+            flight.id: flight
+            for flight in Flight.query.options(*flight_card_options()).filter(
+                Flight.id.in_(flight_ids)
+            )
+        }
+        return [
+            [flights[flight_id] for flight_id in itinerary]
+            for itinerary in itineraries
+            if all(flight_id in flights for flight_id in itinerary)
+        ]
+
+    def _query_count(self):
+        return len(self._query_args["itineraries"])
+
+
+timetable = Timetable()
@@ -0,0 +1,69 @@
+from sqlalchemy.orm import configure_mappers, joinedload, selectinload
+
+from . import models
+
+# Eager loading profiles of the pages: the relationships their templates render, loaded
+# with the rows of the page instead of a lazy SELECT per row. They are built on call
+# since the backrefs only exist once the mappers are configured.
+
+
+def airport_options():
+    """
+    The country of the airports, shown by str(airport) and the airport selects
+    """
+    return [joinedload(models.Airport.country)]
+
+
+def route_options():
+    """
+    The airports of the route and their country (str(airport) shows it)
+    """
+    configure_mappers()
+    return [
+        joinedload(models.Route.depart_airport).joinedload(models.Airport.country),
+        joinedload(models.Route.arrive_airport).joinedload(models.Airport.country),
+    ]
+
+
+def flight_card_options():
+    """
+    Flight cards of the search results and bookings: route, aircraft with its airline
+    and stopovers with their airport
+    """
+    configure_mappers()
+    return [
+        joinedload(models.Flight.route).options(*route_options()),
+        joinedload(models.Flight.aircraft).joinedload(models.Aircraft.airline),
+        selectinload(models.Flight.stopovers)
+        .joinedload(models.Stopover.airport)
+        .joinedload(models.Airport.country),
+    ]
+
+
+def flight_details_options():
+    """
+    Flight details page: the card relationships, the seats left are counted by
+    get_seat_classes_availability()
+    """
+    return flight_card_options()
+
+
+def flight_api_options(fields):
+    """
+    /api/v1/flights: only the relationships of the requested fields
+    """
+    configure_mappers()
+    options = []
+    if {"departure_airport", "arrival_airport"} & fields:
+        options.append(joinedload(models.Flight.route).options(*route_options()))
+    if "aircraft" in fields:
+        options.append(
+            joinedload(models.Flight.aircraft).joinedload(models.Aircraft.airline)
+        )
+    if "stopovers" in fields:
+        options.append(
+            selectinload(models.Flight.stopovers)
+            .joinedload(models.Stopover.airport)
+            .joinedload(models.Airport.country)
+        )
+    return options
@@ -9,7 +9,10 @@ from sqlalchemy import (
     Text,
     UniqueConstraint,
     CheckConstraint,
+    Index,
+    Enum,
 )
+from enum import Enum as BaseEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import backref
 from datetime import datetime as dt
@@ -112,7 +115,7 @@ class SeatClass(db.Model):
 class AircraftSeat(db.Model):
     __tablename__ = "aircraft_seats"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    aircraft_id = Column(Integer, ForeignKey("aircrafts.id"), nullable=False)
+    aircraft_id = Column(Integer, ForeignKey("aircrafts.id"), nullable=False, index=True)
     seat_class_id = Column(Integer, ForeignKey("seat_classes.id"), nullable=False)
     seat_name = Column(String(5), nullable=False)
 
@@ -126,22 +129,84 @@ class AircraftSeat(db.Model):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
 
+class SeatStatus(BaseEnum):
+    AVAILABLE = 1
+    HELD = 2
+    SOLD = 3
+
+    def __str__(self):
+        return self.name.title()
+
+
 class FlightSeat(db.Model):
     __tablename__ = "flight_seats"
-    __table_args__ = (UniqueConstraint("flight_id", "aircraft_seat_id"),)
+    __table_args__ = (
+        UniqueConstraint("flight_id", "aircraft_seat_id"),
+        Index("ix_flight_seats_flight_status", "flight_id", "status"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     flight_id = Column(Integer, ForeignKey("flights.id"), nullable=False)
     aircraft_seat_id = Column(Integer, ForeignKey("aircraft_seats.id"), nullable=True)
     price = Column(Double, nullable=False)
     currency = Column(VARCHAR(20), nullable=False)
+    # Denormalized from the reservations and payments of the seat by
+    # bookings.dao.refresh_seat_status() in the transaction of the booking writes.
+    # A hold is over at held_until, the sweeper sets the seat available again later
+    status = Column(
+        Enum(SeatStatus),
+        nullable=False,
+        default=SeatStatus.AVAILABLE,
+        server_default=SeatStatus.AVAILABLE.name,
+    )
+    held_until = Column(DateTime, nullable=True)
+    sold_reservation_id = Column(
+        Integer,
+        ForeignKey(
+            "reservations.id",
+            name="fk_flight_seats_sold_reservation_id",
+            use_alter=True,
+            ondelete="SET NULL",
+        ),
+        nullable=True,
+    )
 
     def __repr__(self):
         return f"FlightSeat({self.id}, Flight-{self.flight_id}, '{self.aircraft_seat.seat_name}', '{self.aircraft_seat.seat_class.name}', {self.price}-{self.currency})"
 
     def is_sold(self):
-        return next((r for r in self.reservations if r.is_paid()), None) is not None
+        return self.status == SeatStatus.SOLD
+
+    def is_held(self):
+        return self.status == SeatStatus.HELD and self.held_until > dt.now()
+
+    def is_available(self):
+        return not self.is_sold() and not self.is_held()
     
 
+class FlightSeatCount(db.Model):
+    """
+    Seats of a flight by class and how many are held or sold, moved along with the
+    FlightSeat.status by bookings.dao.refresh_seat_status()
+    """
+    __tablename__ = "flight_seat_counts"
+    flight_id = Column(Integer, ForeignKey("flights.id"), primary_key=True)
+    seat_class_id = Column(Integer, ForeignKey("seat_classes.id"), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    held = Column(Integer, nullable=False, default=0)
+    sold = Column(Integer, nullable=False, default=0)
+    # Cheapest seat of the class
+    price = Column(Double, nullable=False)
+    currency = Column(VARCHAR(20), nullable=False)
+
+    flight = relationship(
+        "Flight", backref=backref("seat_counts", lazy=True, cascade="all, delete")
+    )
+    seat_class = relationship("SeatClass", lazy=True)
+
+    def __repr__(self):
+        return f"FlightSeatCount(Flight-{self.flight_id}, SeatClass-{self.seat_class_id}, {self.total}, {self.held}, {self.sold})"
+
+
 class Route(db.Model):
     __tablename__ = "routes"
     __table_args__ = (
@@ -172,6 +237,9 @@ class Flight(db.Model):
     __tablename__ = "flights"
     __table_args__ = (
         CheckConstraint("depart_time < arrive_time", name="check_depart_time"),
+        Index("ix_flights_route_depart_time", "route_id", "depart_time"),
+        Index("ix_flights_depart_time_id", "depart_time", "id"),
+        Index("ix_flights_aircraft_depart_time", "aircraft_id", "depart_time", "id"),
     )
     id = Column(Integer, primary_key=True, autoincrement=True)
     route_id = Column(Integer, ForeignKey("routes.id"), nullable=True)
@@ -195,19 +263,7 @@ class Flight(db.Model):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
     def get_remaining_seatclasses_and_info(self):
-        seat_classes_prices = {}
-        for seat in self.seats:
-            seat_class_id = seat.aircraft_seat.seat_class_id
-            if seat_class_id not in seat_classes_prices:
-                seat_classes_prices[seat_class_id] = {
-                    "class_name": SeatClass.query.get(seat_class_id).name,
-                    "price": seat.price,
-                    "currency": seat.currency,
-                    "remaining": 0,
-                }
-            if not seat.is_sold():
-                seat_classes_prices[seat_class_id]["remaining"] += 1
-        return seat_classes_prices
+        return dao.get_seat_classes_availability([self.id])[self.id]
 
     def is_bookable_now(self):
         # Check if flight is departed
@@ -284,3 +340,5 @@ class Regulation(db.Model):
     key = Column(String(150), unique=True, nullable=False)
     value = Column(Integer, nullable=False)
     description = Column(Text, nullable=True)
+    # Bumped on every change so the workers can detect stale cached regulations
+    version = Column(Integer, nullable=False, default=0, server_default="0")
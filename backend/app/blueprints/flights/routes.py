@@ -2,42 +2,82 @@ from flask import render_template, jsonify, request, redirect, flash, url_for
 from datetime import datetime as dt
 
 
-from app import db
+from app import app, db
+from app.routing import replica_reads
 from . import flights_bp
 from app.blueprints.auth import decorators
 from . import dao
 from . import utils
+from . import api
 from .forms import FlightSchedulingForm, SearchFlightForm
 
 
 @flights_bp.route("/api/airlines", methods=["GET"])
 def get_airlines():
-    return jsonify([airline.to_dict() for airline in dao.get_airlines()])
+    return utils.cached_json_response("airlines", dao.get_airlines)
 
 
 @flights_bp.route("/api/seatclasses", methods=["GET"])
 def get_seatclasses():
-    return jsonify([seatclass.to_dict() for seatclass in dao.get_seat_classes()])
+    return utils.cached_json_response("seatclasses", dao.get_seat_classes)
 
 
 @flights_bp.route("/api/airports")
 def get_airports():
-    return jsonify([airport.to_dict() for airport in dao.get_airports()])
+    return utils.cached_json_response("airports", dao.get_airports)
 
 
 @flights_bp.route("/api/routes")
 def get_routes():
-    return jsonify([route.to_dict() for route in dao.get_routes()])
+    return utils.cached_json_response("routes", dao.get_routes)
 
 
 @flights_bp.route("/api/countries")
 def get_countries():
-    return jsonify([country.to_dict() for country in dao.get_countries()])
+    return utils.cached_json_response("countries", dao.get_countries)
 
 
 @flights_bp.route("/api/aircrafts")
 def get_aircrafts():
-    return jsonify([aircraft.to_dict() for aircraft in dao.get_aircrafts()])
+    return utils.cached_json_response("aircrafts", dao.get_aircrafts)
+
+
+@flights_bp.route("/api/v1/flights")
+@replica_reads
+def api_flights():
+    """
+    Flights in (depart_time, id) order, a page at a time. next_cursor (null on the last
+    page) fetches the next one, next is the same query with it
+    """
+    try:
+        query = api.parse_flights_args(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    flights = dao.get_flights_after(**query)
+    has_next = len(flights) > query["limit"]
+    flights = flights[: query["limit"]]
+
+    # Remaining seats of all flights in the page at once
+    availability = {}
+    if "availability" in query["fields"]:
+        availability = dao.get_seat_classes_availability(
+            [flight.id for flight in flights]
+        )
+
+    cursor = api.next_cursor(flights[-1]) if has_next else None
+    return jsonify(
+        data=[
+            api.flight_to_dict(flight, query["fields"], availability)
+            for flight in flights
+        ],
+        next_cursor=cursor,
+        next=(
+            url_for("flights.api_flights", **{**request.args, "cursor": cursor})
+            if cursor
+            else None
+        ),
+    )
 
 
 @flights_bp.route("/schedule", methods=["GET", "POST"])
@@ -132,17 +172,20 @@ def set_prices(id):
             dao.add_flight_seat(flight.id, seat.id, price)
 
         try:
+            dao.refresh_seat_counts([flight.id])
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             flash("Error setting prices!", "danger")
             return redirect(request.referrer)
+        dao.fare_calendar_cache.invalidate_flight(flight)
         flash("Flight prices set successfully!", "success")
         return redirect(url_for("flights.showFlight", id=flight.id))
     return render_template("flights/create_flight_seats.html", flight=flight)
 
 
 @flights_bp.route("/search/flight", methods=["GET"])
+@replica_reads
 def searchFlights():
     # Get params from request
     form = SearchFlightForm(request.form)
@@ -156,24 +199,72 @@ def searchFlights():
         return render_template("flights/search.html", form=form)
 
     # Get the route
+    page = request.args.get("page", default=1, type=int)
     route = dao.get_route_by_airports(departure_airport_id, arrival_airport_id)
     if not route:
-        # If the route does not exist, return an error message
-        flash("This route doesn't exist!", "warning")
-        return render_template("flights/search.html", form=form)
+        # If the route does not exist, search for connecting flights
+        return searchItineraries(
+            form, departure_airport_id, arrival_airport_id, depart_date, page
+        )
 
     # Get flights for the route
-    page = request.args.get("page", default=1, type=int)
     flights = dao.get_flights_by_route_and_date(route.id, depart_date, page)
 
     if not flights.items:
         # If there are no flights for the route, return an error message
         flash("Couldn't find any flights!", "warning")
 
+    # Load remaining seats of all flights in the page at once
+    seat_classes_availability = dao.get_seat_classes_availability(
+        [flight.id for flight in flights.items]
+    )
+
+    # Cheapest fares of the days around the departure date
+    flexible_days = min(
+        request.args.get("flexible_days", default=0, type=int),
+        app.config["FARE_CALENDAR_MAX_DAYS"],
+    )
+    fare_calendar = None
+    if flexible_days > 0:
+        fare_calendar = dao.get_fare_calendar(route.id, depart_date, flexible_days)
+
     return render_template(
         "flights/search.html",
         route=route,
         flights=flights,
+        fare_calendar=fare_calendar,
+        flexible_days=flexible_days,
+        seat_classes_availability=seat_classes_availability,
+        depart_date=depart_date,
+        search_time=dt.now(),
+        staff_min_booking_time=dao.get_staff_min_booking_time(),
+        customer_min_booking_time=dao.get_customer_min_booking_time(),
+        form=form,
+    )
+
+
+def searchItineraries(
+    form, departure_airport_id, arrival_airport_id, depart_date, page
+):
+    itineraries = dao.get_itineraries(
+        departure_airport_id, arrival_airport_id, depart_date, page
+    )
+    if not itineraries.items:
+        # If there are no connecting flights either, return an error message
+        flash("This route doesn't exist!", "warning")
+        return render_template("flights/search.html", form=form)
+
+    # Load remaining seats of all flights in the page at once
+    seat_classes_availability = dao.get_seat_classes_availability(
+        [flight.id for itinerary in itineraries.items for flight in itinerary]
+    )
+
+    return render_template(
+        "flights/search.html",
+        itineraries=itineraries,
+        depart_airport=dao.get_airport_by_id(departure_airport_id),
+        arrive_airport=dao.get_airport_by_id(arrival_airport_id),
+        seat_classes_availability=seat_classes_availability,
         depart_date=depart_date,
         search_time=dt.now(),
         staff_min_booking_time=dao.get_staff_min_booking_time(),
@@ -184,7 +275,7 @@ def searchFlights():
 
 @flights_bp.route("/flight/<id>", methods=["GET"])
 def showFlight(id):
-    flight = dao.get_flight_by_id(id)
+    flight = dao.get_flight_details(id)
     if not flight:
         flash("Flight not found!", "info")
         return redirect("/")
@@ -1,5 +1,6 @@
 from datetime import datetime
-from flask import flash
+from flask import flash, request
+from app import app
 from . import dao
 
 
@@ -11,6 +12,20 @@ def to_datetime(datetime_str):
     return datetime.strptime(datetime_str, "%Y-%m-%dT%H:%M")
 
 
+def cached_json_response(name, load):
+    """
+    Response of a /api reference endpoint from the worker cache, 304 Not Modified when
+    the client sends the ETag (or a Last-Modified date) of the current rows
+    """
+    entry = dao.api_response_cache.get(name, load)
+    response = app.response_class(entry["body"], mimetype="application/json")
+    response.set_etag(entry["etag"])
+    response.last_modified = entry["last_modified"]
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config["API_CACHE_MAX_AGE"]
+    return response.make_conditional(request)
+
+
 def validate_stopover_form(data):
     max_stopover_airports = dao.get_max_stopover_airports()
     min_stopover_duration = dao.get_min_stopover_duration()
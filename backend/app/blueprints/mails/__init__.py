@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+mails_bp = Blueprint("mails", __name__)
+
+from . import outbox
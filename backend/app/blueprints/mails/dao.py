@@ -0,0 +1,125 @@
+from datetime import timedelta
+from sqlalchemy import update, or_
+
+from .models import *
+from app import app, db
+
+
+def queue_mail(subject, sender, recipients, html):
+    mail = OutboxMail(
+        subject=subject,
+        sender=sender,
+        recipients=",".join(recipients),
+        html=html,
+    )
+    db.session.add(mail)
+    db.session.commit()
+    return mail
+
+
+def claim_mails(claim_token, batch_size, lease_seconds):
+    """
+    Claim a batch of due mails for claim_token and return them.\n
+    The candidates are selected first, then the UPDATE only takes the ones that are
+    still unclaimed (or whose lease has expired), so 2 workers never send the same mail.
+    """
+    now = dt.now()
+    claimable = (
+        OutboxMail.status == MailStatus.PENDING,
+        OutboxMail.next_attempt_at <= now,
+        or_(OutboxMail.claimed_until == None, OutboxMail.claimed_until < now),
+    )
+    mail_ids = [
+        id
+        for id, in db.session.query(OutboxMail.id)
+        .filter(*claimable)
+        .order_by(OutboxMail.next_attempt_at)
+        .limit(batch_size)
+    ]
+    if not mail_ids:
+        db.session.rollback()
+        return []
+    db.session.execute(
+        update(OutboxMail)
+        .where(OutboxMail.id.in_(mail_ids), *claimable)
+        .values(
+            claimed_by=claim_token,
+            claimed_until=now + timedelta(seconds=lease_seconds),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return (
+        OutboxMail.query.filter_by(claimed_by=claim_token, status=MailStatus.PENDING)
+        .order_by(OutboxMail.id)
+        .all()
+    )
+
+
+def mark_mail_sent(mail):
+    mail.status = MailStatus.SENT
+    mail.sent_at = dt.now()
+    mail.attempts += 1
+    mail.claimed_by = None
+    mail.claimed_until = None
+    db.session.commit()
+
+
+def mark_mail_failed(mail, error):
+    """
+    Retry the mail later with an exponential backoff, give up after MAIL_OUTBOX_MAX_ATTEMPTS
+    """
+    mail.attempts += 1
+    mail.last_error = str(error)
+    if mail.attempts >= app.config["MAIL_OUTBOX_MAX_ATTEMPTS"]:
+        mail.status = MailStatus.FAILED
+    else:
+        backoff = app.config["MAIL_OUTBOX_RETRY_BACKOFF"] * 2 ** (mail.attempts - 1)
+        mail.next_attempt_at = dt.now() + timedelta(seconds=backoff)
+    mail.claimed_by = None
+    mail.claimed_until = None
+    db.session.commit()
+
+
+def renew_lease(mail, claim_token, lease_seconds):
+    """
+    Extend the lease of a claimed mail right before it is sent.\n
+    Return False if the lease has expired: another worker may have claimed the mail
+    since, so it must not be sent
+    """
+    now = dt.now()
+    result = db.session.execute(
+        update(OutboxMail)
+        .where(
+            OutboxMail.id == mail.id,
+            OutboxMail.status == MailStatus.PENDING,
+            OutboxMail.claimed_by == claim_token,
+            OutboxMail.claimed_until >= now,
+        )
+        .values(claimed_until=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def release_mail(mail, claim_token):
+    """
+    Give the mail back to the queue without counting an attempt, unless another worker
+    has claimed it since
+    """
+    db.session.execute(
+        update(OutboxMail)
+        .where(OutboxMail.id == mail.id, OutboxMail.claimed_by == claim_token)
+        .values(claimed_by=None, claimed_until=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def count_pending_mails():
+    return OutboxMail.query.filter_by(status=MailStatus.PENDING).count()
+
+
+def count_failed_mails():
+    return OutboxMail.query.filter_by(status=MailStatus.FAILED).count()
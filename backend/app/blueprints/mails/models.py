@@ -0,0 +1,45 @@
+from enum import Enum as BaseEnum
+from sqlalchemy import Column, Integer, String, Text, Enum, DateTime, Index
+from sqlalchemy.dialects import mysql
+from datetime import datetime as dt
+
+from app import db
+
+
+class MailStatus(BaseEnum):
+    PENDING = 1
+    SENT = 2
+    FAILED = 3
+
+    def __str__(self):
+        return self.name.title()
+
+
+class OutboxMail(db.Model):
+    """
+    Rendered email waiting to be sent by the outbox workers.\n
+    A worker claims a batch by writing its claim token and a lease (claimed_until),
+    a failed send is retried at next_attempt_at until MAIL_OUTBOX_MAX_ATTEMPTS.
+    """
+
+    __tablename__ = "outbox_mails"
+    __table_args__ = (
+        Index("ix_outbox_mails_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    subject = Column(String(255), nullable=False)
+    sender = Column(String(120), nullable=False)
+    # Comma separated
+    recipients = Column(Text, nullable=False)
+    html = Column(Text().with_variant(mysql.MEDIUMTEXT(), "mysql"), nullable=False)
+    status = Column(Enum(MailStatus), nullable=False, default=MailStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=dt.now)
+    next_attempt_at = Column(DateTime, nullable=False, default=dt.now)
+    claimed_by = Column(String(36), nullable=True)
+    claimed_until = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"OutboxMail('{self.id}', '{self.subject}', '{self.recipients}', '{self.status}')"
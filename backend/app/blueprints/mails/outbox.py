@@ -0,0 +1,196 @@
+import smtplib
+import time
+import uuid
+from collections import deque
+from threading import Thread, Event, Lock
+
+import click
+from flask_mail import Message
+
+from app import app, db, mail
+from . import mails_bp
+from . import dao
+
+
+class OutboxMetrics:
+    """
+    Send latency of the mails sent by this worker: queued (created_at to sent) and the
+    SMTP send time, over the last 1000 mails
+    """
+
+    def __init__(self, size=1000):
+        self.sent = 0
+        self.failed = 0
+        self.queue_latencies = deque(maxlen=size)
+        self.send_latencies = deque(maxlen=size)
+        self._lock = Lock()
+
+    def add_sent(self, queue_latency, send_latency):
+        with self._lock:
+            self.sent += 1
+            self.queue_latencies.append(queue_latency)
+            self.send_latencies.append(send_latency)
+
+    def add_failed(self):
+        with self._lock:
+            self.failed += 1
+
+    def stats(self):
+        with self._lock:
+            queue_latencies = sorted(self.queue_latencies)
+            send_latencies = sorted(self.send_latencies)
+        return {
+            "queue_depth": dao.count_pending_mails(),
+            "dead": dao.count_failed_mails(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "queue_latency_p50": percentile(queue_latencies, 50),
+            "queue_latency_p99": percentile(queue_latencies, 99),
+            "send_latency_p50": percentile(send_latencies, 50),
+            "send_latency_p99": percentile(send_latencies, 99),
+        }
+
+
+class OutboxWorker(Thread):
+    """
+    Daemon thread that sends the due mails in batches of MAIL_OUTBOX_BATCH_SIZE over one
+    SMTP connection per batch. It waits MAIL_OUTBOX_POLL_INTERVAL seconds between two
+    empty polls, or until a mail is queued by this process.
+    """
+
+    def __init__(self, index, wake_up):
+        super().__init__(name=f"mail-outbox-{index}", daemon=True)
+        self.claim_token = str(uuid.uuid4())
+        self.wake_up = wake_up
+
+    def run(self):
+        while True:
+            with app.app_context():
+                try:
+                    sent = send_due_mails(self.claim_token)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Mail outbox worker failed: {e}")
+                    sent = 0
+            if not sent:
+                self.wake_up.wait(app.config["MAIL_OUTBOX_POLL_INTERVAL"])
+                self.wake_up.clear()
+
+
+class OutboxPool:
+    def __init__(self):
+        self.workers = []
+        self.wake_up = Event()
+        self._lock = Lock()
+
+    def start_once(self):
+        with self._lock:
+            if not self.workers:
+                self.workers = [
+                    OutboxWorker(i, self.wake_up)
+                    for i in range(app.config["MAIL_OUTBOX_WORKERS"])
+                ]
+                for worker in self.workers:
+                    worker.start()
+
+    def notify(self):
+        self.wake_up.set()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def build_message(outbox_mail):
+    return Message(
+        subject=outbox_mail.subject,
+        sender=outbox_mail.sender,
+        recipients=outbox_mail.recipients.split(","),
+        html=outbox_mail.html,
+    )
+
+
+def send_due_mails(claim_token=None, batch_size=None):
+    """
+    Claim a batch of due mails and send them over one SMTP connection.\n
+    The lease of each mail is renewed right before it is sent, a mail whose lease has
+    expired is skipped since another worker may be sending it. A mail that fails is
+    retried later, if the connection drops the mail counts an attempt and the rest of
+    the batch is released for the next poll. Return the number of sent mails
+    """
+    claim_token = claim_token or str(uuid.uuid4())
+    batch_size = batch_size or app.config["MAIL_OUTBOX_BATCH_SIZE"]
+    lease = app.config["MAIL_OUTBOX_LEASE"]
+    outbox_mails = dao.claim_mails(claim_token, batch_size, lease)
+    if not outbox_mails:
+        return 0
+
+    sent = 0
+    try:
+        with mail.connect() as connection:
+            for i, outbox_mail in enumerate(outbox_mails):
+                if not dao.renew_lease(outbox_mail, claim_token, lease):
+                    continue
+                start = time.perf_counter()
+                try:
+                    connection.send(build_message(outbox_mail))
+                except smtplib.SMTPServerDisconnected as e:
+                    # The mail may be the one dropping the connection
+                    dao.mark_mail_failed(outbox_mail, e)
+                    outbox_metrics.add_failed()
+                    for unsent_mail in outbox_mails[i + 1 :]:
+                        dao.release_mail(unsent_mail, claim_token)
+                    break
+                except Exception as e:
+                    dao.mark_mail_failed(outbox_mail, e)
+                    outbox_metrics.add_failed()
+                    continue
+                send_latency = time.perf_counter() - start
+                dao.mark_mail_sent(outbox_mail)
+                outbox_metrics.add_sent(
+                    (outbox_mail.sent_at - outbox_mail.created_at).total_seconds(),
+                    send_latency,
+                )
+                sent += 1
+    except (smtplib.SMTPException, OSError) as e:
+        # Couldn't connect, retry the whole batch later
+        for outbox_mail in outbox_mails:
+            if outbox_mail.claimed_by == claim_token:
+                dao.mark_mail_failed(outbox_mail, e)
+                outbox_metrics.add_failed()
+    return sent
+
+
+def send_mail(subject, recipients, html, sender="noreply@6789lacachbonanhsong.com"):
+    """
+    Queue a rendered email in the outbox, it is sent by the worker pool.\n
+    Set MAIL_SUPPRESS_SEND to keep the sent messages in memory (mail.record_messages())
+    or point MAIL_SERVER/MAIL_PORT to a local debugging SMTP server
+    (python -m aiosmtpd -n -l localhost:1025).
+    """
+    outbox_mail = dao.queue_mail(subject, sender, recipients, html)
+    outbox_pool.notify()
+    return outbox_mail
+
+
+outbox_metrics = OutboxMetrics()
+outbox_pool = OutboxPool()
+
+
+@mails_bp.before_app_request
+def start_outbox_pool():
+    if app.config["MAIL_OUTBOX_WORKERS"] > 0 and not outbox_pool.workers:
+        outbox_pool.start_once()
+
+
+@mails_bp.cli.command("send")
+@click.option("--batch-size", type=int, default=None)
+def send_mails_command(batch_size):
+    """Send all the due mails of the outbox once (e.g. from a cron job)"""
+    total = 0
+    while sent := send_due_mails(batch_size=batch_size):
+        total += sent
+    click.echo(f"Sent {total} mails")
+    click.echo(outbox_metrics.stats())
@@ -1,14 +1,24 @@
-from flask import render_template, redirect, url_for
+import os
+from flask import render_template, redirect, url_for, request, jsonify, abort
+from flask_login import current_user, login_required
 
 # Import the blueprint instance from the `__init__.py`
 from . import main_bp
+from app import app, db
+from app import pool
+from app.routing import replica_router
+from app.profiler import query_profiler
+from app.blueprints.auth.models import UserRole
 from app.blueprints.flights import forms
+from app.blueprints.flights.cache import regulation_cache, reference_data_cache
+from app.blueprints.flights.cache import api_response_cache, flight_search_index
+from app.blueprints.bookings.holds import hold_metrics
+from app.blueprints.mails.outbox import outbox_metrics
 
 
 @main_bp.route("/", methods=["GET"])
 def home():
     form = forms.SearchFlightForm()
-    form.fill_airport_selects()
 
     if form.validate_on_submit():
         return redirect(
@@ -25,3 +35,44 @@ def home():
 @main_bp.route("/about")
 def about():
     return render_template("main/about.html")
+
+
+@main_bp.route("/metrics")
+def metrics():
+    """
+    Metrics of this worker process, for the admins or a scraper sending METRICS_TOKEN
+    """
+    token = app.config["METRICS_TOKEN"]
+    if not token or request.headers.get("Authorization") != f"Bearer {token}":
+        if not current_user.is_authenticated or current_user.role != UserRole.ADMIN:
+            abort(403)
+    return jsonify(
+        pid=os.getpid(),
+        db_pool=pool.pool_stats(db.engine),
+        db_routing=replica_router.stats(),
+        regulation_cache=regulation_cache.stats(),
+        reference_data_cache=reference_data_cache.stats(),
+        api_response_cache=api_response_cache.stats(),
+        flight_search_index=flight_search_index.stats(),
+        seat_holds=hold_metrics.stats(),
+        mail_outbox=outbox_metrics.stats(),
+    )
+
+
+@main_bp.route("/_debug/requests")
+@login_required
+def debug_requests():
+    """
+    SQL profiles of the last requests of this worker, for the staff, when
+    SQL_PROFILER_ENABLED
+    """
+    if not query_profiler.enabled:
+        abort(404)
+    if current_user.role == UserRole.CUSTOMER:
+        abort(403)
+    return render_template(
+        "main/debug_requests.html",
+        requests=query_profiler.recent(),
+        threshold=query_profiler.threshold,
+        pid=os.getpid(),
+    )
@@ -0,0 +1,83 @@
+import click
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from app import db
+from . import main_bp
+
+
+def get_missing_indexes(engine):
+    """
+    The indexes declared on the models but missing from the existing tables of the
+    database, db.create_all() only creates them with new tables
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing.extend(
+            index
+            for index in sorted(table.indexes, key=lambda index: index.name)
+            if index.name not in existing
+        )
+    return missing
+
+
+def get_missing_columns(engine):
+    """
+    The columns declared on the models but missing from the existing tables of the
+    database, db.create_all() only creates them with new tables
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing.extend(
+            column for column in table.columns if column.name not in existing
+        )
+    return missing
+
+
+def add_column_ddl(column, engine):
+    table = engine.dialect.identifier_preparer.format_table(column.table)
+    return f"ALTER TABLE {table} ADD COLUMN {CreateColumn(column).compile(engine)}"
+
+
+@main_bp.cli.command("create-columns")
+@click.option("--sql", is_flag=True, help="Print the DDL instead of running it")
+def create_columns_command(sql):
+    """Add the columns of the models missing from the existing tables"""
+    engine = db.engine
+    missing = get_missing_columns(engine)
+    for column in missing:
+        ddl = add_column_ddl(column, engine)
+        if sql:
+            click.echo(f"{ddl};")
+        else:
+            click.echo(f"Adding {column.name} to {column.table.name}")
+            with engine.begin() as conn:
+                conn.exec_driver_sql(ddl)
+    if not sql:
+        click.echo(f"Added {len(missing)} columns")
+
+
+@main_bp.cli.command("create-indexes")
+@click.option("--sql", is_flag=True, help="Print the DDL instead of running it")
+def create_indexes_command(sql):
+    """Create the indexes of the models missing from the database"""
+    engine = db.engine
+    missing = get_missing_indexes(engine)
+    for index in missing:
+        if sql:
+            click.echo(f"{CreateIndex(index).compile(engine)};")
+        else:
+            click.echo(f"Creating {index.name} on {index.table.name}")
+            index.create(engine)
+    if not sql:
+        click.echo(f"Created {len(missing)} indexes")
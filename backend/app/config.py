@@ -2,6 +2,7 @@ import os
 from urllib.parse import quote
 from dotenv import load_dotenv
 import json
+from functools import cache
 from pathlib import Path
 
 load_dotenv()
@@ -32,7 +33,37 @@ class FlaskConfig:
     # SQLALCHEMY_DATABASE_URI = os.getenv("SQLITE_URI")
     SQLALCHEMY_DATABASE_URI = MySQLConfig.DB_URI
     # SQLALCHEMY_DATABASE_URI = MySQLConfig.DB_URI
-    SQLALCHEMY_TRACK_MODIFICATIONS = True
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool of each worker process, set per environment
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    # Seconds a request waits for a connection before failing
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 10))
+    # Seconds before a connection is replaced, below MySQL's wait_timeout
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    # Check connections on checkout so stale ones are replaced instead of failing
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() == "true"
+    # Read replicas (comma separated URIs) used by the @replica_reads DAO calls
+    DB_REPLICA_URIS = [
+        uri for uri in os.getenv("DB_REPLICA_URIS", "").split(",") if uri
+    ]
+    SQLALCHEMY_BINDS = {
+        f"replica_{i}": uri for i, uri in enumerate(DB_REPLICA_URIS, start=1)
+    }
+    # Seconds of lag above which a replica isn't used
+    DB_REPLICA_MAX_LAG = int(os.getenv("DB_REPLICA_MAX_LAG", 5))
+    DB_REPLICA_LAG_CHECK_INTERVAL = int(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", 5))
+    # Seconds a user reads from the primary after writing something
+    DB_REPLICA_STICKY_SECONDS = int(os.getenv("DB_REPLICA_STICKY_SECONDS", 10))
+    # Lets a scraper read /metrics with "Authorization: Bearer <token>"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    # Per request SQL profiling (query count, DB time, N+1 patterns), for development
+    SQL_PROFILER_ENABLED = os.getenv("SQL_PROFILER_ENABLED", "False").lower() == "true"
+    # Times a SELECT runs in a request before it is reported as an N+1
+    SQL_PROFILER_N_PLUS_ONE = int(os.getenv("SQL_PROFILER_N_PLUS_ONE", 5))
+    # Requests kept by each worker for /_debug/requests
+    SQL_PROFILER_HISTORY = int(os.getenv("SQL_PROFILER_HISTORY", 100))
 
     # Flask-Mail Configuration
     MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")  # SMTP server address
@@ -46,8 +77,74 @@ class FlaskConfig:
     MAIL_DEFAULT_SENDER = os.getenv(
         "MAIL_DEFAULT_SENDER", MAIL_USERNAME
     )  # Default sender email address
+    MAIL_SUPPRESS_SEND = os.getenv("MAIL_SUPPRESS_SEND", "False").lower() == "true"
+
+    # Mail outbox: worker threads per process, 0 leaves the sending to 'flask mails send'
+    MAIL_OUTBOX_WORKERS = int(os.getenv("MAIL_OUTBOX_WORKERS", 2))
+    MAIL_OUTBOX_BATCH_SIZE = int(os.getenv("MAIL_OUTBOX_BATCH_SIZE", 50))
+    MAIL_OUTBOX_POLL_INTERVAL = int(os.getenv("MAIL_OUTBOX_POLL_INTERVAL", 5))
+    # Seconds a claimed batch stays reserved to its worker
+    MAIL_OUTBOX_LEASE = int(os.getenv("MAIL_OUTBOX_LEASE", 300))
+    MAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("MAIL_OUTBOX_MAX_ATTEMPTS", 5))
+    # Seconds before the first retry, doubled after each failed attempt
+    MAIL_OUTBOX_RETRY_BACKOFF = int(os.getenv("MAIL_OUTBOX_RETRY_BACKOFF", 30))
 
     FLASK_ADMIN_SWATCH = "lux"
+    # CLI tools and seeders can skip loading the admin views
+    ADMIN_ENABLED = os.getenv("ADMIN_ENABLED", "True").lower() == "true"
+
+    # Seconds before a worker checks whether the cached regulations are stale
+    REGULATION_CACHE_TTL = int(os.getenv("REGULATION_CACHE_TTL", 60))
+    # Seconds before a worker reloads the cached airport, aircraft, country and airline
+    # choices, the worker serving an admin edit reloads them at once
+    REFERENCE_DATA_CACHE_TTL = int(os.getenv("REFERENCE_DATA_CACHE_TTL", 300))
+    # Seconds before a worker rebuilds the cached /api reference responses, and the
+    # max-age the browsers may reuse them without asking (then revalidated with the ETag)
+    API_CACHE_TTL = int(os.getenv("API_CACHE_TTL", 300))
+    API_CACHE_MAX_AGE = int(os.getenv("API_CACHE_MAX_AGE", 60))
+    # Flights per page of /api/v1/flights, a client may ask up to API_MAX_PAGE_SIZE
+    API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", 100))
+    API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", 1000))
+    # Serve flight searches from the in-memory (route, date) index, its entries are
+    # reloaded after FLIGHT_SEARCH_INDEX_TTL seconds and at most
+    # FLIGHT_SEARCH_INDEX_MAX_ENTRIES are kept per worker
+    FLIGHT_SEARCH_INDEX = os.getenv("FLIGHT_SEARCH_INDEX", "False").lower() == "true"
+    FLIGHT_SEARCH_INDEX_TTL = int(os.getenv("FLIGHT_SEARCH_INDEX_TTL", 60))
+    FLIGHT_SEARCH_INDEX_MAX_ENTRIES = int(
+        os.getenv("FLIGHT_SEARCH_INDEX_MAX_ENTRIES", 10000)
+    )
+
+    # Connecting flights search
+    ITINERARY_MAX_LEGS = int(os.getenv("ITINERARY_MAX_LEGS", 3))
+    ITINERARY_MAX_CONNECTION = int(os.getenv("ITINERARY_MAX_CONNECTION", 24 * 60))
+    ITINERARY_MAX_RESULTS = int(os.getenv("ITINERARY_MAX_RESULTS", 500))
+    # Seconds before a worker reloads its timetable of the routes and upcoming flights
+    TIMETABLE_TTL = int(os.getenv("TIMETABLE_TTL", 60))
+
+    # Flexible dates search
+    FARE_CALENDAR_MAX_DAYS = int(os.getenv("FARE_CALENDAR_MAX_DAYS", 15))
+    FARE_CALENDAR_CACHE_TTL = int(os.getenv("FARE_CALENDAR_CACHE_TTL", 300))
+
+    # Minutes an unpaid reservation holds its seat, by the role of its author
+    SEAT_HOLD_MINUTES = {
+        "ADMIN": int(os.getenv("ADMIN_SEAT_HOLD_MINUTES", 24 * 60)),
+        "FLIGHT_MANAGER": int(os.getenv("FLIGHT_MANAGER_SEAT_HOLD_MINUTES", 24 * 60)),
+        "SALES_EMPLOYEE": int(os.getenv("SALES_EMPLOYEE_SEAT_HOLD_MINUTES", 24 * 60)),
+        "CUSTOMER": int(os.getenv("CUSTOMER_SEAT_HOLD_MINUTES", 30)),
+    }
+    # Seconds between two sweeps of the expired holds, 0 disables the sweeper thread
+    SEAT_HOLD_SWEEP_INTERVAL = int(os.getenv("SEAT_HOLD_SWEEP_INTERVAL", 60))
+    SEAT_HOLD_SWEEP_BATCH_SIZE = int(os.getenv("SEAT_HOLD_SWEEP_BATCH_SIZE", 1000))
+
+    # Rows fetched per round trip by the server-side cursors of the admin exports
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+    # Default avatars catalog, cached on disk and refreshed from Cloudinary after the TTL
+    AVATAR_CATALOG_TTL = int(os.getenv("AVATAR_CATALOG_TTL", 24 * 60 * 60))
+    AVATAR_CATALOG_CACHE_PATH = os.getenv(
+        "AVATAR_CATALOG_CACHE_PATH",
+        str(Path(__file__).parent.parent / "instance" / "default_avatars.json"),
+    )
 
 
 class CloudinaryConfig:
@@ -62,13 +159,21 @@ CLIENT_CONFIG_PATH = Path(__file__).parent.parent / "client_secret.json"
 
 
 class GoogleAuthConfig:
-    CLIENT_CONFIG = json.loads(CLIENT_CONFIG_PATH.read_text())
     SCOPES = [
         "https://www.googleapis.com/auth/userinfo.profile",
         "https://www.googleapis.com/auth/userinfo.email",
         "openid",
     ]
-    REDIRECT_URI = CLIENT_CONFIG["web"]["redirect_uris"][0]
+
+    # client_secret.json is only read when the Google login is used
+    @staticmethod
+    @cache
+    def client_config():
+        return json.loads(CLIENT_CONFIG_PATH.read_text())
+
+    @classmethod
+    def redirect_uri(cls):
+        return cls.client_config()["web"]["redirect_uris"][0]
 
 
 class VNPayConfig:
@@ -0,0 +1,127 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_, select, text
+
+
+def encode_cursor(*values):
+    """
+    Opaque cursor of the sort key of the last row of a page, datetimes are sent in ISO
+    format
+    """
+    values = [
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ]
+    data = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor, *types):
+    """
+    Return the values of a cursor converted with types (datetime or a callable).\n
+    Raise ValueError if the cursor was not made by encode_cursor() with as many values
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return tuple(
+            datetime.fromisoformat(value) if convert is datetime else convert(value)
+            for convert, value in zip(types, values)
+        )
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def rows_after(columns, values, descending=False):
+    """
+    Filter of the rows after (values) in the order of (columns), written as
+    a > x OR (a = x AND b > y) so that the index of the columns is used on every database
+    """
+    clauses = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        beyond = column < value if descending else column > value
+        equals = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equals, beyond))
+    return or_(*clauses)
+
+
+class KeysetPagination:
+    """
+    Page of a query in the order of columns, after or before the cursor of a row,
+    without COUNT nor OFFSET: a deep page costs the same as the first one. It has the
+    items/has_prev/has_next of a Pagination, and prev_cursor/next_cursor instead of the
+    page numbers.\n
+    Raise ValueError if a cursor is invalid
+    """
+
+    is_keyset = True
+
+    def __init__(
+        self, query, columns, per_page, after=None, before=None, descending=False
+    ):
+        types = [column.type.python_type for column in columns]
+        if before:
+            # Read backwards from the cursor, then put the page back in order
+            values = decode_cursor(before, *types)
+            rows = (
+                query.filter(rows_after(columns, values, not descending))
+                .order_by(*(c.asc() if descending else c.desc() for c in columns))
+                .limit(per_page + 1)
+                .all()
+            )
+            self.items = rows[:per_page][::-1]
+            has_prev, has_next = len(rows) > per_page, True
+        else:
+            if after:
+                values = decode_cursor(after, *types)
+                query = query.filter(rows_after(columns, values, descending))
+            rows = (
+                query.order_by(*(c.desc() if descending else c.asc() for c in columns))
+                .limit(per_page + 1)
+                .all()
+            )
+            self.items = rows[:per_page]
+            has_prev, has_next = bool(after), len(rows) > per_page
+        self.per_page = per_page
+        self.has_prev = has_prev and bool(self.items)
+        self.has_next = has_next and bool(self.items)
+        self.prev_cursor = (
+            self._cursor(self.items[0], columns) if self.has_prev else None
+        )
+        self.next_cursor = (
+            self._cursor(self.items[-1], columns) if self.has_next else None
+        )
+
+    @staticmethod
+    def _cursor(row, columns):
+        return encode_cursor(*(getattr(row, column.key) for column in columns))
+
+
+def approximate_count(session, table):
+    """
+    Number of rows of a table from the statistics of MySQL or PostgreSQL, without
+    scanning it. Other databases (and tables never analyzed) are counted exactly
+    """
+    dialect = session.get_bind().dialect.name
+    count = None
+    if dialect in ("mysql", "mariadb"):
+        count = session.execute(
+            text(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+            ),
+            {"name": table.name},
+        ).scalar()
+    elif dialect == "postgresql":
+        count = session.execute(
+            text(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:name AS regclass)"
+            ),
+            {"name": table.name},
+        ).scalar()
+    if count is None or count < 0:
+        count = session.execute(select(func.count()).select_from(table)).scalar()
+    return count
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long the checkouts wait for a connection (including
+    the time to open a new one) and how many of them timed out
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_times = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get() calls itself when it has to retry
+        if getattr(self._local, "waiting", False):
+            return super()._do_get()
+        self._local.waiting = True
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise
+        finally:
+            self._local.waiting = False
+            with self._lock:
+                self.checkouts += 1
+                self.wait_times.append(time.perf_counter() - start)
+
+    def wait_stats(self):
+        with self._lock:
+            wait_times = sorted(self.wait_times)
+            checkouts, timeouts = self.checkouts, self.timeouts
+        return {
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_ms_p50": percentile_ms(wait_times, 50),
+            "wait_ms_p99": percentile_ms(wait_times, 99),
+            "wait_ms_max": percentile_ms(wait_times, 100),
+        }
+
+
+def engine_options(config):
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* settings. In-memory SQLite keeps the
+    StaticPool set by Flask-SQLAlchemy
+    """
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    if url.drivername.startswith("sqlite") and url.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            # QueuePool counts the overflow from -size
+            overflow=max(0, pool.overflow()),
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update(pool.wait_stats())
+    return stats
+
+
+def percentile_ms(values, p):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))] * 1000, 2)
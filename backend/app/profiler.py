@@ -0,0 +1,180 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime as dt
+
+from flask import g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|:\w+)"
+# The expanded IN lists have a placeholder per value
+_IN_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    """
+    The statement without its values, the same for every run of a query
+    """
+    statement = _LITERAL.sub("?", statement)
+    statement = _IN_LIST.sub("(?)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+def find_origin(frame):
+    """
+    Return "template:line (file:line)" of the template and the app code that ran the
+    statement, from the frame of the SQLAlchemy event up
+    """
+    template = code = None
+    while frame is not None and template is None:
+        jinja_template = frame.f_globals.get("__jinja_template__")
+        if jinja_template is not None:
+            line = jinja_template.get_corresponding_lineno(frame.f_lineno)
+            template = f"{jinja_template.name}:{line}"
+        elif code is None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(APP_DIR) and filename != __file__:
+                code = f"{os.path.relpath(filename, APP_DIR)}:{frame.f_lineno}"
+        frame = frame.f_back
+    if template and code:
+        return f"{template} ({code})"
+    return template or code
+
+
+class RequestProfile:
+    """
+    The statements run by a request, by fingerprint
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = {}
+
+    def add(self, statement, elapsed, origin):
+        self.queries += 1
+        self.db_time += elapsed
+        key = fingerprint(statement)
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = {
+                "count": 0,
+                "time": 0.0,
+                "origins": Counter(),
+            }
+        stats["count"] += 1
+        stats["time"] += elapsed
+        stats["origins"][origin] += 1
+
+    def n_plus_one(self, threshold):
+        """
+        The SELECTs run at least threshold times, the most repeated first
+        """
+        patterns = [
+            {
+                "statement": statement[:500],
+                "count": stats["count"],
+                "db_ms": round(stats["time"] * 1000, 2),
+                "origins": [
+                    {"origin": origin, "count": count}
+                    for origin, count in stats["origins"].most_common(5)
+                ],
+            }
+            for statement, stats in self.statements.items()
+            if stats["count"] >= threshold and statement.upper().startswith("SELECT")
+        ]
+        return sorted(patterns, key=lambda pattern: -pattern["count"])
+
+
+class QueryProfiler:
+    """
+    Opt-in (SQL_PROFILER_ENABLED) profiling of the SQL of each request: count, DB time
+    and the SELECTs repeated at least SQL_PROFILER_N_PLUS_ONE times, likely lazy loads
+    in a loop, with the template and code line running them. The results are sent in the
+    X-Query-Count, X-Query-Time-Ms and X-N-Plus-One headers, logged as JSON and the last
+    SQL_PROFILER_HISTORY requests of the worker are kept for /_debug/requests
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.history = deque()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = True
+        self.threshold = app.config["SQL_PROFILER_N_PLUS_ONE"]
+        self.history = deque(maxlen=app.config["SQL_PROFILER_HISTORY"])
+        self.logger = app.logger
+        event.listen(Engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self.after_cursor_execute)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def before_request(self):
+        # The debug page would fill the history with itself
+        if request.endpoint not in ("static", "main.debug_requests"):
+            g.sql_profile = RequestProfile()
+
+    def before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, *args
+    ):
+        if context is not None:
+            context.profiler_start = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, *args):
+        start = getattr(context, "profiler_start", None)
+        if start is None or not has_request_context():
+            return
+        elapsed = time.perf_counter() - start
+        profile = g.get("sql_profile")
+        if profile is not None:
+            profile.add(statement, elapsed, find_origin(sys._getframe(1)))
+
+    def after_request(self, response):
+        profile = g.pop("sql_profile", None)
+        if profile is None:
+            return response
+        n_plus_one = profile.n_plus_one(self.threshold)
+        summary = {
+            "at": dt.now().isoformat(timespec="seconds"),
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "user_id": current_user.get_id(),
+            "duration_ms": round((time.perf_counter() - profile.start) * 1000, 2),
+            "queries": profile.queries,
+            "db_ms": round(profile.db_time * 1000, 2),
+            "n_plus_one": n_plus_one,
+        }
+        response.headers["X-Query-Count"] = str(profile.queries)
+        response.headers["X-Query-Time-Ms"] = str(summary["db_ms"])
+        response.headers["X-N-Plus-One"] = str(len(n_plus_one))
+        if n_plus_one:
+            self.logger.warning("sql_profile %s", json.dumps(summary))
+        else:
+            self.logger.info("sql_profile %s", json.dumps(summary))
+        with self._lock:
+            self.history.append(summary)
+        return response
+
+    def recent(self):
+        """
+        The profiled requests of this worker, the last one first
+        """
+        with self._lock:
+            return list(reversed(self.history))
+
+
+query_profiler = QueryProfiler()
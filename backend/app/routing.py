@@ -0,0 +1,196 @@
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, has_request_context
+from flask import session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+_replica_reads = ContextVar("replica_reads", default=False)
+_primary_only = ContextVar("primary_only", default=False)
+
+
+class RoutingSession(Session):
+    """
+    db.session that sends the SELECTs of the @replica_reads DAO calls to a replica bind
+    (SQLALCHEMY_BINDS keys starting with "replica"). Everything else goes to the primary:\n
+    - writes, flushes and SELECT ... FOR UPDATE\n
+    - every statement after the session wrote something (read your writes)\n
+    - the requests marked @use_primary, and the requests of a user who wrote in the last
+      DB_REPLICA_STICKY_SECONDS\n
+    - replicas lagging more than DB_REPLICA_MAX_LAG seconds
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not _replica_reads.get():
+            return engine
+        if self._reads_from_replica(engine, clause):
+            replica = replica_router.pick(self)
+            if replica is not None:
+                return replica
+        replica_router.count("primary")
+        return engine
+
+    def _reads_from_replica(self, engine, clause):
+        if _primary_only.get() or self._flushing or self.info.get("wrote"):
+            return False
+        if not isinstance(clause, sa.Select) or clause._for_update_arg is not None:
+            return False
+        if engine is not self._db.engines.get(None):
+            return False
+        return not is_sticky_to_primary()
+
+
+class ReplicaRouter:
+    """
+    Pick a healthy replica engine for a session and keep it for the session, the lag of
+    each replica is checked every DB_REPLICA_LAG_CHECK_INTERVAL seconds
+    """
+
+    def __init__(self):
+        self._lags = {}
+        self._lock = threading.Lock()
+        # Statements of the @replica_reads calls by destination
+        self.routed = {"primary": 0, "replica": 0, "lagging": 0}
+
+    def pick(self, session):
+        engines = session._db.engines
+        key = session.info.get("replica")
+        if key is None:
+            keys = [k for k in engines if k and k.startswith("replica")]
+            if not keys:
+                return None
+            healthy = [k for k in keys if self.is_healthy(k, engines[k])]
+            if not healthy:
+                self.count("lagging")
+                return None
+            key = session.info["replica"] = random.choice(healthy)
+        self.count("replica")
+        return engines[key]
+
+    def is_healthy(self, key, engine):
+        now = time.monotonic()
+        checked_at, lag = self._lags.get(key, (None, None))
+        interval = current_app.config["DB_REPLICA_LAG_CHECK_INTERVAL"]
+        if checked_at is None or now - checked_at >= interval:
+            lag = replica_lag(engine)
+            with self._lock:
+                self._lags[key] = (now, lag)
+        return lag is not None and lag <= current_app.config["DB_REPLICA_MAX_LAG"]
+
+    def count(self, name):
+        with self._lock:
+            self.routed[name] += 1
+
+    def stats(self):
+        return {
+            **self.routed,
+            "lags": {key: lag for key, (_, lag) in self._lags.items()},
+        }
+
+
+def replica_lag(engine):
+    """
+    Seconds the replica is behind its primary, None if it can't be reached or isn't
+    replicating anymore
+    """
+    try:
+        with engine.connect() as connection:
+            dialect = engine.dialect.name
+            if dialect == "mysql":
+                row = connection.execute(text("SHOW REPLICA STATUS")).mappings().first()
+                # Not set up as a replica (e.g. the primary itself in development)
+                if row is None:
+                    return 0
+                return row["Seconds_Behind_Source"]
+            if dialect == "postgresql":
+                return connection.execute(
+                    text(
+                        "SELECT CASE WHEN pg_is_in_recovery() THEN COALESCE("
+                        "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                        " ELSE 0 END"
+                    )
+                ).scalar()
+            connection.execute(text("SELECT 1"))
+            return 0
+    except sa.exc.SQLAlchemyError as e:
+        print(f"Replica lag check failed: {e}")
+        return None
+
+
+def replica_reads(f):
+    """
+    Let the SELECTs of the function read from a replica
+    """
+
+    @wraps(f)
+    def decorated_func(*args, **kwargs):
+        token = _replica_reads.set(True)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+
+    return decorated_func
+
+
+def use_primary(f):
+    """
+    Per request override: every statement of the view goes to the primary
+    """
+
+    @wraps(f)
+    def decorated_func(*args, **kwargs):
+        token = _primary_only.set(True)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            _primary_only.reset(token)
+
+    return decorated_func
+
+
+def has_replicas(db):
+    return any(key and key.startswith("replica") for key in db.engines)
+
+
+def is_sticky_to_primary():
+    if not has_request_context():
+        return False
+    return flask_session.get("db_primary_until", 0) > time.time()
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def after_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def do_orm_execute(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def after_commit(session):
+    # The user reads from the primary until the replicas have caught up with the write
+    if (
+        session.info.pop("wrote", False)
+        and has_request_context()
+        and has_replicas(session._db)
+    ):
+        sticky = current_app.config["DB_REPLICA_STICKY_SECONDS"]
+        flask_session["db_primary_until"] = time.time() + sticky
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def after_rollback(session):
+    session.info.pop("wrote", None)
+
+
+replica_router = ReplicaRouter()
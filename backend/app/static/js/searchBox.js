@@ -20,19 +20,11 @@ document.addEventListener("DOMContentLoaded", function () {
     
     departAirportSelect.addEventListener("change", function () {
       let departAirportID = departAirportSelect.value;
-      let arrivalAirports = getArrivalAirportsByDepartureAirport(
-        routes,
-        departAirportID
-      );
-      
 
+    // Connecting flights are searched when there is no direct route,
+    // so only the departure airport itself can't be chosen
     Array.from(arrivalAirportSelect.options).forEach((option) => {
-      if (arrivalAirports.includes(parseInt(option.value))) {
-        option.disabled = false;
-      }
-      else {
-        option.disabled = true;
-      }
+      option.disabled = option.value == departAirportID;
     });
     $('#arrival_airport').selectpicker('refresh');
     });
@@ -58,5 +50,10 @@ document.addEventListener("DOMContentLoaded", function () {
     if (departDate) {
       departureDate.value = departDate;
     }
+
+    const flexibleDays = urlParams.get("flexible_days");
+    if (flexibleDays) {
+      document.getElementById("flexible_days").value = flexibleDays;
+    }
   });
 });
@@ -0,0 +1,78 @@
+"""
+Requests per second of the /api reference endpoints through the test client:
+- rebuild: the cached response is invalidated before each request (a query and a
+  to_dict() per row, like before the cache)
+- warm: the JSON bytes are served from the worker cache
+- 304: the client sends the ETag of its copy and gets an empty Not Modified
+
+The warm and 304 requests must not run any query.
+
+Usage: python benchmarks/api_cache.py [requests]
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app import create_app, db
+from app.blueprints.flights.cache import api_response_cache
+from benchmarks.utils import count_queries
+
+ENDPOINTS = ["airlines", "seatclasses", "airports", "routes", "countries", "aircrafts"]
+
+
+def measure(client, engine, path, requests, headers=None, before=None):
+    """
+    Return the requests/sec, the queries of the last request and its response
+    """
+    start = time.perf_counter()
+    for _ in range(requests):
+        if before:
+            before()
+        with count_queries(engine) as counter:
+            response = client.get(path, headers=headers)
+    return requests / (time.perf_counter() - start), counter["queries"], response
+
+
+def benchmark(requests=500):
+    app = create_app({"ADMIN_ENABLED": False})
+    with app.app_context():
+        engine = db.engine
+    client = app.test_client()
+    failed = False
+    for name in ENDPOINTS:
+        path = f"/api/{name}"
+        rebuild, rebuild_queries, _ = measure(
+            client,
+            engine,
+            path,
+            requests,
+            before=lambda: api_response_cache.invalidate(name),
+        )
+        warm, warm_queries, response = measure(client, engine, path, requests)
+        size = len(response.data)
+        etag = response.headers["ETag"]
+        not_modified, not_modified_queries, response = measure(
+            client, engine, path, requests, headers={"If-None-Match": etag}
+        )
+        ok = (
+            response.status_code == 304
+            and warm_queries == 0
+            and not_modified_queries == 0
+        )
+        failed = failed or not ok
+        print(
+            f"{'ok  ' if ok else 'FAIL'} {path:<17} "
+            f"rebuild={rebuild:8.0f} req/s ({rebuild_queries}q) "
+            f"warm={warm:8.0f} req/s ({warm_queries}q) "
+            f"304={not_modified:8.0f} req/s ({not_modified_queries}q) "
+            f"size={size / 1024:.1f}KiB"
+        )
+    if failed:
+        sys.exit("A warm endpoint ran a query or did not answer 304 to its ETag")
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
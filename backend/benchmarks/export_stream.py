@@ -0,0 +1,50 @@
+"""
+Memory and latency of the streaming admin exports: each export of the app database is
+written in each available format and the time to the first chunk, the total time, the
+size and the peak Python memory (tracemalloc) are printed. The peak memory must stay
+flat whatever the number of rows.
+
+Usage: python benchmarks/export_stream.py [export]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app import app
+from app.blueprints.admin import exports
+
+
+def measure(export, format):
+    write, _ = exports.WRITERS[format]
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_chunk = None
+    size = 0
+    for chunk in write(export, export.rows({})):
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - start
+        size += len(chunk)
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first_chunk, total, size, peak
+
+
+def benchmark(name=None):
+    with app.test_request_context():
+        for export in [exports.EXPORTS[name]] if name else exports.EXPORTS.values():
+            for format in exports.get_formats():
+                first_chunk, total, size, peak = measure(export, format)
+                print(
+                    f"{export.name:<13} {format:<8} first chunk={first_chunk * 1000:7.1f}ms "
+                    f"total={total * 1000:8.1f}ms size={size / 1024:9.1f}KiB "
+                    f"peak memory={peak / 1024:8.1f}KiB"
+                )
+
+
+if __name__ == "__main__":
+    benchmark(*sys.argv[1:2])
@@ -0,0 +1,138 @@
+"""
+Compare the flight search latency (p50/p99) on a large schedule:
+- before: load route.flights, then filter on DATE(depart_time)
+- range: indexed (route_id, depart_time) range predicate
+- index: in-memory (route, date) search index
+
+The script seeds `flights` benchmark flights on its own airports/routes and
+deletes them at the end. Run it against a scratch database.
+
+Usage: python benchmarks/flight_search.py [flights] [routes] [days]
+"""
+
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from datetime import datetime, timedelta
+from sqlalchemy import insert, delete
+from app import app, db
+from app.blueprints.flights import dao as flight_dao
+from app.blueprints.flights.models import Country, Airport, Route, Flight
+from benchmarks.utils import run
+
+PAGE_SIZE = 20
+
+
+def seed_benchmark_flights(flights, routes, days):
+    country = Country(name="Benchmark", code="BNCH")
+    airports = [
+        Airport(name=f"Benchmark {i}", code=f"B{i:03d}", country=country)
+        for i in range(routes + 1)
+    ]
+    bench_routes = [
+        Route(depart_airport=airports[i], arrive_airport=airports[i + 1])
+        for i in range(routes)
+    ]
+    db.session.add_all(bench_routes)
+    db.session.commit()
+
+    route_ids = [route.id for route in bench_routes]
+    start = datetime.combine(datetime.now().date(), datetime.min.time())
+    rows = []
+    for i in range(flights):
+        depart_time = start + timedelta(minutes=random.randrange(days * 24 * 60))
+        rows.append(
+            {
+                "route_id": route_ids[i % routes],
+                "code": f"BN{i}",
+                "depart_time": depart_time,
+                "arrive_time": depart_time + timedelta(hours=2),
+            }
+        )
+        if len(rows) == 10000:
+            db.session.execute(insert(Flight), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(Flight), rows)
+    db.session.commit()
+    return country, route_ids, start
+
+
+def delete_benchmark_flights(country, route_ids):
+    db.session.execute(delete(Flight).where(Flight.route_id.in_(route_ids)))
+    db.session.execute(delete(Route).where(Route.id.in_(route_ids)))
+    db.session.execute(delete(Airport).where(Airport.country_id == country.id))
+    db.session.execute(delete(Country).where(Country.id == country.id))
+    db.session.commit()
+
+
+def legacy_get_flights_by_route_and_date(route_id, depart_date, page=1):
+    route = flight_dao.get_route_by_id(route_id)
+    if not route or not route.flights:
+        return None
+    return Flight.query.filter(
+        Flight.route_id == route_id,
+        db.func.date(Flight.depart_time) == depart_date,
+    ).paginate(page=page, per_page=PAGE_SIZE)
+
+
+def benchmark(flights=1_000_000, routes=50, days=365):
+    with app.test_request_context():
+        for index in Flight.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+        print(f"Seeding {flights} flights on {routes} routes over {days} days...")
+        country, route_ids, start = seed_benchmark_flights(flights, routes, days)
+
+        searches = [
+            (
+                random.choice(route_ids),
+                (start + timedelta(days=random.randrange(days))).date(),
+            )
+            for _ in range(100)
+        ]
+
+        def random_search():
+            return random.choice(searches)
+
+        def before():
+            legacy_get_flights_by_route_and_date(*random_search()).items
+
+        def range_query():
+            flight_dao.get_flights_by_route_and_date(*random_search()).items
+
+        def search_index():
+            app.config["FLIGHT_SEARCH_INDEX"] = True
+            flight_dao.get_flights_by_route_and_date(*random_search()).items
+            app.config["FLIGHT_SEARCH_INDEX"] = False
+
+        # Warm the in-memory index up with the searched (route, date)
+        for route_id, depart_date in searches:
+            flight_dao.flight_search_index.get(route_id, depart_date)
+
+        try:
+            run("before (route.flights + DATE())", before, db.engine, db.session, 20)
+            run(
+                "after (range on route_id, depart_time)",
+                range_query,
+                db.engine,
+                db.session,
+                500,
+            )
+            run(
+                "after (in-memory search index)",
+                search_index,
+                db.engine,
+                db.session,
+                500,
+            )
+        finally:
+            flight_dao.flight_search_index.invalidate()
+            delete_benchmark_flights(country, route_ids)
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
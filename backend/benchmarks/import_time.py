@@ -0,0 +1,62 @@
+"""
+Import-time profile of the app: run `python -X importtime` in a fresh process for each
+target and print the total time and the packages (self time of all their modules) that
+cost the most.
+- app: `import app` (config and extensions only)
+- cli: create_app({"ADMIN_ENABLED": False}), what the seeders and CLI tools load
+- web: create_app(), what a web worker loads
+
+Usage: python benchmarks/import_time.py [target] [top]
+"""
+
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+TARGETS = {
+    "app": "import app",
+    "cli": "from app import create_app; create_app({'ADMIN_ENABLED': False})",
+    "web": "from app import create_app; create_app()",
+}
+
+
+def profile(code):
+    """
+    Return the total import time and {package: self time of its modules} in ms
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr[-2000:])
+
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, _, name = line[len("import time:") :].split("|")
+        if not self_time.strip().isdigit():
+            continue
+        # The app modules are listed by blueprint
+        parts = name.strip().split(".")
+        package = ".".join(parts[:3]) if parts[0] == "app" else parts[0]
+        packages[package] = packages.get(package, 0) + int(self_time) / 1000
+    return sum(packages.values()), packages
+
+
+def benchmark(target=None, top=10):
+    for name in [target] if target else TARGETS:
+        total, packages = profile(TARGETS[name])
+        print(f"{name:<5} {total:8.0f}ms  {TARGETS[name]}")
+        slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+        for package, ms in slowest[:top]:
+            print(f"      {ms:8.0f}ms  {package}")
+
+
+if __name__ == "__main__":
+    benchmark(*sys.argv[1:2], *map(int, sys.argv[2:3]))
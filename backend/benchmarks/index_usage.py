@@ -0,0 +1,244 @@
+"""
+Index usage of the hot DAO queries: each query is run on a scratch database created
+from the models, its SQL is captured and explained, and a full scan of a large table
+(flights, seats, reservations, payments...) fails the check. A scan means the query
+shape changed or its index is missing, declare it in the __table_args__ of the model
+and run `flask main create-indexes` on the existing databases.
+
+The plans are read with EXPLAIN QUERY PLAN on SQLite, EXPLAIN (FORMAT JSON) with
+enable_seqscan off on PostgreSQL and EXPLAIN on MySQL. The tables of the database
+given in the url are dropped and created again.
+
+Usage: python benchmarks/index_usage.py [database_url]
+"""
+
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime as dt
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import event
+
+from app import get_app, db
+
+# The database has to be configured before the blueprints create the app
+if __name__ == "__main__":
+    get_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": (
+                sys.argv[1]
+                if len(sys.argv) > 1
+                else "sqlite:///" + os.path.join(tempfile.mkdtemp(), "indexes.db")
+            ),
+            "SQLALCHEMY_BINDS": {},
+            "ADMIN_ENABLED": False,
+        }
+    )
+
+from app import create_app
+from app.keyset import KeysetPagination
+from app.blueprints.bookings import dao as booking_dao
+from app.blueprints.bookings.models import Payment, Reservation
+from app.blueprints.flights import api
+from app.blueprints.flights import dao as flight_dao
+from app.blueprints.flights.models import Aircraft, Flight, FlightSeat, Regulation
+from benchmarks.page_queries import REGULATIONS, add_rows
+
+# Tables growing with the traffic, the small reference tables may be scanned
+LARGE_TABLES = {
+    "flights",
+    "flight_seats",
+    "flight_seat_counts",
+    "reservations",
+    "payments",
+    "stopovers",
+    "aircraft_seats",
+    "revenue_rollups",
+    "revenue_rollup_flights",
+    "outbox_mails",
+}
+
+
+def hot_queries(fixture):
+    """
+    The DAO calls to check: {name: function}
+    """
+    flight = fixture["flight"]
+    seat = fixture["seat"]
+    reservation = fixture["reservation"]
+    customer_id = fixture["customer_id"]
+
+    def seat_is_sold():
+        db.session.expire_all()
+        return db.session.get(FlightSeat, seat.id).is_sold()
+
+    def aircraft_is_available():
+        db.session.expire_all()
+        aircraft = db.session.get(Aircraft, flight.aircraft_id)
+        return aircraft.is_available(flight.depart_time, flight.arrive_time)
+
+    def refresh_seat_status():
+        booking_dao.refresh_seat_status([seat.id])
+        db.session.rollback()
+
+    def aircraft_seats():
+        db.session.expire_all()
+        return db.session.get(Aircraft, flight.aircraft_id).seats
+
+    return {
+        "flights of a route and day": lambda: flight_dao.get_flights_by_route_and_date(
+            flight.route_id, flight.depart_time.date()
+        ),
+        "api flights page": lambda: flight_dao.get_flights_after(
+            cursor=(flight.depart_time, flight.id), fields=set(api.FIELDS)
+        ),
+        "api flights of an aircraft": lambda: flight_dao.get_flights_after(
+            aircraft_id=flight.aircraft_id
+        ),
+        "seat classes availability": lambda: flight_dao.get_seat_classes_availability(
+            [flight.id]
+        ),
+        "seat map": lambda: flight_dao.get_seat_map(flight.id),
+        "cheapest fares": lambda: flight_dao.load_cheapest_fares(
+            flight.route_id, flight.depart_time.date(), flight.depart_time.date()
+        ),
+        "seat status refresh": refresh_seat_status,
+        "seats of an aircraft": aircraft_seats,
+        "aircraft is available": aircraft_is_available,
+        "flight seat is sold": seat_is_sold,
+        "own bookings": lambda: booking_dao.get_reservations_of_owned_user(customer_id),
+        "bookings created for others": lambda: booking_dao.get_reservations_created_for_others(
+            customer_id
+        ),
+        "reservation of a user": lambda: booking_dao.get_reservation_by_id_and_user(
+            reservation.id, customer_id
+        ),
+        "ticket": lambda: booking_dao.get_ticket(reservation.id),
+        "admin payments page": lambda: KeysetPagination(
+            Payment.query, (Payment.created_at, Payment.id), 20, descending=True
+        ),
+        "admin reservations page": lambda: KeysetPagination(
+            Reservation.query,
+            (Reservation.created_at, Reservation.id),
+            20,
+            descending=True,
+        ),
+        "active seat holds": booking_dao.count_active_holds,
+        "revenue stats": lambda: flight_dao.revenue_stats_route_by_time(
+            dt.now().year, dt.now().month
+        ),
+    }
+
+
+def capture_statements(engine, func):
+    """
+    Return the (statement, parameters) of the SELECTs run by func
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        func()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def sqlite_scans(conn, statement, parameters):
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+    scans = []
+    for row in rows:
+        detail = row[-1]
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and "INDEX" not in detail:
+            scans.append(match.group(1))
+    return scans
+
+
+def postgresql_scans(conn, statement, parameters):
+    conn.exec_driver_sql("SET enable_seqscan = off")
+    plan = conn.exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + statement, parameters
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = []
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            scans.append(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return scans
+
+
+def mysql_scans(conn, statement, parameters):
+    result = conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+    return [row.table for row in result if row.type == "ALL"]
+
+
+EXPLAINERS = {
+    "sqlite": sqlite_scans,
+    "postgresql": postgresql_scans,
+    "mysql": mysql_scans,
+    "mariadb": mysql_scans,
+}
+
+
+def table_of(name, tables):
+    """
+    The table of a scanned name, the aliases of SQLAlchemy end with _<n>
+    """
+    name = re.sub(r"_\d+$", "", name)
+    return name if name in tables else None
+
+
+def benchmark():
+    app = create_app()
+    with app.app_context():
+        engine = db.engine
+        explain = EXPLAINERS[engine.dialect.name]
+        db.drop_all()
+        db.create_all()
+        with open(os.path.join(REGULATIONS, "regulations.json")) as f:
+            db.session.add_all(Regulation(**row) for row in json.load(f))
+        db.session.commit()
+        add_rows(3)
+        flight = Flight.query.first()
+        reservation = Reservation.query.first()
+        fixture = {
+            "flight": flight,
+            "seat": flight.seats[0],
+            "reservation": reservation,
+            "customer_id": reservation.owner_id,
+        }
+
+        failed = False
+        for name, func in hot_queries(fixture).items():
+            scanned = set()
+            statements = capture_statements(engine, func)
+            with engine.connect() as conn:
+                for statement, parameters in statements:
+                    for scan in explain(conn, statement, parameters):
+                        if table_of(scan, db.metadata.tables) in LARGE_TABLES:
+                            scanned.add(scan)
+            failed = failed or bool(scanned)
+            print(
+                f"{'FAIL' if scanned else 'ok  '} {name:<30} "
+                f"queries={len(statements):<3} "
+                f"{'full scan of ' + ', '.join(sorted(scanned)) if scanned else ''}"
+            )
+    if failed:
+        sys.exit("A hot query scans a large table")
+
+
+if __name__ == "__main__":
+    benchmark()
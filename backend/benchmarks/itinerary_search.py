@@ -0,0 +1,73 @@
+"""
+Latency of the connecting flights search on a synthetic timetable held in memory
+(no database needed): `airports` airports fully connected, `daily` flights per day
+spread over all routes.
+
+Usage: python benchmarks/itinerary_search.py [airports] [daily] [max_legs]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from datetime import datetime, timedelta
+from statistics import median
+from app.blueprints.flights.itineraries import Timetable
+from benchmarks.utils import percentile
+
+
+def build_timetable(airports, daily, days=3):
+    routes_from = {}
+    departures = {}
+    routes = [(a, b) for a in range(airports) for b in range(airports) if a != b]
+    for route_id, (a, b) in enumerate(routes):
+        routes_from.setdefault(a, []).append((route_id, b))
+
+    start = datetime.combine(datetime.now().date(), datetime.min.time())
+    flight_id = 0
+    for _ in range(daily * days):
+        route_id = random.randrange(len(routes))
+        depart_time = start + timedelta(minutes=random.randrange(days * 24 * 60))
+        arrive_time = depart_time + timedelta(minutes=random.randrange(45, 300))
+        departures.setdefault(route_id, []).append(
+            (depart_time, arrive_time, flight_id)
+        )
+        flight_id += 1
+    for route_departures in departures.values():
+        route_departures.sort()
+    timetable = Timetable()
+    timetable.replace(routes_from, departures)
+    return timetable, start.date()
+
+
+def benchmark(airports=30, daily=5000, max_legs=3, repeat=200):
+    timetable, depart_date = build_timetable(airports, daily)
+    timings = []
+    results = 0
+    for _ in range(repeat):
+        origin, destination = random.sample(range(airports), 2)
+        start = time.perf_counter()
+        results += len(
+            timetable.find_itineraries(
+                origin,
+                destination,
+                depart_date,
+                max_legs=max_legs,
+                min_connection=20,
+                max_connection=24 * 60,
+                max_results=500,
+            )
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{airports} airports, {daily} flights/day, up to {max_legs} legs: "
+        f"{results / repeat:.0f} itineraries/search "
+        f"p50={median(timings):.2f}ms p99={percentile(timings, 99):.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,609 @@
+"""
+Load test replaying the booking funnel: home, flight search, flight details, seat pick,
+confirmation, payment and the return from VNPay, which is played by a local stand-in
+that checks the payment request and signs its response with VNPAY_HASH_SECRET_KEY.
+Each virtual user logs in with an account of its role in the mix and runs the funnel in
+a loop until the end of the test: customers pay by card, staff sell for cash to a
+customer. The flights are searched among the bookable ones of the app database, and
+the bookings are really written to it, so run it on a test database.
+
+The app is served in-process by default (the queries are counted on its engines), by a
+local gunicorn with --gunicorn WORKERS, or at --url (the queries are then read from the
+X-Query-Count header, when the app sends it). The server must use the database of the
+app config.
+
+The throughput, the p50/p95/p99 latency and the SQL queries of each step are printed
+and saved as JSON. With --baseline, the script exits with an error if a step p95 grew
+more than --max-regression or a step runs more queries than in the baseline file.
+
+Usage: python benchmarks/load_test.py [--users 10] [--duration 60]
+                                      [--mix CUSTOMER=8,SALES_EMPLOYEE=2]
+                                      [--gunicorn WORKERS | --url URL]
+                                      [--out results.json] [--baseline results.json]
+"""
+
+import html
+import json
+import os
+import random as rd
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime as dt
+from datetime import timedelta
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+# The app is configured from the environment: no mail is sent and the payments go to
+# the stand-in, whatever the .env says
+os.environ["MAIL_SUPPRESS_SEND"] = "true"
+os.environ.setdefault("VNPAY_PAYMENT_URL", "http://vnpay.local/paymentv2/vpcpay.html")
+os.environ.setdefault("VNPAY_RETURN_URL", "/booking/payment_return")
+os.environ.setdefault("VNPAY_TMN_CODE", "LOADTEST")
+os.environ.setdefault("VNPAY_HASH_SECRET_KEY", "load-test-secret")
+
+import click
+import requests
+from sqlalchemy import event, select
+from app import create_app, db
+from benchmarks.utils import percentile
+from benchmarks.worker_boot import BACKEND_DIR, free_port
+
+app = create_app({"ADMIN_ENABLED": False})
+
+from app.blueprints.auth.models import UserRole
+from app.blueprints.bookings.vnpay import vnpay
+from app.blueprints.flights import dao as flight_dao
+from app.blueprints.flights.models import Flight, Route
+
+SEED_USERS = os.path.join(BACKEND_DIR, "seed", "data", "users.json")
+TIMEOUT = 60
+
+BOOKING_LINK = re.compile(r'href="(/booking\?[^"]+)"')
+FLIGHT_SEAT = re.compile(r'name="flight_seat_id"[^>]*value="(\d+)"')
+CSRF_TOKEN = re.compile(r'name="csrf_token"[^>]*value="([^"]*)"')
+PAYMENT_LINK = re.compile(r'href="/booking/payment/(\d+)"')
+AMOUNT = re.compile(r'name="amount"[^>]*value="([^"]*)"')
+PAYMENT_RESULTS = {
+    "PAYMENT SUCCESSFUL": "paid",
+    "SEAT ALREADY SOLD": "sold",
+    "TRANSACTION CANCELED": "declined",
+}
+
+
+class Response:
+    def __init__(self, status, location, text, queries):
+        self.status = status
+        self.location = location
+        self.text = text
+        self.queries = queries
+
+
+class InProcessClient:
+    """
+    The Flask test client, the queries of a request are the statements run by its
+    thread on the app engines
+    """
+
+    counter = threading.local()
+    listening = False
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        if not InProcessClient.listening:
+            with app.app_context():
+                engines = list(db.engines.values())
+            for engine in engines:
+                event.listen(engine, "before_cursor_execute", self.count_query)
+            InProcessClient.listening = True
+
+    @classmethod
+    def count_query(cls, *args, **kwargs):
+        cls.counter.queries = getattr(cls.counter, "queries", 0) + 1
+
+    def request(self, method, path, data=None, headers=None):
+        self.counter.queries = 0
+        response = self.client.open(path, method=method, data=data, headers=headers)
+        return Response(
+            response.status_code,
+            response.headers.get("Location"),
+            response.get_data(as_text=True),
+            self.counter.queries,
+        )
+
+
+class HttpClient:
+    """
+    A requests session on a running server, the queries are read from the
+    X-Query-Count header if the app sends it
+    """
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None, headers=None):
+        response = self.session.request(
+            method,
+            self.url + path,
+            data=data,
+            headers=headers,
+            allow_redirects=False,
+            timeout=TIMEOUT,
+        )
+        queries = response.headers.get("X-Query-Count")
+        return Response(
+            response.status_code,
+            response.headers.get("Location"),
+            response.text,
+            int(queries) if queries is not None else None,
+        )
+
+
+class VNPayStandIn:
+    """
+    Plays the VNPay payment page: checks the signature of the payment request and
+    answers with a signed return URL, paid or declined ("24", canceled by the user)
+    """
+
+    def __init__(self, secret_key, decline_rate):
+        self.secret_key = secret_key
+        self.decline_rate = decline_rate
+
+    def sign(self, params):
+        vnp = vnpay()
+        vnp.requestData = params
+        return vnp.get_payment_url("", self.secret_key).rsplit("vnp_SecureHash=", 1)[1]
+
+    def pay(self, payment_url, rng):
+        """
+        Return the path of the return URL, or None if the request isn't signed right
+        """
+        params = dict(parse_qsl(urlsplit(payment_url).query))
+        secure_hash = params.pop("vnp_SecureHash", None)
+        if secure_hash != self.sign(params):
+            return None
+        declined = rng.random() < self.decline_rate
+        response = {
+            "vnp_Amount": params["vnp_Amount"],
+            "vnp_BankCode": params.get("vnp_BankCode", "NCB"),
+            "vnp_CardType": "ATM",
+            "vnp_OrderInfo": params["vnp_OrderInfo"],
+            "vnp_PayDate": dt.now().strftime("%Y%m%d%H%M%S"),
+            "vnp_ResponseCode": "24" if declined else "00",
+            "vnp_TmnCode": params["vnp_TmnCode"],
+            "vnp_TransactionNo": str(rng.randrange(10**7, 10**8)),
+            "vnp_TransactionStatus": "02" if declined else "00",
+            "vnp_TxnRef": params["vnp_TxnRef"],
+        }
+        response["vnp_SecureHash"] = self.sign(response)
+        return_url = urlsplit(params["vnp_ReturnUrl"])
+        return f"{return_url.path}?{urlencode(response)}"
+
+
+class Stats:
+    """
+    Latency and queries of each step, and the outcome of each funnel, of all the users
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = Counter()
+        self.outcomes = Counter()
+
+    def add(self, step, elapsed, response, ok):
+        with self.lock:
+            self.timings[step].append(elapsed * 1000)
+            if response is not None and response.queries is not None:
+                self.queries[step].append(response.queries)
+            if not ok:
+                self.errors[step] += 1
+
+    def add_outcome(self, outcome):
+        with self.lock:
+            self.outcomes[outcome] += 1
+
+    def summary(self, duration):
+        steps = {}
+        for step, timings in self.timings.items():
+            queries = self.queries[step]
+            steps[step] = {
+                "requests": len(timings),
+                "errors": self.errors[step],
+                "throughput": round(len(timings) / duration, 2),
+                "p50_ms": round(percentile(timings, 50), 2),
+                "p95_ms": round(percentile(timings, 95), 2),
+                "p99_ms": round(percentile(timings, 99), 2),
+                "queries_p50": percentile(queries, 50) if queries else None,
+                "queries_max": max(queries) if queries else None,
+            }
+        return steps
+
+
+class StepFailed(Exception):
+    pass
+
+
+class VirtualUser:
+    """
+    Logs in with its account then runs the booking funnel in a loop
+    """
+
+    def __init__(self, client, account, customers, searches, stand_in, stats, rng):
+        self.client = client
+        self.account = account
+        self.customers = customers
+        self.searches = searches
+        self.stand_in = stand_in
+        self.stats = stats
+        self.rng = rng
+        self.is_customer = account["role"] == UserRole.CUSTOMER.value
+
+    def step(self, name, method, path, data=None, headers=None, expect=(200,)):
+        start = time.perf_counter()
+        try:
+            response = self.client.request(method, path, data, headers)
+        except Exception:
+            self.stats.add(name, time.perf_counter() - start, None, False)
+            raise StepFailed(name)
+        ok = response.status in expect
+        self.stats.add(name, time.perf_counter() - start, response, ok)
+        if not ok:
+            raise StepFailed(name)
+        return response
+
+    def login(self):
+        page = self.step("login_form", "GET", "/login")
+        response = self.step(
+            "login",
+            "POST",
+            "/login",
+            data={
+                "email": self.account["email"],
+                "password": self.account["password"],
+                "csrf_token": csrf_token(page.text),
+            },
+            expect=(302,),
+        )
+        if urlsplit(response.location).path == "/login":
+            raise StepFailed("login")
+
+    def run_funnel(self):
+        """
+        Return the outcome of a booking attempt
+        """
+        self.step("home", "GET", "/")
+        depart, arrive, date = self.rng.choice(self.searches)
+        search = self.step(
+            "search",
+            "GET",
+            "/search/flight?"
+            + urlencode(
+                {
+                    "departure_airport": depart,
+                    "arrival_airport": arrive,
+                    "departure_date": date,
+                }
+            ),
+        )
+        links = [html.unescape(link) for link in BOOKING_LINK.findall(search.text)]
+        if not links:
+            return "no_flights"
+        booking_path = self.rng.choice(links)
+        flight_id = dict(parse_qsl(urlsplit(booking_path).query))["flight"]
+        self.step("flight", "GET", f"/flight/{flight_id}")
+
+        booking = self.step("booking", "GET", booking_path)
+        seats = FLIGHT_SEAT.findall(booking.text)
+        if not seats:
+            return "full"
+        if self.is_customer:
+            citizen_id = self.account["citizen_id"]
+        else:
+            citizen_id = self.rng.choice(self.customers)["citizen_id"]
+        response = self.step(
+            "booking_submit",
+            "POST",
+            booking_path,
+            data={
+                "citizen_id": citizen_id,
+                "flight_seat_id": self.rng.choice(seats),
+                "csrf_token": csrf_token(booking.text),
+            },
+            headers={"Referer": booking_path},
+            expect=(302,),
+        )
+        if urlsplit(response.location).path != "/booking/confirmation":
+            return "rejected"
+
+        self.step("confirmation", "GET", "/booking/confirmation")
+        response = self.step(
+            "confirm",
+            "POST",
+            "/booking/confirmation",
+            data={"payment_type": "card" if self.is_customer else "cash"},
+            expect=(302,),
+        )
+        if urlsplit(response.location).path != "/manage-bookings/own":
+            return "sold"
+        if not self.is_customer:
+            return "paid_cash"
+
+        bookings = self.step("own_bookings", "GET", "/manage-bookings/own")
+        reservations = PAYMENT_LINK.findall(bookings.text)
+        if not reservations:
+            return "expired"
+        payment_path = f"/booking/payment/{reservations[0]}"
+        payment = self.step("payment", "GET", payment_path)
+        response = self.step(
+            "payment_submit",
+            "POST",
+            payment_path,
+            data={
+                "order_id": reservations[0],
+                "order_type": "billpayment",
+                "amount": AMOUNT.search(payment.text).group(1),
+                "order_desc": f"Payment of reservation {reservations[0]}",
+                "bank_code": "",
+                "language": "vn",
+            },
+            expect=(302,),
+        )
+        return_path = self.stand_in.pay(response.location, self.rng)
+        if return_path is None:
+            return "bad_signature"
+        result = self.step("payment_return", "GET", return_path)
+        for text, outcome in PAYMENT_RESULTS.items():
+            if text in result.text:
+                return outcome
+        return "payment_error"
+
+    def run(self, deadline, think_time):
+        try:
+            self.login()
+        except StepFailed:
+            self.stats.add_outcome("login_failed")
+            return
+        while time.perf_counter() < deadline:
+            try:
+                outcome = self.run_funnel()
+            except StepFailed as e:
+                outcome = f"failed_{e}"
+            self.stats.add_outcome(outcome)
+            if think_time:
+                time.sleep(self.rng.uniform(0, think_time))
+
+
+def csrf_token(page):
+    match = CSRF_TOKEN.search(page)
+    return match.group(1) if match else ""
+
+
+def parse_mix(mix):
+    """
+    "CUSTOMER=8,SALES_EMPLOYEE=2" -> {UserRole.CUSTOMER: 8, UserRole.SALES_EMPLOYEE: 2}
+    """
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        try:
+            weights[UserRole[name.strip().upper()]] = float(weight or 1)
+        except (KeyError, ValueError):
+            raise click.BadParameter(f"{part} isn't ROLE=WEIGHT", param_hint="--mix")
+    return weights
+
+
+def pick_accounts(accounts, mix, users, rng):
+    """
+    Give each virtual user a role drawn from the mix and an account of the role
+    """
+    by_role = defaultdict(list)
+    for account in accounts:
+        by_role[UserRole(account["role"])].append(account)
+    missing = [role.name for role in mix if not by_role[role]]
+    if missing:
+        raise click.UsageError(f"No account with the role {', '.join(missing)}")
+    roles = rng.choices(list(mix), weights=list(mix.values()), k=users)
+    used = Counter()
+    picked = []
+    for role in roles:
+        picked.append(by_role[role][used[role] % len(by_role[role])])
+        used[role] += 1
+    return picked
+
+
+def get_searches(days, limit=500):
+    """
+    (departure airport, arrival airport, date) of the flights everyone can still book in
+    the next days
+    """
+    with app.app_context():
+        lead_time = max(
+            flight_dao.get_customer_min_booking_time(),
+            flight_dao.get_staff_min_booking_time(),
+        )
+        start = dt.now() + timedelta(minutes=lead_time + 60)
+        rows = db.session.execute(
+            select(Route.depart_airport_id, Route.arrive_airport_id, Flight.depart_time)
+            .join(Flight, Flight.route_id == Route.id)
+            .where(Flight.depart_time.between(start, start + timedelta(days=days)))
+            .order_by(Flight.depart_time)
+            .limit(limit)
+        ).all()
+    return sorted(
+        {(depart, arrive, when.strftime("%Y-%m-%d")) for depart, arrive, when in rows}
+    )
+
+
+def start_gunicorn(workers, app_path):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [
+            "gunicorn",
+            "--workers",
+            str(workers),
+            "--threads",
+            "4",
+            "--bind",
+            f"127.0.0.1:{port}",
+            app_path,
+        ],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    start = time.perf_counter()
+    while time.perf_counter() - start < TIMEOUT:
+        if server.poll() is not None:
+            sys.exit(server.stderr.read().decode()[-2000:])
+        try:
+            requests.get(url + "/static/images/iconLight.svg", timeout=1)
+            return server, url
+        except requests.RequestException:
+            time.sleep(0.05)
+    server.terminate()
+    sys.exit(f"gunicorn didn't answer in {TIMEOUT}s")
+
+
+def compare(steps, baseline, max_regression):
+    """
+    Return the regressions of the steps against the steps of the baseline
+    """
+    regressions = []
+    for step, stats in steps.items():
+        base = baseline.get(step)
+        if not base:
+            continue
+        if stats["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{step}: p95 {base['p95_ms']}ms -> {stats['p95_ms']}ms")
+        if (
+            stats["queries_max"] is not None
+            and base["queries_max"] is not None
+            and stats["queries_max"] > base["queries_max"]
+        ):
+            regressions.append(
+                f"{step}: queries {base['queries_max']} -> {stats['queries_max']}"
+            )
+    return regressions
+
+
+def print_summary(steps, outcomes):
+    for step, s in steps.items():
+        print(
+            f"{step:<15} requests={s['requests']:<6} errors={s['errors']:<4} "
+            f"{s['throughput']:7.2f} req/s p50={s['p50_ms']:8.2f}ms "
+            f"p95={s['p95_ms']:8.2f}ms p99={s['p99_ms']:8.2f}ms "
+            f"queries p50={s['queries_p50']} max={s['queries_max']}"
+        )
+    print("outcomes:", ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items())))
+
+
+@click.command()
+@click.option("--users", type=int, default=10, show_default=True)
+@click.option("--duration", type=float, default=60, show_default=True, help="Seconds")
+@click.option("--mix", default="CUSTOMER=8,SALES_EMPLOYEE=2", show_default=True)
+@click.option("--accounts", default=SEED_USERS, show_default=True)
+@click.option("--url", default=None, help="Test a running server")
+@click.option("--gunicorn", "workers", type=int, default=None, help="Workers")
+@click.option("--gunicorn-app", "app_path", default="run:app", show_default=True)
+@click.option("--think-time", type=float, default=0, help="Max seconds between funnels")
+@click.option("--decline-rate", type=float, default=0.1, show_default=True)
+@click.option("--days", type=int, default=30, show_default=True)
+@click.option("--out", default="load_test_results.json", show_default=True)
+@click.option("--baseline", default=None, help="Results file to compare with")
+@click.option("--max-regression", type=float, default=0.2, show_default=True)
+@click.option("--seed", type=int, default=0, show_default=True)
+def load_test(
+    users,
+    duration,
+    mix,
+    accounts,
+    url,
+    workers,
+    app_path,
+    think_time,
+    decline_rate,
+    days,
+    out,
+    baseline,
+    max_regression,
+    seed,
+):
+    rng = rd.Random(seed)
+    weights = parse_mix(mix)
+    with open(accounts) as f:
+        accounts = json.load(f)
+    customers = [a for a in accounts if a["role"] == UserRole.CUSTOMER.value]
+    picked = pick_accounts(accounts, weights, users, rng)
+    searches = get_searches(days)
+    if not searches:
+        raise click.UsageError(f"No bookable flight in the next {days} days")
+
+    server = None
+    if workers:
+        server, url = start_gunicorn(workers, app_path)
+    mode = f"gunicorn x{workers}" if workers else url or "in-process"
+    stand_in = VNPayStandIn(app.config["VNPAY_HASH_SECRET_KEY"], decline_rate)
+    stats = Stats()
+    try:
+        start = time.perf_counter()
+        deadline = start + duration
+        threads = [
+            threading.Thread(
+                target=VirtualUser(
+                    HttpClient(url) if url else InProcessClient(app),
+                    account,
+                    customers,
+                    searches,
+                    stand_in,
+                    stats,
+                    rd.Random(rng.random()),
+                ).run,
+                args=(deadline, think_time),
+            )
+            for account in picked
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    steps = stats.summary(elapsed)
+    results = {
+        "run_at": dt.now().isoformat(timespec="seconds"),
+        "mode": mode,
+        "users": users,
+        "mix": {role.name: weight for role, weight in weights.items()},
+        "duration_s": round(elapsed, 2),
+        "steps": steps,
+        "outcomes": dict(stats.outcomes),
+    }
+    print(f"{mode}, {users} users, {elapsed:.1f}s")
+    print_summary(steps, stats.outcomes)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(steps, json.load(f)["steps"], max_regression)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(f"{len(regressions)} regressions against {baseline}")
+
+
+if __name__ == "__main__":
+    load_test()
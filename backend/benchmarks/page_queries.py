@@ -0,0 +1,194 @@
+"""
+Query budgets of the pages rendering flights and reservations: each page is rendered
+for a customer on a generated SQLite database, once with few rows and once with many,
+and must run at most its budget of queries, the same number for both. A growing count
+means a relationship of the templates is lazy loaded per row again, add it to the
+loader profile of the page (flights/loaders.py, bookings/dao.py).
+Exits with an error if a page is over its budget.
+
+Usage: python benchmarks/page_queries.py [rows]
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime as dt
+from datetime import timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app import get_app, db
+from benchmarks.utils import count_queries
+
+# The database has to be configured before the blueprints create the app
+if __name__ == "__main__":
+    get_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///"
+            + os.path.join(tempfile.mkdtemp(), "pages.db"),
+            "ADMIN_ENABLED": False,
+            "WTF_CSRF_ENABLED": False,
+        }
+    )
+
+from app import create_app
+from app.blueprints.auth.models import User, UserRole
+from app.blueprints.bookings import dao as booking_dao
+from app.blueprints.bookings.models import Payment, PaymentStatus, Reservation
+from app.blueprints.flights.models import (
+    Aircraft,
+    AircraftSeat,
+    Airline,
+    Airport,
+    Country,
+    Flight,
+    FlightSeat,
+    Regulation,
+    Route,
+    SeatClass,
+    Stopover,
+)
+
+REGULATIONS = os.path.join(os.path.dirname(__file__), "..", "seed", "data")
+# Queries of each page, the user is loaded once, the regulations and the choices of the
+# airport selects are cached
+PAGE_QUERY_BUDGETS = {
+    # user, flight, stopovers, seats left
+    "flight_details": 4,
+    # user, route, flights, stopovers, count, seats left
+    "search": 6,
+    # user, reservation and its payment (access check), reservation, stopovers (the
+    # seat status is a column of the seat)
+    "ticket": 5,
+    # user, reservations, stopovers (keyset page, no count)
+    "own_bookings": 3,
+    # user
+    "home": 1,
+    # flights, stopovers, seats left (the user is not loaded)
+    "api_flights": 3,
+}
+
+
+def add_rows(rows):
+    """
+    Add a route of `rows` flights on the same day, each with a stopover, and a paid
+    reservation of each flight for the customer. Return the pages and the customer id
+    """
+    country = Country(name=f"Country {rows}", code=f"C{rows}")
+    airports = [
+        Airport(name=f"Airport {rows}{i}", code=f"A{rows}{i}") for i in range(3)
+    ]
+    country.airports.extend(airports)
+    airline = Airline(name=f"Airline {rows}")
+    aircraft = Aircraft(name=f"Aircraft {rows}", airline=airline)
+    seat_class = SeatClass.query.first() or SeatClass(name="Economy")
+    aircraft.seats.extend(
+        AircraftSeat(seat_class=seat_class, seat_name=f"E{i:03d}") for i in range(4)
+    )
+    route = Route(depart_airport=airports[0], arrive_airport=airports[1])
+    customer = User(
+        email=f"customer{rows}@pages.local",
+        password="-",
+        citizen_id=f"{rows:012d}",
+        first_name="Customer",
+        last_name=str(rows),
+        phone="+84000000000",
+        role=UserRole.CUSTOMER,
+    )
+    db.session.add_all([country, airline, aircraft, route, customer])
+
+    depart_time = (dt.now() + timedelta(days=30)).replace(hour=6, minute=0)
+    reservations = []
+    for i in range(rows):
+        flight = Flight(
+            route=route,
+            aircraft=aircraft,
+            code=f"PQ{rows}-{i}",
+            depart_time=depart_time + timedelta(minutes=5 * i),
+            arrive_time=depart_time + timedelta(hours=3, minutes=5 * i),
+        )
+        flight.stopovers.append(
+            Stopover(
+                airport=airports[2],
+                order=1,
+                arrival_time=flight.depart_time + timedelta(hours=1),
+                departure_time=flight.depart_time + timedelta(hours=2),
+            )
+        )
+        flight.seats.extend(
+            FlightSeat(aircraft_seat=seat, price=1000000, currency="VND")
+            for seat in aircraft.seats
+        )
+        reservation = Reservation(
+            owner=customer, author=customer, flight_seat=flight.seats[0]
+        )
+        reservation.payment = Payment(amount=1000000, status=PaymentStatus.SUCCESS)
+        db.session.add(flight)
+        reservations.append(reservation)
+    db.session.commit()
+    # The rows are added directly, without the booking writes updating the seat status
+    booking_dao.repair_seat_status()
+
+    pages = {
+        "flight_details": f"/flight/{flight.id}",
+        "search": f"/search/flight?departure_airport={airports[0].id}"
+        f"&arrival_airport={airports[1].id}"
+        f"&departure_date={depart_time.strftime('%Y-%m-%d')}",
+        "ticket": f"/show-ticket/{reservations[0].id}",
+        "own_bookings": "/manage-bookings/own",
+        "home": "/",
+        "api_flights": f"/api/v1/flights?route={route.id}&limit={rows}",
+    }
+    return pages, customer.id
+
+
+def page_queries(app, pages, user_id):
+    """
+    Return the queries run by each page, after a first request warming the caches
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+    counts = {}
+    for name, path in pages.items():
+        client.get(path)
+        with app.app_context():
+            engine = db.engine
+        with count_queries(engine) as counter:
+            response = client.get(path)
+        if response.status_code != 200:
+            sys.exit(f"{name}: {path} answered {response.status_code}")
+        counts[name] = counter["queries"]
+    return counts
+
+
+def benchmark(rows=20):
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        with open(os.path.join(REGULATIONS, "regulations.json")) as f:
+            db.session.add_all(Regulation(**row) for row in json.load(f))
+        db.session.commit()
+        few_pages = add_rows(2)
+        many_pages = add_rows(rows)
+    # Outside of the setup context, each request has its own session and user
+    few = page_queries(app, *few_pages)
+    many = page_queries(app, *many_pages)
+
+    failed = False
+    for name, budget in PAGE_QUERY_BUDGETS.items():
+        ok = many[name] <= budget and few[name] == many[name]
+        failed = failed or not ok
+        print(
+            f"{'ok  ' if ok else 'FAIL'} {name:<15} queries with 2 rows={few[name]:<4} "
+            f"with {rows} rows={many[name]:<4} budget={budget}"
+        )
+    if failed:
+        sys.exit("A page is over its query budget")
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
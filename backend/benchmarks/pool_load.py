@@ -0,0 +1,76 @@
+"""
+Throughput of the connection pool by pool size: `threads` threads check out a connection,
+run a seat availability query and keep the connection for `hold_ms` (the rest of the
+request) for `seconds` seconds. Each pool size gets its own engine on the app database
+(a local MySQL/Postgres or SQLite), with no overflow so the pool size is the limit.
+
+Usage: python benchmarks/pool_load.py [threads] [seconds] [hold_ms] [pool sizes...]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import median
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine, text
+from app import app
+from app.pool import InstrumentedQueuePool, pool_stats
+from benchmarks.utils import percentile
+
+QUERY = text(
+    "SELECT COUNT(*) FROM flight_seats "
+    "JOIN reservations ON reservations.flight_seat_id = flight_seats.id "
+    "WHERE flight_seats.flight_id = :flight_id"
+)
+
+
+def load(engine, threads, seconds, hold_ms):
+    deadline = time.perf_counter() + seconds
+
+    def worker(i):
+        latencies = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            with engine.connect() as connection:
+                connection.execute(QUERY, {"flight_id": i % 100 + 1}).scalar()
+                time.sleep(hold_ms / 1000)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = [
+            ms for result in executor.map(worker, range(threads)) for ms in result
+        ]
+    return latencies
+
+
+def benchmark(threads=32, seconds=5, hold_ms=5, *pool_sizes):
+    pool_sizes = pool_sizes or (1, 2, 5, 10, 20, 40)
+    uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    print(f"{threads} threads, {seconds}s per pool size, connections held {hold_ms}ms")
+    for pool_size in pool_sizes:
+        engine = create_engine(
+            uri,
+            poolclass=InstrumentedQueuePool,
+            pool_size=pool_size,
+            max_overflow=0,
+            pool_timeout=60,
+            pool_pre_ping=app.config["DB_POOL_PRE_PING"],
+        )
+        try:
+            latencies = load(engine, threads, seconds, hold_ms)
+            stats = pool_stats(engine)
+        finally:
+            engine.dispose()
+        print(
+            f"pool_size={pool_size:<4} {len(latencies) / seconds:8.0f} req/s "
+            f"p50={median(latencies):7.2f}ms p99={percentile(latencies, 99):7.2f}ms "
+            f"wait p50={stats['wait_ms_p50']}ms p99={stats['wait_ms_p99']}ms"
+        )
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,133 @@
+"""
+Check of the read-replica routing on two local databases, a primary and a replica (two
+SQLite files by default, or the URIs given, e.g. two local Postgres databases). A
+country is only written to the primary so each check can see which database answered,
+and the statements of each engine are counted.
+Exits with an error if a check fails.
+
+Usage: python benchmarks/replica_routing.py [primary_uri replica_uri]
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from flask import session
+from app import get_app, db
+from app.routing import replica_reads, use_primary, replica_router
+from benchmarks.utils import count_queries
+
+# The databases have to be configured before the blueprints create the app
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+    PRIMARY_URI, REPLICA_URI = sys.argv[1:3] or [
+        f"sqlite:///{os.path.join(directory, name)}"
+        for name in ("primary.db", "replica.db")
+    ]
+    get_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": PRIMARY_URI,
+            "SQLALCHEMY_BINDS": {"replica_1": REPLICA_URI},
+            "ADMIN_ENABLED": False,
+            "DB_REPLICA_LAG_CHECK_INTERVAL": 0,
+        }
+    )
+
+from app.blueprints.flights import dao as flight_dao
+from app.blueprints.flights.models import Country
+
+CODE = "ZZ"
+
+
+@replica_reads
+def find_country():
+    return Country.query.filter_by(code=CODE).first()
+
+
+@replica_reads
+def add_and_find_country():
+    db.session.add(Country(name="Replica check", code="ZY"))
+    db.session.flush()
+    return find_country(), Country.query.filter_by(code="ZY").first()
+
+
+def routed(func):
+    """
+    Run func in a new session, return its result and the statements run on each engine
+    """
+    db.session.remove()
+    primary, replica = db.engines[None], db.engines["replica_1"]
+    with count_queries(primary) as on_primary, count_queries(replica) as on_replica:
+        result = func()
+    db.session.rollback()
+    return result, on_primary["queries"], on_replica["queries"]
+
+
+def check(name, ok, on_primary, on_replica):
+    print(
+        f"{'ok  ' if ok else 'FAIL'} {name:<45} primary={on_primary} replica={on_replica}"
+    )
+    return ok
+
+
+def benchmark():
+    app = get_app()
+    results = []
+    with app.test_request_context():
+        db.drop_all(bind_key=[None])
+        db.create_all(bind_key=[None])
+        db.metadata.drop_all(db.engines["replica_1"])
+        db.metadata.create_all(db.engines["replica_1"])
+        db.session.add(Country(name="Primary only", code=CODE))
+        db.session.commit()
+        # Reset the stickiness of the setup write
+        session.clear()
+
+        country, *counts = routed(find_country)
+        results.append(
+            check("@replica_reads reads the replica", country is None, *counts)
+        )
+
+        _, *counts = routed(lambda: flight_dao.get_seat_classes_availability([1]))
+        results.append(check("flight_dao reads the replica", counts[0] == 0, *counts))
+
+        country, *counts = routed(lambda: Country.query.filter_by(code=CODE).first())
+        results.append(
+            check("other reads use the primary", country is not None, *counts)
+        )
+
+        (country, added), *counts = routed(add_and_find_country)
+        results.append(
+            check("reads after a write use the primary", added is not None, *counts)
+        )
+
+        country, *counts = routed(use_primary(find_country))
+        results.append(check("@use_primary overrides", country is not None, *counts))
+
+        app.config["DB_REPLICA_MAX_LAG"] = -1
+        country, *counts = routed(find_country)
+        results.append(
+            check("lagging replica is skipped", country is not None, *counts)
+        )
+        app.config["DB_REPLICA_MAX_LAG"] = 5
+
+    # A user who just wrote reads from the primary for DB_REPLICA_STICKY_SECONDS
+    with app.test_request_context():
+        db.session.remove()
+        db.session.add(Country(name="Sticky check", code="ZX"))
+        db.session.commit()
+        country, *counts = routed(find_country)
+        results.append(
+            check("user who wrote sticks to the primary", country is not None, *counts)
+        )
+        db.session.remove()
+
+    print(replica_router.stats())
+    if not all(results):
+        sys.exit("Replica routing check failed")
+
+
+if __name__ == "__main__":
+    benchmark()
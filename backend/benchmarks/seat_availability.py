@@ -0,0 +1,62 @@
+"""
+Compare the remaining seats computation of a search page (20 flights):
+- before: iterate flight.seats and call FlightSeat.is_sold() per seat
+- after: one read of the seat counts of the page
+
+Usage: python benchmarks/seat_availability.py [page_size]
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import func
+from app import app, db
+from app.blueprints.flights import dao as flight_dao
+from app.blueprints.flights.models import Flight, FlightSeat, SeatClass
+from benchmarks.utils import run
+
+
+def legacy_remaining_seatclasses_and_info(flight):
+    seat_classes_prices = {}
+    for seat in flight.seats:
+        seat_class_id = seat.aircraft_seat.seat_class_id
+        if seat_class_id not in seat_classes_prices:
+            seat_classes_prices[seat_class_id] = {
+                "class_name": SeatClass.query.get(seat_class_id).name,
+                "price": seat.price,
+                "currency": seat.currency,
+                "remaining": 0,
+            }
+        if not seat.is_sold():
+            seat_classes_prices[seat_class_id]["remaining"] += 1
+    return seat_classes_prices
+
+
+def benchmark(page_size=20):
+    with app.app_context():
+        # Take the flights with the most seats
+        flight_ids = [
+            flight_id
+            for flight_id, in db.session.query(FlightSeat.flight_id)
+            .group_by(FlightSeat.flight_id)
+            .order_by(func.count(FlightSeat.id).desc())
+            .limit(page_size)
+        ]
+
+        def before():
+            for flight in Flight.query.filter(Flight.id.in_(flight_ids)):
+                legacy_remaining_seatclasses_and_info(flight)
+
+        def after():
+            Flight.query.filter(Flight.id.in_(flight_ids)).all()
+            flight_dao.get_seat_classes_availability(flight_ids)
+
+        print(f"Remaining seats of {len(flight_ids)} flights")
+        run("before (per-seat is_sold)", before, db.engine, db.session)
+        run("after (seat counts)", after, db.engine, db.session)
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,134 @@
+"""
+Stress the atomic seat claim: `claims` unpaid reservations of different users on the
+same flight seat are paid at the same time from `claims` threads. Exactly one
+payment must win, and paying the winning reservation again (a reload of the VNPay
+return URL) must return its payment without adding another one. The
+users/reservations created by the script are deleted at the end.
+
+Usage: python benchmarks/seat_claim.py [claims] [flight_seat_id]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import insert, delete, select, func
+from app import app, db
+from app.blueprints.auth.models import User, UserRole
+from app.blueprints.bookings import dao as booking_dao
+from app.blueprints.bookings.models import Reservation, Payment, PaymentStatus
+from app.blueprints.flights.models import FlightSeat, SeatStatus
+
+
+def create_claimers(claims, flight_seat_id):
+    emails = [f"seat-claim-{i}@benchmark.local" for i in range(claims)]
+    db.session.execute(
+        insert(User),
+        [
+            {
+                "email": email,
+                "password": "x",
+                "citizen_id": f"SC{i:010d}",
+                "first_name": "Seat",
+                "last_name": f"Claimer {i}",
+                "phone": "0",
+                "role": UserRole.CUSTOMER,
+            }
+            for i, email in enumerate(emails)
+        ],
+    )
+    user_ids = db.session.scalars(select(User.id).where(User.email.in_(emails))).all()
+    db.session.execute(
+        insert(Reservation),
+        [
+            {
+                "owner_id": user_id,
+                "author_id": user_id,
+                "flight_seat_id": flight_seat_id,
+            }
+            for user_id in user_ids
+        ],
+    )
+    db.session.commit()
+    reservation_ids = db.session.scalars(
+        select(Reservation.id).where(Reservation.owner_id.in_(user_ids))
+    ).all()
+    return user_ids, reservation_ids
+
+
+def delete_claimers(user_ids, reservation_ids, flight_seat_id):
+    db.session.execute(
+        delete(Payment).where(Payment.reservation_id.in_(reservation_ids))
+    )
+    db.session.execute(delete(Reservation).where(Reservation.id.in_(reservation_ids)))
+    db.session.execute(delete(User).where(User.id.in_(user_ids)))
+    # The seat is available again
+    booking_dao.refresh_seat_status([flight_seat_id])
+    db.session.commit()
+
+
+def benchmark(claims=200, flight_seat_id=None):
+    with app.app_context():
+        if flight_seat_id is None:
+            # Take a seat that isn't sold nor held
+            flight_seat_id = db.session.scalar(
+                select(FlightSeat.id)
+                .where(FlightSeat.status == SeatStatus.AVAILABLE)
+                .limit(1)
+            )
+        user_ids, reservation_ids = create_claimers(claims, flight_seat_id)
+
+    barrier = Barrier(claims)
+
+    def claim(reservation_id):
+        with app.app_context():
+            barrier.wait()
+            try:
+                payment, created = booking_dao.add_payment(
+                    reservation_id, 1, status=PaymentStatus.SUCCESS
+                )
+                return payment.id if created else None
+            except Exception:
+                db.session.rollback()
+                return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=claims) as executor:
+        payment_ids = dict(zip(reservation_ids, executor.map(claim, reservation_ids)))
+    elapsed = (time.perf_counter() - start) * 1000
+    winners = [id for id, payment_id in payment_ids.items() if payment_id]
+
+    with app.app_context():
+        replayed = None
+        if len(winners) == 1:
+            replay, created = booking_dao.add_payment(
+                winners[0], 1, status=PaymentStatus.SUCCESS
+            )
+            replayed = replay.id if replay and not created else None
+        payments = db.session.scalar(
+            select(func.count(Payment.id)).where(
+                Payment.reservation_id.in_(reservation_ids),
+                Payment.status == PaymentStatus.SUCCESS,
+            )
+        )
+        delete_claimers(user_ids, reservation_ids, flight_seat_id)
+
+    print(
+        f"{claims} concurrent claims of flight seat {flight_seat_id}: "
+        f"{len(winners)} winner(s) in {elapsed:.0f}ms"
+    )
+    if len(winners) != 1:
+        sys.exit(f"Expected exactly 1 winner, got {len(winners)}")
+    if replayed != payment_ids[winners[0]] or payments != 1:
+        sys.exit(
+            f"Paying the winner again returned payment {replayed} instead of "
+            f"{payment_ids[winners[0]]}, {payments} successful payments"
+        )
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,54 @@
+"""
+Query budget of the seat-pick component: loading the seat map of a flight and
+rendering it must stay under MAX_QUERIES whatever the number of seats.
+
+Usage: python benchmarks/seat_map.py [flight_id]
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from flask import render_template_string
+from sqlalchemy import func
+from app import app, db
+from app.blueprints.flights import dao as flight_dao
+from app.blueprints.flights.models import FlightSeat
+from benchmarks.utils import run
+
+# seats with their status
+MAX_QUERIES = 1
+
+SEAT_PICK_TEMPLATE = """
+{% from "bookings/components/seat_pick.html" import render_seat_pick %}
+{{ render_seat_pick(flight_dao.get_seat_map(flight_id)) }}
+"""
+
+
+def benchmark(flight_id=None):
+    with app.test_request_context():
+        if flight_id is None:
+            # Take the flight with the most seats
+            flight_id = (
+                db.session.query(FlightSeat.flight_id)
+                .group_by(FlightSeat.flight_id)
+                .order_by(func.count(FlightSeat.id).desc())
+                .limit(1)
+                .scalar()
+            )
+
+        def render_seat_map():
+            render_template_string(
+                SEAT_PICK_TEMPLATE, flight_dao=flight_dao, flight_id=flight_id
+            )
+
+        print(f"Seat map of flight {flight_id}")
+        result = run("render seat map", render_seat_map, db.engine, db.session)
+
+    if result["queries"] > MAX_QUERIES:
+        sys.exit(f"Seat map used {result['queries']} queries (max {MAX_QUERIES})")
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,48 @@
+import time
+from contextlib import contextmanager
+from statistics import median
+
+from sqlalchemy import event
+
+
+@contextmanager
+def count_queries(engine):
+    """
+    Count the SQL statements executed on the engine inside the block
+    """
+    counter = {"queries": 0}
+
+    def before_cursor_execute(*args, **kwargs):
+        counter["queries"] += 1
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def run(name, func, engine, session, repeat=10):
+    """
+    Run func `repeat` times with a clean session and print its query count and latency
+    """
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        session.expire_all()
+        with count_queries(engine) as counter:
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = counter["queries"]
+    print(
+        f"{name:<40} queries={queries:<6} "
+        f"p50={median(timings):8.2f}ms p99={percentile(timings, 99):8.2f}ms"
+    )
+    return {"queries": queries, "timings": timings}
@@ -0,0 +1,69 @@
+"""
+Startup-latency budget of a gunicorn worker: start `gunicorn run:app` with one worker and
+time it until it serves its first request (a static file, so no database is needed).
+The median of `runs` boots must stay under WORKER_BOOT_BUDGET_MS, the script exits
+with an error otherwise.
+
+Usage: python benchmarks/worker_boot.py [runs]
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from statistics import median
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
+WORKER_BOOT_BUDGET_MS = int(os.getenv("WORKER_BOOT_BUDGET_MS", 2000))
+TIMEOUT = 60
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def boot_worker():
+    """
+    Return the ms between the start of gunicorn and the first response
+    """
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/static/images/iconLight.svg"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        ["gunicorn", "--workers", "1", "--bind", f"127.0.0.1:{port}", "run:app"],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        while time.perf_counter() - start < TIMEOUT:
+            if server.poll() is not None:
+                sys.exit(server.stderr.read().decode()[-2000:])
+            try:
+                urllib.request.urlopen(url, timeout=1).read()
+                return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.01)
+        sys.exit(f"The worker didn't answer in {TIMEOUT}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def benchmark(runs=5):
+    timings = [boot_worker() for _ in range(runs)]
+    boot = median(timings)
+    print(
+        f"gunicorn worker boot: p50={boot:.0f}ms max={max(timings):.0f}ms "
+        f"(budget {WORKER_BOOT_BUDGET_MS}ms)"
+    )
+    if boot > WORKER_BOOT_BUDGET_MS:
+        sys.exit(f"Worker boot took {boot:.0f}ms (max {WORKER_BOOT_BUDGET_MS}ms)")
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,372 @@
+"""
+Bulk-load the seed data (or a synthetic dataset from seed/synthetic.py) into a new
+database. Loads the same tables as seed.py, but:
+- the JSON arrays are parsed incrementally, a batch of rows at a time
+- the rows are inserted with Core executemany (session.execute(insert(Table), rows)),
+  or COPY FROM STDIN on PostgreSQL and LOAD DATA LOCAL INFILE on MySQL
+- the user passwords are hashed in a process pool
+
+Usage: python seed/bulk.py [--data DIR] [--method auto|insert|load] [--batch-size N]
+                           [--workers N] [--bcrypt-rounds N] [--airport-limit N]
+"""
+
+import csv
+import io
+import json
+import os
+import random as rd
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime as dt
+from enum import Enum
+from itertools import islice
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import bcrypt as bcrypt_lib
+import click
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.pool import NullPool
+from app import create_app, db
+
+# The seeder doesn't serve the admin pages
+app = create_app({"ADMIN_ENABLED": False})
+
+from app.blueprints.auth.avatars import avatar_catalog
+from app.blueprints.bookings import dao as booking_dao
+from app.blueprints.auth.models import User
+from app.blueprints.auth.models import UserRole
+from app.blueprints.flights.models import Route
+from app.blueprints.flights.models import Airport
+from app.blueprints.flights.models import Country
+from app.blueprints.flights.models import Flight
+from app.blueprints.flights.models import Airline
+from app.blueprints.flights.models import Aircraft
+from app.blueprints.flights.models import AircraftSeat
+from app.blueprints.flights.models import FlightSeat
+from app.blueprints.flights.models import SeatClass
+from app.blueprints.flights.models import Stopover
+from app.blueprints.flights.models import Regulation
+
+seed_data_path = os.path.dirname(__file__) + "/data"
+
+
+def iter_json_array(path, chunk_size=1 << 16):
+    """
+    Yield the items of the JSON array of the file one at a time, reading chunk_size
+    characters at a time so that the file is never loaded whole
+    """
+    decoder = json.JSONDecoder()
+    with open(path) as f:
+        buffer = ""
+        position = 0
+        eof = False
+
+        def fill():
+            nonlocal buffer, position, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            return not eof
+
+        def next_token():
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position < len(buffer) or not fill():
+                    return buffer[position : position + 1]
+
+        if next_token() != "[":
+            raise ValueError(f"{path} isn't a JSON array")
+        position += 1
+        while True:
+            token = next_token()
+            if token == "]":
+                return
+            if not token:
+                raise ValueError(f"{path} ends before its array")
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # A number cut by the chunk would be decoded short
+                if end == len(buffer) and not eof:
+                    raise json.JSONDecodeError("Truncated", buffer, end)
+            except json.JSONDecodeError:
+                if not fill():
+                    raise
+                continue
+            position = end
+            yield item
+
+
+def iso_datetime(value):
+    return dt.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def hash_password(args):
+    password, rounds = args
+    return bcrypt_lib.hashpw(password.encode(), bcrypt_lib.gensalt(rounds)).decode()
+
+
+def hash_passwords(users, pool, workers, rounds, batch_size):
+    """
+    Hash the passwords of each batch of users in the process pool
+    """
+    avatars = avatar_catalog.get()
+    for batch in batched(users, batch_size):
+        hashes = pool.map(
+            hash_password,
+            [(user["password"], rounds) for user in batch],
+            chunksize=max(1, len(batch) // (4 * workers)),
+        )
+        for user, password in zip(batch, hashes):
+            user["role"] = UserRole(user["role"])
+            user["password"] = password
+            user["avatar"] = user.get("avatar", None) or rd.choice(avatars)
+            yield user
+
+
+def rename(key, new_key):
+    def transform(row):
+        row[new_key] = row.pop(key)
+        return row
+
+    return transform
+
+
+def transform_flight(row):
+    row["depart_time"] = iso_datetime(row["depart_time"])
+    row["arrive_time"] = iso_datetime(row["arrive_time"])
+    return row
+
+
+def transform_stop(row):
+    row["arrival_time"] = iso_datetime(row.pop("arrive_time"))
+    row["departure_time"] = iso_datetime(row.pop("depart_time"))
+    return row
+
+
+# In the order of the foreign keys: (file, model, transform of a row)
+TABLES = [
+    ("users.json", User, None),
+    ("countries.json", Country, rename("CountryCode", "code")),
+    ("airports.json", Airport, None),
+    ("airlines.json", Airline, None),
+    ("aircrafts.json", Aircraft, rename("airline", "airline_id")),
+    ("seatclasses.json", SeatClass, None),
+    ("routes.json", Route, None),
+    ("flights.json", Flight, transform_flight),
+    ("stops.json", Stopover, transform_stop),
+    ("aircraft_seats.json", AircraftSeat, None),
+    ("flight_seats.json", FlightSeat, None),
+    ("regulations.json", Regulation, None),
+]
+
+
+def batched(rows, batch_size):
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        yield batch
+
+
+def with_defaults(table, rows):
+    """
+    Give the rows the Python side defaults of their missing columns, which COPY and
+    LOAD DATA don't apply. The ids left out are generated by the database
+    """
+    for row in rows:
+        for column in table.columns:
+            if column.key in row or column is table.autoincrement_column:
+                continue
+            default = column.default
+            if default is not None and default.is_scalar:
+                row[column.key] = default.arg
+            elif default is not None and default.is_callable:
+                row[column.key] = default.arg(None)
+            else:
+                row[column.key] = None
+        yield row
+
+
+def load_columns(table, batch):
+    return [c for c in table.columns if c.key in batch[0]]
+
+
+def insert_rows(model, rows, batch_size):
+    """
+    Core executemany, one INSERT round trip per batch
+    """
+    count = 0
+    for batch in batched(rows, batch_size):
+        db.session.execute(insert(model), batch)
+        count += len(batch)
+    return count
+
+
+def to_csv(columns, batch, dialect, null):
+    """
+    Render the batch as CSV in the database representation of the column types
+    """
+    processors = [c.type.bind_processor(dialect) for c in columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in batch:
+        values = []
+        for column, process in zip(columns, processors):
+            value = row[column.key]
+            if process is not None:
+                value = process(value)
+            if value is None:
+                value = null
+            elif isinstance(value, Enum):
+                value = value.name
+            elif isinstance(value, bool):
+                value = int(value)
+            elif isinstance(value, dt):
+                value = value.replace(tzinfo=None).isoformat(sep=" ")
+            elif dialect.name == "mysql" and isinstance(value, str):
+                value = value.replace("\\", "\\\\")
+            values.append(value)
+        writer.writerow(values)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows(model, rows, batch_size):
+    """
+    PostgreSQL COPY FROM STDIN, in the transaction of the session
+    """
+    table = model.__table__
+    cursor = db.session.connection().connection.dbapi_connection.cursor()
+    count = 0
+    for batch in batched(with_defaults(table, rows), batch_size):
+        columns = load_columns(table, batch)
+        names = ", ".join(f'"{c.name}"' for c in columns)
+        cursor.copy_expert(
+            f"COPY {table.name} ({names}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            to_csv(columns, batch, db.engine.dialect, "\\N"),
+        )
+        count += len(batch)
+    cursor.close()
+    return count
+
+
+def load_data_rows(model, rows, batch_size, engine):
+    """
+    MySQL LOAD DATA LOCAL INFILE of a temporary CSV file per batch, on a connection
+    allowed to send local files (the server needs local_infile=ON)
+    """
+    table = model.__table__
+    count = 0
+    with engine.begin() as connection:
+        connection.execute(text("SET foreign_key_checks = 0"))
+        for batch in batched(with_defaults(table, rows), batch_size):
+            columns = load_columns(table, batch)
+            names = ", ".join(f"`{c.name}`" for c in columns)
+            with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+                f.write(to_csv(columns, batch, engine.dialect, "\\N").getvalue())
+                f.flush()
+                connection.execute(
+                    text(
+                        f"LOAD DATA LOCAL INFILE :path INTO TABLE {table.name} "
+                        "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' "
+                        "OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '\\\\' "
+                        f"LINES TERMINATED BY '\\n' ({names})"
+                    ),
+                    {"path": f.name},
+                )
+            count += len(batch)
+        connection.execute(text("SET foreign_key_checks = 1"))
+    return count
+
+
+def reset_sequence(model):
+    """
+    The rows are inserted with their ids, move the PostgreSQL sequence past them
+    """
+    table = model.__table__
+    id_column = table.columns.get("id")
+    if db.engine.dialect.name != "postgresql" or id_column is None:
+        return
+    db.session.execute(
+        select(
+            func.setval(
+                func.pg_get_serial_sequence(table.name, "id"),
+                func.coalesce(func.max(id_column), 0) + 1,
+                False,
+            )
+        )
+    )
+
+
+def get_loader(method):
+    """
+    Return load(model, rows, batch_size) for the method and the database
+    """
+    dialect = db.engine.dialect.name
+    if method == "auto":
+        method = "load" if dialect in ("postgresql", "mysql") else "insert"
+    if method == "insert":
+        return insert_rows
+    if dialect == "postgresql":
+        return copy_rows
+    if dialect == "mysql":
+        engine = create_engine(
+            db.engine.url,
+            connect_args={"local_infile": True},
+            poolclass=NullPool,
+        )
+        return lambda model, rows, batch_size: load_data_rows(
+            model, rows, batch_size, engine
+        )
+    raise click.UsageError(f"{dialect} has no bulk load, use --method insert")
+
+
+@click.command()
+@click.option("--data", "data_path", default=seed_data_path, show_default=True)
+@click.option("--method", type=click.Choice(["auto", "insert", "load"]), default="auto")
+@click.option("--batch-size", type=int, default=10000, show_default=True)
+@click.option("--workers", type=int, default=os.cpu_count(), show_default=True)
+@click.option("--bcrypt-rounds", type=int, default=None, help="BCRYPT_LOG_ROUNDS")
+@click.option(
+    "--airport-limit", type=int, default=10, help="Like seed.py, 0 loads them all"
+)
+def bulk_seed(data_path, method, batch_size, workers, bcrypt_rounds, airport_limit):
+    rounds = bcrypt_rounds or app.config.get("BCRYPT_LOG_ROUNDS", 12)
+    start = time.perf_counter()
+    with app.app_context(), ProcessPoolExecutor(max_workers=workers) as pool:
+        db.drop_all()
+        db.create_all()
+        load = get_loader(method)
+        try:
+            for file, model, transform in TABLES:
+                table_start = time.perf_counter()
+                rows = iter_json_array(os.path.join(data_path, file))
+                if transform:
+                    rows = map(transform, rows)
+                if model is User:
+                    rows = hash_passwords(rows, pool, workers, rounds, batch_size)
+                if model is Airport and airport_limit:
+                    rows = islice(rows, airport_limit)
+                count = load(model, rows, batch_size)
+                reset_sequence(model)
+                db.session.commit()
+                print(
+                    f"{model.__tablename__:<15} {count:>10} rows "
+                    f"{time.perf_counter() - table_start:8.1f}s"
+                )
+            # The rows skip the booking writes maintaining the seat counts
+            _, counts = booking_dao.repair_seat_status(batch_size)
+            print(f"{'flight_seat_counts':<15} {counts:>10} rows")
+            print(f"Data seeded successfully in {time.perf_counter() - start:.1f}s.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Failed to seed data: {e}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    bulk_seed()
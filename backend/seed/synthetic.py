@@ -0,0 +1,255 @@
+"""
+Generate a synthetic dataset in the format of seed/data for the performance tests, to
+be loaded with seed/bulk.py. The volumes grow with the scale factor:
+- scale 1: 1,000 flights, ~300,000 flight seats, 1,000 customers
+- scale 100: 100,000 flights, ~30M flight seats, 100,000 customers
+The countries, airports, airlines, seat classes and regulations are copied from
+seed/data, the flights connect the first `airports` airports over the next `days` days.
+The files are written a row at a time so the memory doesn't grow with the scale.
+
+Usage: python seed/synthetic.py OUT_DIR [--scale 1] [--days 30] [--airports 10]
+                                [--seed 0]
+"""
+
+import json
+import os
+import random as rd
+import shutil
+from datetime import datetime as dt
+from datetime import timedelta
+
+import click
+
+seed_data_path = os.path.dirname(__file__) + "/data"
+
+REFERENCE_FILES = [
+    "countries.json",
+    "airports.json",
+    "airlines.json",
+    "seatclasses.json",
+    "regulations.json",
+]
+FLIGHTS_PER_SCALE = 1000
+CUSTOMERS_PER_SCALE = 1000
+FLIGHTS_PER_AIRCRAFT = 10
+# Seats per aircraft by seat class id (1 Business, 2 Economy) and their base price
+SEATS = {1: (8, 32), 2: (200, 350)}
+PRICES = {1: 3000000, 2: 1200000}
+STOPOVER_RATIO = 0.3
+
+
+def write_json_array(path, rows):
+    """
+    Write the rows as a JSON array one row at a time, return the number of rows
+    """
+    count = 0
+    with open(path, "w") as f:
+        f.write("[")
+        for row in rows:
+            f.write(",\n" if count else "\n")
+            json.dump(row, f)
+            count += 1
+        f.write("\n]\n")
+    return count
+
+
+def iso(time):
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def generate_users(customers):
+    with open(f"{seed_data_path}/users.json") as f:
+        yield from json.load(f)
+    for i in range(1, customers + 1):
+        yield {
+            "email": f"customer{i}@synthetic.local",
+            "password": f"customer{i}",
+            "role": 4,
+            "citizen_id": f"9{i:011d}",
+            "first_name": "Customer",
+            "last_name": f"Synthetic {i}",
+            "phone": f"+849{i:08d}",
+        }
+
+
+def generate_aircrafts(aircrafts, airline_ids):
+    for i in range(1, aircrafts + 1):
+        yield {"id": i, "airline": rd.choice(airline_ids), "name": f"SYNTHETIC {i}"}
+
+
+def generate_seat_layouts(aircrafts):
+    """
+    Return the seat count of each class of each aircraft, the seats of an aircraft
+    are numbered in a row so the layouts are enough to generate the flight seats
+    """
+    return [
+        {seat_class_id: rd.randint(*counts) for seat_class_id, counts in SEATS.items()}
+        for _ in range(aircrafts)
+    ]
+
+
+def generate_aircraft_seats(layouts):
+    id = 1
+    for aircraft_id, layout in enumerate(layouts, start=1):
+        number = 1
+        for seat_class_id, count in layout.items():
+            prefix = "B" if seat_class_id == 1 else "E"
+            for _ in range(count):
+                yield {
+                    "id": id,
+                    "aircraft_id": aircraft_id,
+                    "seat_class_id": seat_class_id,
+                    "seat_name": f"{prefix}{number:03d}",
+                }
+                id += 1
+                number += 1
+
+
+def generate_routes(airport_ids):
+    id = 1
+    for depart in airport_ids:
+        for arrive in airport_ids:
+            if depart != arrive:
+                yield {
+                    "id": id,
+                    "depart_airport_id": depart,
+                    "arrive_airport_id": arrive,
+                }
+                id += 1
+
+
+def generate_flights(flights, routes, aircrafts, days):
+    """
+    Yield the flights with their stopover, if any
+    """
+    today = dt.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    airport_ids = {airport for route in routes for airport in route[1:]}
+    for id in range(1, flights + 1):
+        route_id, depart_airport, arrive_airport = rd.choice(routes)
+        depart_time = today + timedelta(
+            days=rd.randint(1, days), minutes=rd.randrange(5 * 60, 23 * 60, 5)
+        )
+        duration = timedelta(minutes=rd.randrange(60, 5 * 60, 5))
+        stop = None
+        if rd.random() < STOPOVER_RATIO:
+            arrival = depart_time + duration * 0.4
+            stop = {
+                "airport_id": rd.choice(
+                    sorted(airport_ids - {depart_airport, arrive_airport})
+                ),
+                "flight_id": id,
+                "arrive_time": iso(arrival),
+                "depart_time": iso(
+                    arrival + timedelta(minutes=rd.randrange(30, 120, 5))
+                ),
+                "order": 1,
+            }
+            duration += timedelta(minutes=90)
+        flight = {
+            "id": id,
+            "route_id": route_id,
+            "depart_time": iso(depart_time),
+            "arrive_time": iso(depart_time + duration),
+            "aircraft_id": rd.randint(1, aircrafts),
+            "code": f"SY{id}",
+        }
+        yield flight, stop
+
+
+def generate_flight_seats(flights, layouts):
+    """
+    Yield the seats of the flights in their aircraft layout, the price of a flight
+    varies around the base price of the class
+    """
+    id = 1
+    first_seat = [1]
+    for layout in layouts:
+        first_seat.append(first_seat[-1] + sum(layout.values()))
+    for flight_id, aircraft_id in flights:
+        aircraft_seat_id = first_seat[aircraft_id - 1]
+        for seat_class_id, count in layouts[aircraft_id - 1].items():
+            price = round(PRICES[seat_class_id] * rd.uniform(0.7, 1.5), -3)
+            for _ in range(count):
+                yield {
+                    "id": id,
+                    "flight_id": flight_id,
+                    "aircraft_seat_id": aircraft_seat_id,
+                    "price": price,
+                    "currency": "VND",
+                }
+                id += 1
+                aircraft_seat_id += 1
+
+
+@click.command()
+@click.argument("out_dir")
+@click.option("--scale", type=float, default=1, show_default=True)
+@click.option("--days", type=int, default=30, show_default=True)
+@click.option("--airports", type=int, default=10, show_default=True)
+@click.option("--seed", type=int, default=0, show_default=True)
+def synthetic(out_dir, scale, days, airports, seed):
+    rd.seed(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    for file in REFERENCE_FILES:
+        shutil.copy(os.path.join(seed_data_path, file), out_dir)
+
+    with open(f"{seed_data_path}/airlines.json") as f:
+        airline_ids = [airline["id"] for airline in json.load(f)]
+    with open(f"{seed_data_path}/airports.json") as f:
+        airport_ids = [airport["id"] for airport in json.load(f)][:airports]
+
+    flights = int(FLIGHTS_PER_SCALE * scale)
+    aircrafts = max(1, flights // FLIGHTS_PER_AIRCRAFT)
+    layouts = generate_seat_layouts(aircrafts)
+    routes = [
+        (route["id"], route["depart_airport_id"], route["arrive_airport_id"])
+        for route in generate_routes(airport_ids)
+    ]
+
+    def path(file):
+        return os.path.join(out_dir, file)
+
+    counts = {
+        "users": write_json_array(
+            path("users.json"), generate_users(int(CUSTOMERS_PER_SCALE * scale))
+        ),
+        "aircrafts": write_json_array(
+            path("aircrafts.json"), generate_aircrafts(aircrafts, airline_ids)
+        ),
+        "aircraft_seats": write_json_array(
+            path("aircraft_seats.json"), generate_aircraft_seats(layouts)
+        ),
+        "routes": write_json_array(path("routes.json"), generate_routes(airport_ids)),
+    }
+
+    # The flights are generated once, their stops and aircrafts are kept on the side
+    stops = path("stops.json.tmp")
+    flight_aircrafts = []
+    with open(stops, "w") as stops_file:
+
+        def flights_without_stops():
+            for flight, stop in generate_flights(flights, routes, aircrafts, days):
+                flight_aircrafts.append((flight["id"], flight["aircraft_id"]))
+                if stop:
+                    stops_file.write(json.dumps(stop) + "\n")
+                yield flight
+
+        counts["flights"] = write_json_array(
+            path("flights.json"), flights_without_stops()
+        )
+    with open(stops) as stops_file:
+        counts["stops"] = write_json_array(
+            path("stops.json"), map(json.loads, stops_file)
+        )
+    os.remove(stops)
+    counts["flight_seats"] = write_json_array(
+        path("flight_seats.json"), generate_flight_seats(flight_aircrafts, layouts)
+    )
+
+    for name, count in counts.items():
+        print(f"{name:<15} {count:>10} rows")
+    print(f"Synthetic dataset written to {out_dir}")
+
+
+if __name__ == "__main__":
+    synthetic()